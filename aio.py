@@ -0,0 +1,513 @@
+import asyncio
+import atexit
+import functools
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+from email.utils import parsedate_to_datetime
+from http.cookies import SimpleCookie
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+import httpcache
+import metrics
+import ratelimit
+
+try:
+    import aiohttp
+    from yarl import URL
+except ImportError:
+    # aiohttp is optional: without it requests calls run in the loop's thread pool
+    aiohttp = None
+
+# Headers sent with every request; per-call headers are merged on top
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# The storefront hosts every run talks to; preconnect() warms a connection to each
+SITE_HOSTS = [
+    'https://www.melonbooks.co.jp/',
+    'https://ec.toranoana.jp/',
+    'https://www.dlsite.com/',
+    'https://booth.pm/',
+    'https://www.dmm.co.jp/',
+    'https://alice-books.com/',
+]
+
+# Connection pool sizes: kept-alive connections per host, and across all hosts
+POOL_PER_HOST = 10
+POOL_TOTAL = 100
+
+# Where run-to-run state (cookies, caches, catalog) is kept
+STATE_DIR = os.environ.get('SEARCHDOJIN_HOME') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '.searchdojin')
+COOKIE_FILE = os.path.join(STATE_DIR, 'cookies.json')
+CACHE_FILE = os.path.join(STATE_DIR, 'http_cache.sqlite')
+MEMO_FILE = os.path.join(STATE_DIR, 'search_memo.sqlite')
+CATALOG_FILE = os.path.join(STATE_DIR, 'catalog.sqlite')
+
+# Cookies the age gates set once the visitor says yes. They are seeded into every jar so gated pages
+# load directly; booth.py/fanza.py/google.py only redo the verification when a response shows the gate again.
+AGE_GATE_COOKIES = [
+    ('adult', 't', 'booth.pm'),
+    ('age_check_done', '1', '.dmm.co.jp'),
+]
+
+# Retry policy for transient failures (throttling, overloaded servers, timeouts, dropped connections):
+# up to MAX_RETRIES more attempts, waiting Retry-After or a jittered exponential backoff in between
+RETRY_STATUS = {429, 502, 503, 504}
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Bytes read at a time when a request streams its body (stop_when)
+STREAM_CHUNK = 16 * 1024
+
+# Requests that went to a site in this run, every retry attempt included (cache hits not counted);
+# search.py --refresh budgets these
+requests_sent = 0
+
+# Local stand-in for the storefronts (mockserver.py), e.g. 'http://127.0.0.1:8800'. When set, https://<host>/<path>
+# is sent to <MOCK_SERVER>/<host>/<path> instead; the cache, rate limits and metrics still see the real URL.
+MOCK_SERVER = os.environ.get('SEARCHDOJIN_MOCK') or None
+
+
+class TransientError(Exception):
+    """A request still failed for a transient reason after all retries.
+
+    Deliberately not a requests.RequestException, so the "no result" handlers in the site
+    modules don't swallow it; callers can tell a failed lookup from a lookup that found nothing.
+    """
+
+
+# One event loop per process, running on a background thread.
+# Sync callers (the plain search/extract functions) hand coroutines to it through run().
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+# HTTP clients, created lazily. _client is an aiohttp.ClientSession (only touched from the loop),
+# _session is the requests fallback. Both share the cookies in _cookies.
+_client = None
+_session = None
+_cookies = requests.cookies.RequestsCookieJar()
+_cookie_file = None
+
+
+def get_loop():
+    """Return the shared event loop, starting its thread on first use."""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            _loop_thread = threading.Thread(target=_loop.run_forever, name='aio-loop', daemon=True)
+            _loop_thread.start()
+    return _loop
+
+
+def run(coro):
+    """Run a coroutine on the shared loop and block until it returns.
+
+    Must not be called from the loop itself; coroutines there should await directly.
+    """
+    loop = get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError('aio.run() called from the engine loop; await the coroutine instead')
+    finished = threading.Event()
+
+    async def wrapper():
+        try:
+            return await coro
+        finally:
+            finished.set()
+
+    future = asyncio.run_coroutine_threadsafe(wrapper(), loop)
+    try:
+        return future.result()
+    except KeyboardInterrupt:
+        # Ctrl+C lands here on the main thread; cancel the coroutine on the loop too and wait until its
+        # cleanup has run, so nothing is left running when close() stops the loop at exit
+        future.cancel()
+        finished.wait(timeout=10)
+        raise
+
+
+def _add_client_cookie(name, value, domain, path):
+    # A leading dot makes it a domain cookie (sent to subdomains too), otherwise host-only
+    morsel = SimpleCookie()
+    morsel[name] = value
+    morsel[name]['path'] = path
+    if domain.startswith('.'):
+        morsel[name]['domain'] = domain
+    _client.cookie_jar.update_cookies(morsel, URL(f"https://{domain.lstrip('.')}{path}"))
+
+
+def set_cookie(name, value, domain, path='/', expires=None):
+    """Set a cookie on the shared jar so later requests to domain carry it."""
+    _cookies.set(name, value, domain=domain, path=path, expires=expires)
+    if _client is not None:
+        _add_client_cookie(name, value, domain, path)
+
+
+def has_cookie(name, domain):
+    """Return True if the shared jar holds cookie `name` for `domain`."""
+    return any(c.name == name and c.domain.lstrip('.') == domain.lstrip('.') for c in _cookies)
+
+
+def _mirror_response_cookies(r):
+    # Copy Set-Cookie values from an aiohttp response (and its redirects) into _cookies,
+    # which stays the one jar that has_cookie() and save_cookies() look at.
+    for hop in list(r.history) + [r]:
+        for name, m in hop.cookies.items():
+            domain = '.' + m['domain'].lstrip('.') if m['domain'] else hop.url.host
+            expires = None
+            if m['max-age']:
+                try:
+                    expires = int(time.time()) + int(m['max-age'])
+                except ValueError:
+                    pass
+            _cookies.set(name, m.value, domain=domain, path=m['path'] or '/', expires=expires)
+
+
+def seed_age_gate_cookies():
+    """Put the age-gate cookies into the jar unless a saved or server-set copy is already there."""
+    for name, value, domain in AGE_GATE_COOKIES:
+        if not has_cookie(name, domain):
+            set_cookie(name, value, domain)
+
+
+def load_cookies(path=None):
+    """Load cookies saved by save_cookies() into the shared jar and remember path for saving at exit.
+
+    A missing or unreadable file just starts with an empty (age-gate seeded) jar.
+    """
+    global _cookie_file
+    _cookie_file = path or COOKIE_FILE
+    try:
+        with open(_cookie_file, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = []
+    now = time.time()
+    for c in saved:
+        if c.get('expires') and c['expires'] < now:
+            continue
+        set_cookie(c['name'], c['value'], c['domain'], c.get('path') or '/', c.get('expires'))
+    seed_age_gate_cookies()
+
+
+def save_cookies(path=None):
+    """Write the shared jar to path (default: the file given to load_cookies) atomically."""
+    path = path or _cookie_file
+    if not path:
+        return
+    cookies = [{'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path, 'expires': c.expires}
+               for c in _cookies]
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(cookies, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def configure(pool_per_host=None, pool_total=None, headers=None):
+    """Tune the shared connection pools and default headers. Call before the first request."""
+    global POOL_PER_HOST, POOL_TOTAL
+    if pool_per_host:
+        POOL_PER_HOST = pool_per_host
+    if pool_total:
+        POOL_TOTAL = pool_total
+    if headers:
+        DEFAULT_HEADERS.update(headers)
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        _session.cookies = _cookies
+        # pool_connections is the number of per-host pools kept, pool_maxsize the connections in each
+        adapter = HTTPAdapter(pool_connections=max(len(SITE_HOSTS), POOL_TOTAL // POOL_PER_HOST),
+                              pool_maxsize=POOL_PER_HOST)
+        _session.mount('https://', adapter)
+        _session.mount('http://', adapter)
+    return _session
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        # unsafe=True keeps cookies for IP hosts too (local test servers)
+        connector = aiohttp.TCPConnector(limit=POOL_TOTAL, limit_per_host=POOL_PER_HOST, ttl_dns_cache=300)
+        _client = aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.CookieJar(unsafe=True))
+        for c in _cookies:
+            _add_client_cookie(c.name, c.value, c.domain, c.path)
+    return _client
+
+
+def _build_response(status, reason, headers, url, content):
+    # Build a requests.Response so callers keep using .text/.content/.raise_for_status()
+    resp = requests.Response()
+    resp.status_code = status
+    resp.reason = reason
+    resp.headers = CaseInsensitiveDict(headers)
+    resp.url = url
+    resp._content = content
+    resp.encoding = get_encoding_from_headers(resp.headers)
+    resp.truncated = False
+    return resp
+
+
+def enable_cache(path=None, max_bytes=None):
+    """Turn on the on-disk response cache for GET requests (see httpcache.py)."""
+    path = path or CACHE_FILE
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if max_bytes is not None:
+        httpcache.configure(max_bytes=max_bytes)
+    httpcache.open_cache(path)
+
+
+async def _request_aiohttp(method, url, headers, data, timeout, allow_redirects, stop_when=None):
+    client = _get_client()
+    client_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+    try:
+        async with client.request(method, url, headers=headers, data=data, timeout=client_timeout,
+                                  allow_redirects=allow_redirects) as r:
+            truncated = False
+            if stop_when is None:
+                content = await r.read()
+            else:
+                buf = bytearray()
+                async for chunk in r.content.iter_chunked(STREAM_CHUNK):
+                    buf += chunk
+                    if stop_when(buf):
+                        # the rest of the body is not needed: drop the connection instead of reading it
+                        truncated = True
+                        r.close()
+                        break
+                content = bytes(buf)
+            _mirror_response_cookies(r)
+            resp = _build_response(r.status, r.reason, r.headers, str(r.url), content)
+            resp.truncated = truncated
+            return resp
+    except asyncio.TimeoutError as e:
+        raise requests.Timeout(f"Timed out: {url}") from e
+    except aiohttp.ClientError as e:
+        raise requests.ConnectionError(f"{e} ({url})") from e
+
+
+def _request_streaming(method, url, headers, data, timeout, allow_redirects, stop_when):
+    # requests fallback of the stop_when read loop; runs in the executor
+    resp = _get_session().request(method, url, headers=headers, data=data, timeout=timeout,
+                                  allow_redirects=allow_redirects, stream=True)
+    buf = bytearray()
+    resp.truncated = False
+    try:
+        for chunk in resp.iter_content(STREAM_CHUNK):
+            buf += chunk
+            if stop_when(buf):
+                resp.truncated = True
+                break
+    finally:
+        resp.close()
+    resp._content = bytes(buf)
+    resp._content_consumed = True
+    return resp
+
+
+async def _send(method, url, headers, data, timeout, allow_redirects, stop_when=None):
+    if MOCK_SERVER:
+        url, headers = _to_mock(url, headers)
+    if aiohttp is not None:
+        resp = await _request_aiohttp(method, url, headers, data, timeout, allow_redirects, stop_when)
+    else:
+        loop = asyncio.get_running_loop()
+        if stop_when is not None:
+            call = functools.partial(_request_streaming, method, url, headers, data, timeout, allow_redirects, stop_when)
+        else:
+            call = functools.partial(_get_session().request, method, url, headers=headers, data=data,
+                                     timeout=timeout, allow_redirects=allow_redirects)
+        resp = await loop.run_in_executor(None, call)
+    if MOCK_SERVER:
+        resp.url = _from_mock(resp.url)
+    return resp
+
+
+def use_mock_server(base):
+    """Send every request to the mock server at base (None: back to the real sites)."""
+    global MOCK_SERVER
+    MOCK_SERVER = base.rstrip('/') if base else None
+
+
+def _to_mock(url, headers):
+    # The mock sees the real host as the first path segment. Cookies are picked for the real URL here
+    # (the jar would only send the mock host's own), plus whatever the mock set itself.
+    parts = urllib.parse.urlsplit(url)
+    mock_url = f"{MOCK_SERVER}/{parts.netloc}{parts.path or '/'}" + (f"?{parts.query}" if parts.query else '')
+    cookies = [c for c in (requests.cookies.get_cookie_header(_cookies, requests.Request('GET', u))
+                           for u in (url, mock_url)) if c]
+    if cookies:
+        headers = dict(headers, Cookie='; '.join(cookies))
+    return mock_url, headers
+
+
+def _from_mock(url):
+    if not url.startswith(MOCK_SERVER + '/'):
+        return url
+    host, _, rest = url[len(MOCK_SERVER) + 1:].partition('/')
+    return f"https://{host}/{rest}"
+
+
+def _retry_after(resp):
+    # Retry-After is either seconds or an HTTP date
+    value = resp.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt):
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+async def _send_with_retry(method, url, headers, data, timeout, allow_redirects, stop_when=None):
+    """Send through the per-host rate limiter, retrying 429/5xx and network errors with backoff."""
+    global requests_sent
+    attempt = 0
+    while True:
+        await ratelimit.acquire(url)
+        requests_sent += 1
+        try:
+            resp = await _send(method, url, headers, data, timeout, allow_redirects, stop_when)
+        except (requests.Timeout, requests.ConnectionError) as e:
+            if attempt >= MAX_RETRIES:
+                raise TransientError(f"{e} (gave up after {attempt + 1} attempts)") from e
+            ratelimit.throttled(url, _backoff(attempt))
+            metrics.count('http', metrics.site_of(url), 'retries')
+            attempt += 1
+            continue
+        if resp.status_code in RETRY_STATUS:
+            if attempt >= MAX_RETRIES:
+                raise TransientError(f"HTTP {resp.status_code} for {url} (gave up after {attempt + 1} attempts)")
+            delay = _retry_after(resp)
+            ratelimit.throttled(url, min(BACKOFF_MAX, delay) if delay is not None else _backoff(attempt))
+            metrics.count('http', metrics.site_of(url), 'retries')
+            attempt += 1
+            continue
+        ratelimit.succeeded(url)
+        return resp
+
+
+async def request(method, url, headers=None, data=None, timeout=None, allow_redirects=True,
+                  cache=True, refresh=False, stop_when=None):
+    """Send an HTTP request through the shared client and return a requests.Response.
+
+    Requests are paced per host (ratelimit.py). Throttling responses, 5xx overload responses,
+    timeouts and connection errors are retried; if they persist TransientError is raised.
+    When the response cache is enabled, GETs are answered from it while fresh and revalidated
+    with a conditional request once stale. cache=False bypasses it entirely (requests made for
+    their side effects, like age-gate confirmations); refresh=True skips the lookup but stores
+    the new response (re-fetching a page that came back gated).
+
+    stop_when(body_so_far) makes the body stream in: as soon as it returns True the rest is not
+    downloaded and the response has truncated=True (such a prefix is never stored in the cache).
+    """
+    started = time.perf_counter()
+    headers = dict(DEFAULT_HEADERS, **headers) if headers else DEFAULT_HEADERS
+    use_cache = cache and method == 'GET' and httpcache.is_open()
+    entry = None
+    if use_cache and not refresh:
+        entry = httpcache.lookup(url)
+        if entry is not None:
+            if httpcache.is_fresh(entry):
+                metrics.http(url, time.perf_counter() - started, 'cache', 0)
+                return _build_response(entry['status'], entry['reason'], entry['headers'], entry['url'], entry['body'])
+            headers = dict(headers, **httpcache.conditional_headers(entry))
+
+    try:
+        resp = await _send_with_retry(method, url, headers, data, timeout, allow_redirects, stop_when)
+    except Exception:
+        metrics.http(url, time.perf_counter() - started, 'failed', 0)
+        raise
+
+    if use_cache:
+        if entry is not None and resp.status_code == 304:
+            httpcache.mark_fresh(url)
+            metrics.http(url, time.perf_counter() - started, 'revalidated', 0)
+            return _build_response(entry['status'], entry['reason'], entry['headers'], entry['url'], entry['body'])
+        if resp.status_code == 200 and not getattr(resp, 'truncated', False):
+            httpcache.store(url, resp.status_code, resp.reason, resp.headers, resp.url, resp.content)
+    metrics.http(url, time.perf_counter() - started, 'network', len(resp.content))
+    return resp
+
+
+async def get(url, **kwargs):
+    return await request('GET', url, **kwargs)
+
+
+async def post(url, **kwargs):
+    return await request('POST', url, **kwargs)
+
+
+async def preconnect(hosts=None, connections=1):
+    """Open keep-alive connections to every storefront host up front so the first lookups skip the handshakes.
+
+    Failures are ignored; a host that cannot be reached is simply connected to later.
+    """
+    hosts = hosts or SITE_HOSTS
+    coros = [request('HEAD', h, timeout=10) for h in hosts for _ in range(connections)]
+    await asyncio.gather(*coros, return_exceptions=True)
+
+
+async def _close_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+@atexit.register
+def close():
+    """Save cookies if a cookie file is in use, close the shared clients and stop the loop thread."""
+    global _loop, _loop_thread, _session
+    try:
+        save_cookies()
+    except OSError:
+        pass
+    if _loop is not None and _loop.is_running():
+        try:
+            asyncio.run_coroutine_threadsafe(_close_client(), _loop).result(timeout=5)
+        except Exception:
+            pass
+        _loop.call_soon_threadsafe(_loop.stop)
+    # wait for run_forever() to return, then close the loop here rather than leaving it to the
+    # garbage collector (which warns about the already-closed selector at interpreter exit)
+    if _loop_thread is not None and _loop_thread is not threading.current_thread():
+        _loop_thread.join(timeout=5)
+    if _loop is not None and not _loop.is_running() and not _loop.is_closed():
+        _loop.close()
+    _loop = None
+    _loop_thread = None
+    if _session is not None:
+        _session.close()
+        _session = None
+    httpcache.close_cache()
+
+
+seed_age_gate_cookies()
@@ -1,126 +1,49 @@
-import requests
-from bs4 import BeautifulSoup
+import aio
+import singleflight
+import metrics
+import sitespec
 import re
-import urllib.parse
 
 
-def extract_product_info(product_url):
+# Extraction rules (see sitespec.py), in priority order. Missing fields are returned as ''.
+SPEC = sitespec.compile_spec([
+    # 1) Alice Books typically shows the heading as "タイトル / サークル名"
+    {'tag': 'h1', 'split': ' / ', 'fields': {'作品名': 0, 'サークル名': 1}},
+    # 2) og:title the same way, only when the heading gave no title
+    {'meta': 'og:title', 'split': ' / ', 'unless': '作品名', 'fields': {'作品名': 0, 'サークル名': 1}},
+    # 3) circle link
+    {'tag': 'a', 'attrs': {'href': re.compile(r'circle_id=')}, 'fields': {'サークル名': 0}},
+    # 4) metadata table rows like "主な作家" / "発行日"; several author links are joined with commas
+    {'row': r'作家|著者', 'prefer': 'a', 'join': ', ', 'fields': {'作家名': 0}},
+    {'row': r'発行日|発売日', 'fields': {'発売日': 0}},
+    # 5) definition list (dl/dt/dd) metadata
+    {'label': ('dt', r'発行日|発売日'), 'label_text': True, 'following': 'dd', 'fields': {'発売日': 0}},
+    {'label': ('dt', r'作家|著者'), 'label_text': True, 'following': 'dd', 'fields': {'作家名': 0}},
+], missing='')
+
+
+@singleflight.coalesced('extract:alicebooks')
+async def extract_product_info_async(product_url):
     """Extract basic product metadata from an alice-books.com product page.
 
     Returns dict with keys: {'作品名','サークル名','作家名','発売日','イベント名'}
     """
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    
     try:
-        resp = requests.get(product_url, headers=headers, timeout=10)
+        resp = await aio.get(product_url, timeout=10)
         resp.raise_for_status()
     except Exception:
         raise
+    return parse_product_page(resp.content)
 
-    soup = BeautifulSoup(resp.content, 'html.parser')
-
-    title = None
-    circle = None
-    author = None
-    release_date = None
-    event_name = None
-
-    # 1) Extract title and circle from the h1/header structure
-    # Alice Books typically shows title as "タイトル / サークル名" in the heading
-    heading = soup.find('h1')
-    if heading:
-        h1_text = heading.get_text(strip=True)
-        # Split by " / " to separate title and circle
-        if ' / ' in h1_text:
-            parts = h1_text.split(' / ')
-            title = parts[0].strip()
-            if len(parts) > 1:
-                circle = parts[1].strip()
-        else:
-            title = h1_text
-    
-    # 2) Try og:title as fallback
-    if not title:
-        og_title = soup.find('meta', property='og:title')
-        if og_title and og_title.get('content'):
-            content = og_title['content'].strip()
-            if ' / ' in content:
-                parts = content.split(' / ')
-                title = parts[0].strip()
-                if len(parts) > 1 and not circle:
-                    circle = parts[1].strip()
-            else:
-                title = content
-
-    # 3) Extract circle from circle link (if not already found)
-    if not circle:
-        circle_link = soup.find('a', href=re.compile(r'circle_id='))
-        if circle_link:
-            circle = circle_link.get_text(strip=True)
-
-    # 4) Extract author from the metadata table
-    # Look for table rows with labels like "主な作家" (main author)
-    # Authors are in separate <div> or <a> elements within the cell
-    try:
-        for tr in soup.find_all('tr'):
-            cells = tr.find_all(['th', 'td'])
-            if len(cells) >= 2:
-                label = cells[0].get_text(strip=True)
-                if '作家' in label or '著者' in label:
-                    author_cell = cells[1]
-                    # Find all author links or divs
-                    author_links = author_cell.find_all('a')
-                    if author_links:
-                        # Get text from each link and join with comma
-                        authors = [link.get_text(strip=True) for link in author_links]
-                        author = ', '.join(authors)
-                    else:
-                        # Fallback to full text if no links found
-                        author = author_cell.get_text(strip=True)
-                    break
-    except Exception:
-        pass
 
-    # 5) Extract release date from metadata table
-    # Look for rows with labels like "発行日" (release date)
-    try:
-        for tr in soup.find_all('tr'):
-            cells = tr.find_all(['th', 'td'])
-            if len(cells) >= 2:
-                label = cells[0].get_text(strip=True)
-                value = cells[1].get_text(strip=True)
-                if '発行日' in label or '発売日' in label:
-                    release_date = value
-                    break
-    except Exception:
-        pass
+@metrics.timed('parse', 'alicebooks')
+def parse_product_page(content):
+    """Parse a fetched alice-books.com product page (bytes or str) into the common info dict."""
+    return sitespec.extract(SPEC, content)
 
-    # 6) Alternative: look for metadata in structured divs
-    try:
-        # Alice Books may use definition list (dl/dt/dd) for metadata
-        dts = soup.find_all('dt')
-        for dt in dts:
-            label = dt.get_text(strip=True)
-            dd = dt.find_next('dd')
-            if dd:
-                value = dd.get_text(strip=True)
-                if '発行日' in label or '発売日' in label:
-                    if not release_date:
-                        release_date = value
-                elif ('作家' in label or '著者' in label) and not author:
-                    author = value
-    except Exception:
-        pass
 
-    return {
-        '作品名': title or '',
-        'サークル名': circle or '',
-        '作家名': author or '',
-        '発売日': release_date or '',
-        'イベント名': event_name or ''
-    }
+def extract_product_info(product_url):
+    return aio.run(extract_product_info_async(product_url))
 
 
 def clean_url(url):
@@ -0,0 +1,224 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import aio
+import htmlparse
+import httpcache
+import memo
+import singleflight
+import google
+import melon
+import tora
+import dlsite
+import booth
+import fanza
+import alicebooks
+
+# Offline benchmark over the saved pages in bench_corpus/ (search result and product pages for all six sites):
+#   python bench.py [--repeat N] [--site fanza] [--threshold 1.25] [--save-baseline]
+# Every page is timed through its site's parser, the extracted fields are checked against manifest.json and
+# the timings / peak memory are compared with the baseline saved on this machine (--save-baseline).
+# Exit status 1 when a field is wrong or a page got slower or bigger than baseline * threshold.
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_corpus')
+MANIFEST = os.path.join(CORPUS_DIR, 'manifest.json')
+# timings depend on the machine, so the baseline lives with the other local state, per parser backend
+BASELINE_FILE = os.path.join(aio.STATE_DIR, 'bench_baseline.json')
+
+DEFAULT_REPEAT = 10
+DEFAULT_THRESHOLD = 1.25
+# slowdowns smaller than this are timer noise however large the ratio (the JSON payloads take microseconds)
+NOISE_MS = 0.5
+
+PRODUCT_PARSERS = {
+    'melonbooks': melon.parse_product_page,
+    'toranoana': tora.parse_product_page,
+    'dlsite': dlsite.parse_product_page,
+    'booth': booth.parse_product_page,
+    'fanza': fanza.parse_product_page,
+    'alicebooks': alicebooks.parse_product_page,
+}
+
+API_PARSERS = {
+    'dlsite': dlsite.parse_api_payload,
+    'booth': booth.parse_api_payload,
+}
+
+SEARCHES = {
+    'melonbooks': google.get_first_search_url_from_melonbooks_async,
+    'toranoana': google.get_first_search_url_from_toranoana_async,
+    'dlsite': google.get_first_search_url_from_dlsite_async,
+    'booth': google.get_first_search_url_from_booth_async,
+    'fanza': google.get_first_search_url_from_fanza_async,
+    'alicebooks': google.get_first_search_url_from_alicebooks_async,
+}
+
+
+async def _offline(method, url, *args, **kwargs):
+    # Search pages are answered from the response cache; anything else would go to the network
+    raise aio.TransientError(f"not in the benchmark corpus: {url}")
+
+
+def _runner(case, content):
+    """Return a no-argument function doing one parse of the case's page."""
+    site = case['site']
+    if case['kind'] == 'product':
+        parse = PRODUCT_PARSERS[site]
+        if site == 'fanza':
+            return lambda: parse(content, case.get('encoding'))
+        return lambda: parse(content)
+    if case['kind'] == 'api':
+        parse = API_PARSERS[site]
+        return lambda: parse(content)
+    if case['kind'] == 'search':
+        # the search function runs as in a real lookup (fetch from the cache, parse, pick the hit),
+        # with memo/singleflight forgetting the previous round's answer
+        search = SEARCHES[site]
+        query = case['query']
+
+        def run():
+            memo.forget(site, query)
+            singleflight.reset()
+            return aio.run(search(query))
+        return run
+    raise ValueError(f"unknown case kind: {case['kind']}")
+
+
+def _measure(run, repeat):
+    """Return (result, seconds per parse, peak bytes allocated during one parse)."""
+    result = run()
+    best = None
+    # like timeit: no garbage collection in the timed runs, the fastest one counts
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        gc.enable()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, best, peak
+
+
+def _check(case, result):
+    """Differences from the expected fields / URL, as printable lines."""
+    expected = case['expected']
+    if case['kind'] == 'search':
+        return [] if result == expected else [f"url: expected {expected!r}, got {result!r}"]
+    if not isinstance(result, dict):
+        return [f"expected fields, got {result!r}"]
+    return [f"{k}: expected {v!r}, got {result.get(k)!r}" for k, v in expected.items() if result.get(k) != v]
+
+
+def load_baseline(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_baseline(path, baseline):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=1)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Time the site parsers on the saved pages in bench_corpus/.')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help=f'timed parses per page, the fastest counts (default: {DEFAULT_REPEAT})')
+    parser.add_argument('--site', action='append', choices=sorted(PRODUCT_PARSERS),
+                        help='only this site (can be given more than once)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'fail when time or peak memory exceeds baseline * this (default: {DEFAULT_THRESHOLD})')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='baseline file (default: %(default)s)')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store this run as the baseline for the current parser backend')
+    parser.add_argument('--parser', choices=htmlparse.PREFERRED_BACKENDS, default=None,
+                        help=f'HTML parser backend (default: fastest installed, now {htmlparse.BACKEND})')
+    args = parser.parse_args(argv)
+    if args.parser:
+        try:
+            htmlparse.set_backend(args.parser)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            return 1
+
+    with open(MANIFEST, encoding='utf-8') as f:
+        cases = [c for c in json.load(f) if not args.site or c['site'] in args.site]
+
+    # search pages are served from a throwaway response cache; nothing is sent anywhere
+    aio._send_with_retry = _offline
+    aio.seed_age_gate_cookies()
+    tmp = tempfile.TemporaryDirectory()
+    httpcache.open_cache(os.path.join(tmp.name, 'cache.sqlite'))
+
+    baseline = load_baseline(args.baseline)
+    base = baseline.get(htmlparse.BACKEND, {})
+    current = {}
+    failures = 0
+    repeat = max(1, args.repeat)
+    print(f"parser: {htmlparse.BACKEND}, pages: {len(cases)}, repeat: {repeat}")
+    print(f"{'page':34} {'ms/page':>9} {'pages/s':>9} {'MB/s':>7} {'peak KB':>9} {'base ms':>9} {'ratio':>6}")
+    try:
+        for case in cases:
+            with open(os.path.join(CORPUS_DIR, case['file']), 'rb') as f:
+                content = f.read()
+            if case['kind'] == 'search':
+                httpcache.store(case['url'], 200, 'OK', {'Content-Type': 'text/html; charset=utf-8'}, case['url'], content)
+            try:
+                result, seconds, peak = _measure(_runner(case, content), repeat)
+            except Exception as e:
+                failures += 1
+                print(f"{case['file']:34} ERROR {e}")
+                continue
+            current[case['file']] = {'ms': seconds * 1000, 'peak_kb': peak / 1024}
+
+            old = base.get(case['file'])
+            ratio = seconds * 1000 / old['ms'] if old else None
+            # '-' when there is no baseline to compare with, like the --stats tables
+            base_ms = f"{old['ms']:.2f}" if old else '-'
+            print(f"{case['file']:34} {seconds * 1000:9.2f} {1 / seconds:9.1f} {len(content) / 1e6 / seconds:7.1f} "
+                  f"{peak / 1024:9.0f} {base_ms:>9} {f'{ratio:.2f}' if old else '-':>6}")
+            for line in _check(case, result):
+                failures += 1
+                print(f"  FIELD {line}")
+            slower = old and ratio > args.threshold and seconds * 1000 - old['ms'] > NOISE_MS
+            bigger = old and peak / 1024 > old['peak_kb'] * args.threshold
+            if (slower or bigger) and not args.save_baseline:
+                failures += 1
+                print(f"  REGRESSION {case['file']}: {seconds * 1000:.2f} ms / {peak / 1024:.0f} KB, "
+                      f"baseline {old['ms']:.2f} ms / {old['peak_kb']:.0f} KB")
+    finally:
+        httpcache.close_cache()
+        tmp.cleanup()
+
+    total = sum(c['ms'] for c in current.values())
+    print(f"total: {total:.2f} ms for one pass over {len(current)} pages")
+    if args.save_baseline:
+        if failures:
+            print("not saving the baseline: fix the failures above first", file=sys.stderr)
+        else:
+            baseline[htmlparse.BACKEND] = dict(base, **current)
+            save_baseline(args.baseline, baseline)
+            print(f"baseline saved to {args.baseline}")
+    elif not base:
+        print(f"no baseline for {htmlparse.BACKEND} yet; run with --save-baseline to record one")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
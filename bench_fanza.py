@@ -0,0 +1,248 @@
+import argparse
+import re
+import sys
+import time
+import htmlparse
+import fanza
+import structured
+
+# Benchmark for fanza.parse_product_page on saved FANZA product pages:
+#   python bench_fanza.py page1.html page2.html ... [--repeat N] [--encoding cp932]
+# Every page is parsed by the current extractor and by the previous one kept below; results must be identical,
+# except fields the page's JSON-LD / microdata answers, which the current extractor takes from there instead,
+# and the title of pages that are not UTF-8 (the previous one read the raw <title> bytes as UTF-8).
+
+
+def legacy_parse_product_page(content, encoding=None):
+    """fanza.parse_product_page before the single-pass rewrite (separate find_all/get_text passes)."""
+    # Ensure we have a text string. Some DMM pages are mis-labeled or contain Shift_JIS/cp932 bytes
+    b = content
+    try:
+        text = b.decode(encoding or 'utf-8', errors='replace')
+    except Exception:
+        text = b.decode('utf-8', errors='replace')
+
+    # If text looks garbled (many replacement chars), try cp932/shift_jis
+    if text.count('\ufffd') > 2 or (len(text) > 0 and sum(1 for c in text if ord(c) > 0x7ff) / max(1, len(text)) > 0.3):
+        try:
+            text = b.decode('cp932', errors='replace')
+        except Exception:
+            try:
+                text = b.decode('shift_jis', errors='replace')
+            except Exception:
+                pass
+
+    soup = htmlparse.make_soup(text)
+
+    title = None
+    circle = None
+    author = None
+    release_date = None
+    event_name = None
+
+    # 1) Try JSON-LD structured data
+    try:
+        for script in soup.find_all('script', type='application/ld+json'):
+            try:
+                j = script.string
+                if not j:
+                    continue
+                # simple look for datePublished or name or author in JSON-LD string
+                m_name = re.search(r'"name"\s*:\s*"([^"]+)"', j)
+                if m_name and not title:
+                    title = m_name.group(1).strip()
+                m_date = re.search(r'"datePublished"\s*:\s*"([^"]+)"', j)
+                if m_date and not release_date:
+                    release_date = m_date.group(1).strip()
+                m_author = re.search(r'"author"\s*:\s*\{[^}]*"name"\s*:\s*"([^"]+)"', j)
+                if m_author and not author:
+                    author = m_author.group(1).strip()
+                if title and (release_date or author):
+                    break
+            except Exception:
+                continue
+    except Exception:
+        pass
+
+    # 2) Try extracting raw <title> bytes from the original content first - this reliably contains the product name
+    try:
+        m = re.search(rb'<title>(.*?)</title>', b, flags=re.I | re.S)
+        if m:
+            raw = m.group(1)
+            try:
+                raw_txt = raw.decode('utf-8', errors='replace')
+            except Exception:
+                raw_txt = raw.decode('cp932', errors='replace')
+            # prefer parenthetical title: "FullName (Title) - FANZA"
+            p = re.search(r'[（\(]([^）\)]{1,200})[）\)]', raw_txt)
+            if p:
+                title = p.group(1).strip()
+            else:
+                title = re.sub(r'\s*[\-|｜].*FANZA.*$', '', raw_txt).strip()
+    except Exception:
+        pass
+
+    # 3) Try meta og:title if still missing
+    if not title:
+        og = soup.find('meta', property='og:title')
+        if og and og.get('content'):
+            title = og['content'].strip()
+
+    # 3) Try h1 or title tag
+    if not title:
+        h1 = soup.find('h1')
+        if h1 and h1.get_text(strip=True):
+            title = h1.get_text(strip=True)
+    if not title:
+        if soup.title and soup.title.get_text(strip=True):
+            title = soup.title.get_text(strip=True)
+
+    # 3.5) FANZA uses a specific anchor class for circle links on product pages
+    try:
+        a_circle = soup.find('a', class_='circleName__txt')
+        if a_circle and a_circle.get_text(strip=True):
+            circle = a_circle.get_text(strip=True)
+    except Exception:
+        pass
+
+    # 4) Extract author/circle: look for table rows or labels
+    try:
+        # look for labels like '作者' or 'サークル' and take next sibling
+        for label in ['作者', 'サークル', 'サークル名', 'ブランド', 'メーカー']:
+            # find element with the label text
+            elems = soup.find_all(string=re.compile(label))
+            for e in elems:
+                parent = e.parent
+                # try next sibling
+                sib = parent.find_next_sibling()
+                if sib and sib.get_text(strip=True):
+                    v = sib.get_text(strip=True)
+                    # heuristic: if contains author-like characters, assign
+                    if label in ['作者']:
+                        author = v
+                        break
+                    else:
+                        # only overwrite circle if we haven't already extracted it from anchor
+                        if not circle:
+                            circle = v
+                        # sometimes author is also present in v separated by '/'
+                        # if pattern like "circle / author"
+                        if '/' in v and not author:
+                            parts = [p.strip() for p in v.split('/')]
+                            if len(parts) >= 2:
+                                if not circle:
+                                    circle = parts[0]
+                                author = parts[1]
+                        break
+                # sometimes the label and value are separated by ':' in the same string
+                s = e.strip()
+                m = re.search(rf'{label}\s*[:：]\s*(.+)', s)
+                if m:
+                    v = m.group(1).strip()
+                    if label == '作者':
+                        author = v
+                    else:
+                        if not circle:
+                            circle = v
+                    break
+            if author and circle:
+                break
+    except Exception:
+        pass
+
+    # 5) Fallback: try to find a maker link
+    if not circle:
+        maker = soup.find('a', href=re.compile(r'/maker/|/circle/|/company/|/brand/'), string=True)
+        if maker:
+            circle = maker.get_text(strip=True)
+
+    # 6) Release date: search for nearby labels and date patterns
+    try:
+        text_all = soup.get_text(separator=' ', strip=True)
+        # common patterns: 2025/12/28 00:00 or 2025年12月28日 00:00
+        m = re.search(r'(20\d{2}[年/.-]\s?\d{1,2}[月/.-]\s?\d{1,2}日?\s*(?:\d{2}:\d{2})?)', text_all)
+        if not m:
+            m = re.search(r'(20\d{2}/\d{1,2}/\d{1,2}\s*\d{2}:\d{2})', text_all)
+        if m:
+            release_date = m.group(1).strip()
+        else:
+            # try label-based capture for '配信開始日'
+            m2 = re.search(r'配信開始日\s*[:：]?\s*([0-9０-９年/月\-\.\s:：]+)', text_all)
+            if m2:
+                release_date = m2.group(1).strip()
+    except Exception:
+        pass
+
+    # Clean up release_date: normalize full-width digits to ASCII and pad times if missing
+    try:
+        if release_date:
+            # convert full-width digits
+            trans = str.maketrans('０１２３４５６７８９', '0123456789')
+            release_date = release_date.translate(trans)
+            release_date = release_date.replace('年', '/').replace('月', '/').replace('日', '').replace('.', '/').replace('-', '/').strip()
+            # ensure time exists: if only date, add '00:00'
+            if re.match(r'^\d{4}/\d{1,2}/\d{1,2}$', release_date):
+                release_date = release_date + ' 00:00'
+    except Exception:
+        pass
+
+    # If author not found but title contains parentheses with author, attempt extraction such as 'タイトル（作者）'
+    if not author and title:
+        m = re.search(r'^(.*?)（(.*?)）', title)
+        if m:
+            # sometimes og:title contains 'タイトル（サークル）' so interpret second as circle
+            if not circle:
+                circle = m.group(2).strip()
+
+    return {
+        '作品名': title,
+        'サークル名': circle,
+        '作家名': author,
+        '発売日': release_date,
+        'イベント名': event_name
+    }
+
+
+def _time_per_page(fn, pages, encoding, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for content in pages:
+            fn(content, encoding)
+    return (time.perf_counter() - start) / (repeat * len(pages))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Compare fanza.parse_product_page with the previous extractor.')
+    parser.add_argument('pages', nargs='+', help='saved FANZA product pages (raw bytes as downloaded)')
+    parser.add_argument('--repeat', type=int, default=5, help='parses per page and extractor (default: 5)')
+    parser.add_argument('--encoding', default=None, help='charset the server declared for the pages, if any')
+    args = parser.parse_args(argv)
+
+    pages = []
+    for path in args.pages:
+        with open(path, 'rb') as f:
+            pages.append(f.read())
+
+    mismatches = 0
+    for path, content in zip(args.pages, pages):
+        new = fanza.parse_product_page(content, args.encoding)
+        old = legacy_parse_product_page(content, args.encoding)
+        text = fanza._decode(content, args.encoding)
+        fields, _ = structured.extract(htmlparse.make_soup(text))
+        if text != content.decode('utf-8', errors='replace'):
+            fields['作品名'] = True
+        if any(new[k] != old[k] for k in new if not fields.get(k)):
+            mismatches += 1
+            print(f"MISMATCH {path}\n  new: {new}\n  old: {old}")
+
+    repeat = max(1, args.repeat)
+    old_t = _time_per_page(legacy_parse_product_page, pages, args.encoding, repeat)
+    new_t = _time_per_page(fanza.parse_product_page, pages, args.encoding, repeat)
+    print(f"parser: {htmlparse.BACKEND}, pages: {len(pages)}, repeat: {repeat}")
+    print(f"previous:    {old_t * 1000:8.2f} ms/page")
+    print(f"single-pass: {new_t * 1000:8.2f} ms/page  ({old_t / new_t:.2f}x)")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,53 +1,141 @@
-import requests
-from bs4 import BeautifulSoup
+import aio
+import singleflight
+import htmlparse
+import metrics
+import structured
 import urllib.parse
+import json
 import re
 
+# Try the item's JSON (/items/<id>.json) before scraping the HTML page (search.py --api).
+# Off by default: the JSON has no 作家名, which the page gives from its /users/ links.
+USE_API = False
 
-def extract_product_info(product_url):
+ITEM_ID = re.compile(r'/items/(\d+)')
+
+
+@singleflight.coalesced('extract:booth')
+async def extract_product_info_async(product_url):
     """Extract basic product metadata from a Booth product page.
 
     Returns dict with keys: {'作品名','サークル名','作家名','発売日','イベント名'}
     """
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-
-    session = requests.Session()
-    session.headers.update(headers)
+    if USE_API:
+        info = await _extract_from_api(product_url)
+        if info:
+            return info
 
     try:
         # First try to GET the page. If it contains an age-check block, set cookie and retry.
-        resp = session.get(product_url, timeout=10)
+        resp = await aio.get(product_url, timeout=10)
         resp.raise_for_status()
     except Exception:
         raise
 
     text = resp.text
-    soup = BeautifulSoup(text, 'html.parser')
+    soup = htmlparse.make_soup(text)
 
     # If an R18 prompt exists and JS handler is present ('.js-approve-adult'), emulate by setting cookie and reloading
     if soup.select_one('.js-approve-adult') is not None:
-        session.cookies.set('adult', 't', domain='booth.pm', path='/')
+        aio.set_cookie('adult', 't', domain='booth.pm', path='/')
         try:
-            resp = session.get(product_url, timeout=10)
+            resp = await aio.get(product_url, timeout=10, refresh=True)
             resp.raise_for_status()
             text = resp.text
-            soup = BeautifulSoup(text, 'html.parser')
+            soup = htmlparse.make_soup(text)
         except Exception:
             # fallthrough, continue parsing whatever we have
             pass
 
+    return parse_product_page(text, soup)
+
+
+def api_url(product_url):
+    """JSON endpoint for a Booth item URL (https://booth.pm/ja/items/123 -> .../items/123.json), None if not an item."""
+    parts = urllib.parse.urlsplit(product_url)
+    m = ITEM_ID.search(parts.path)
+    if not m:
+        return None
+    if parts.netloc.endswith('.booth.pm'):
+        # shop subdomains (https://shop.booth.pm/items/123) are served from the main site too
+        return f"{parts.scheme}://booth.pm/ja/items/{m.group(1)}.json"
+    return urllib.parse.urlunsplit((parts.scheme, parts.netloc, parts.path[:m.end()] + '.json', '', ''))
+
+
+async def _extract_from_api(product_url):
+    # None on any failure so the caller falls back to the HTML page
+    url = api_url(product_url)
+    if not url:
+        return None
+    try:
+        resp = await aio.get(url, timeout=10)
+        if resp.status_code != 200:
+            return None
+        return parse_api_payload(resp.text)
+    except Exception:
+        return None
+
+
+def parse_api_payload(content):
+    """Map Booth item JSON (str or bytes) into the common info dict; None if it is not an item."""
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get('name'), str) or not data['name'].strip():
+        return None
+    shop = data.get('shop') if isinstance(data.get('shop'), dict) else {}
+    text = content.decode('utf-8', errors='replace') if isinstance(content, bytes) else content
+    return {
+        '作品名': data['name'].strip(),
+        'サークル名': (shop.get('name') or '').strip() or None,
+        # the item JSON has no creator apart from the shop
+        '作家名': None,
+        '発売日': structured.format_date(data.get('published_at')) or None,
+        # event tags and descriptions are in the payload text, same as on the page
+        'イベント名': _event_name(text)
+    }
+
+
+def _event_name(text):
+    # Event name: search for 'コミックマーケット' or 'コミケ' or patterns like C123 in page
+    evt = None
+    m = re.search(r'コミックマーケット\s*\d{1,4}|コミケ\s*\d{1,4}', text)
+    if m:
+        evt = m.group(0)
+    else:
+        # look for patterns like 'c123' in JS blobs and expand to C123
+        m2 = re.search(r'"value"\s*:\s*"c(\d{1,4})"', text, re.I)
+        if m2:
+            evt = f"C{m2.group(1)}"
+    if evt:
+        # normalize 'コミックマーケット107' -> 'C107'
+        mnum = re.search(r'\d{1,4}', evt)
+        if mnum:
+            return f"C{mnum.group(0)}"
+        return evt
+    return None
+
+
+@metrics.timed('parse', 'booth')
+def parse_product_page(content, soup=None):
+    """Parse a Booth product page (str or bytes); soup may be passed when the page is already parsed."""
+    text = content.decode('utf-8', errors='replace') if isinstance(content, bytes) else content
+    if soup is None:
+        soup = htmlparse.make_soup(text)
+
     title = None
     circle = None
     author = None
     release_date = None
     event_name = None
 
+    # JSON-LD / microdata / og:* in one pass; what they answer skips the heuristics below
+    fields, og = structured.extract(soup)
+
     # 1) Prefer og:title: pattern often '作品名 - サークル名 - BOOTH'
-    og_title = soup.find('meta', attrs={'property': 'og:title'})
-    if og_title and og_title.get('content'):
-        content = og_title['content'].strip()
+    if og.get('title'):
+        content = og['title']
         # split by ' - ' and take first as title, second as circle if present
         parts = [p.strip() for p in content.split(' - ')]
         if len(parts) >= 1:
@@ -59,6 +147,11 @@ def extract_product_info(product_url):
             elif parts[-1].upper() != 'BOOTH' and len(parts) >= 2:
                 circle = parts[1]
 
+    title = title or fields['作品名']
+    circle = circle or fields['サークル名']
+    author = fields['作家名']
+    release_date = fields['発売日']
+
     # Fallback: try <h1>
     if not title:
         h1 = soup.find('h1')
@@ -68,19 +161,20 @@ def extract_product_info(product_url):
                 title = t
 
     # Try to find author/circle by anchors pointing to /users/ or /makers/
-    for a in soup.find_all('a'):
-        href = a.get('href', '')
-        text = a.get_text(strip=True)
-        if not text:
-            continue
-        if '/users/' in href and 'sign_in' not in href.lower():
-            # prefer this as author
-            if not author:
-                author = text
-        if '/makers/' in href or '/users/' in href and not circle:
-            # maker may correspond to circle
-            if not circle:
-                circle = text
+    if not (author and circle):
+        for a in soup.find_all('a'):
+            href = a.get('href', '')
+            link_text = a.get_text(strip=True)
+            if not link_text:
+                continue
+            if '/users/' in href and 'sign_in' not in href.lower():
+                # prefer this as author
+                if not author:
+                    author = link_text
+            if '/makers/' in href or '/users/' in href and not circle:
+                # maker may correspond to circle
+                if not circle:
+                    circle = link_text
 
     # meta author
     meta_author = soup.find('meta', attrs={'name': 'author'})
@@ -88,10 +182,10 @@ def extract_product_info(product_url):
         if not author:
             author = meta_author['content'].strip()
 
-    # Release date: look for common date patterns near keywords
+    # Release date (unless structured data had one): look for common date patterns near keywords
     date_match = None
     # look for explicit labels
-    for label in ['発売日', '販売日', '公開日', '公開', '更新日', '登録日']:
+    for label in ([] if release_date else ['発売日', '販売日', '公開日', '公開', '更新日', '登録日']):
         m = soup.find(text=re.compile(label))
         if m:
             # attempt to find nearest date-like string around this occurrence
@@ -100,7 +194,7 @@ def extract_product_info(product_url):
             if dm:
                 date_match = dm.group(0)
                 break
-    if not date_match:
+    if not date_match and not release_date:
         # search whole page for first date-like pattern
         dm = re.search(r'\d{4}[年\-/.]?\s?\d{1,2}[月\-/.]?\s?\d{1,2}|\d{4}-\d{2}-\d{2}', text)
         if dm:
@@ -108,23 +202,7 @@ def extract_product_info(product_url):
     if date_match:
         release_date = date_match
 
-    # Event name: search for 'コミックマーケット' or 'コミケ' or patterns like C123 in page
-    evt = None
-    m = re.search(r'コミックマーケット\s*\d{1,4}|コミケ\s*\d{1,4}', text)
-    if m:
-        evt = m.group(0)
-    else:
-        # look for patterns like 'c123' in JS blobs and expand to C123
-        m2 = re.search(r'"value"\s*:\s*"c(\d{1,4})"', text, re.I)
-        if m2:
-            evt = f"C{m2.group(1)}"
-    if evt:
-        # normalize 'コミックマーケット107' -> 'C107'
-        mnum = re.search(r'\d{1,4}', evt)
-        if mnum:
-            event_name = f"C{mnum.group(0)}"
-        else:
-            event_name = evt
+    event_name = _event_name(text)
 
     return {
         '作品名': title,
@@ -132,4 +210,8 @@ def extract_product_info(product_url):
         '作家名': author,
         '発売日': release_date,
         'イベント名': event_name
-    }
\ No newline at end of file
+    }
+
+
+def extract_product_info(product_url):
+    return aio.run(extract_product_info_async(product_url))
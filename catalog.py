@@ -0,0 +1,220 @@
+import json
+import sqlite3
+import threading
+import time
+import httpcache
+import memo
+
+# Catalog of resolved works (search.py --incremental): what every input line resolved to last time, so
+# reruns print known rows at once and only search/fetch new or stale lines. A work is identified only by its
+# input line: the normalized title, or the canonical URL for a URL line. The merged 作品名 and the product URLs
+# it resolved to are kept as hints (find_by_hint) but never make two input lines one work, since a search often
+# picks the same unrelated product page for different titles.
+
+# Layout version (PRAGMA user_version). Version 0 keyed works by their product URLs too, which could merge
+# different titles into one record; such a catalog is dropped and rebuilt by the next runs.
+SCHEMA_VERSION = 1
+
+# How long a resolved work is trusted, in seconds. Works nothing was found for are retried sooner,
+# like the search memo's "N/A" answers; works where a site could not be reached are always retried.
+HIT_TTL = 30 * 24 * 3600
+MISS_TTL = 24 * 3600
+
+# Merged fields kept per work, in TSV column order
+FIELDS = ['サークル名', '作家名', '作品名', '発売日', 'イベント名']
+
+_db = None
+_lock = threading.Lock()
+
+# Lines answered from the catalog in this run
+hits = 0
+
+
+def configure(hit_ttl=None, miss_ttl=None):
+    global HIT_TTL, MISS_TTL
+    if hit_ttl is not None:
+        HIT_TTL = hit_ttl
+    if miss_ttl is not None:
+        MISS_TTL = miss_ttl
+
+
+def open_catalog(path):
+    """Open (creating if needed) the catalog database at path. Lookups return None until this is called."""
+    global _db
+    with _lock:
+        if _db is not None:
+            _db.close()
+        _db = sqlite3.connect(path, check_same_thread=False)
+        _db.execute('PRAGMA journal_mode=WAL')
+        _db.execute('PRAGMA synchronous=NORMAL')
+        if _db.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+            _db.execute('DROP TABLE IF EXISTS work_keys')
+            _db.execute('DROP TABLE IF EXISTS works')
+            _db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        _db.execute("""CREATE TABLE IF NOT EXISTS works (
+            id INTEGER PRIMARY KEY,
+            merged TEXT NOT NULL,
+            urls TEXT NOT NULL,
+            site_infos TEXT NOT NULL,
+            failed TEXT NOT NULL,
+            checked_at TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL)""")
+        # input line -> work: ('title', normalized title) or ('url', canonical URL of a URL line)
+        _db.execute("""CREATE TABLE IF NOT EXISTS work_keys (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            work_id INTEGER NOT NULL,
+            PRIMARY KEY (kind, key))""")
+        _db.execute('CREATE INDEX IF NOT EXISTS work_keys_work ON work_keys(work_id)')
+        # hints: the merged title and product URLs of a work; one key can point at several works
+        _db.execute("""CREATE TABLE IF NOT EXISTS work_hints (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            work_id INTEGER NOT NULL,
+            PRIMARY KEY (kind, key, work_id))""")
+        _db.execute('CREATE INDEX IF NOT EXISTS work_hints_work ON work_hints(work_id)')
+        _db.commit()
+
+
+def close_catalog():
+    global _db
+    with _lock:
+        if _db is not None:
+            _db.close()
+            _db = None
+
+
+def is_open():
+    return _db is not None
+
+
+def canonical_url(url):
+    """Key of a product URL: the response cache's canonical form without a trailing slash."""
+    key = httpcache.canonical_url(url)
+    return key[:-1] if key.endswith('/') and key.count('/') > 3 else key
+
+
+def _key(value):
+    # the key an input line is identified by: its URL, or its normalized text as a title
+    if value.startswith('http'):
+        return 'url', canonical_url(value)
+    return 'title', memo.normalize_query(value)
+
+
+def _hints(merged, urls):
+    keys = []
+    title = (merged or {}).get('作品名')
+    if title:
+        keys.append(('title', memo.normalize_query(title)))
+    keys.extend(('url', canonical_url(u)) for u in urls.values() if u)
+    return list(dict.fromkeys(keys))
+
+
+def _row_to_work(row):
+    return {
+        'id': row[0],
+        'merged': json.loads(row[1]),
+        'urls': json.loads(row[2]),
+        'site_infos': json.loads(row[3]),
+        'failed': json.loads(row[4]),
+        'checked_at': json.loads(row[5]),
+        'created_at': row[6],
+        'updated_at': row[7],
+    }
+
+
+_COLUMNS = 'id, merged, urls, site_infos, failed, checked_at, created_at, updated_at'
+
+
+def get(work_id):
+    if _db is None:
+        return None
+    with _lock:
+        row = _db.execute(f'SELECT {_COLUMNS} FROM works WHERE id = ?', (work_id,)).fetchone()
+    return _row_to_work(row) if row else None
+
+
+def find(value):
+    """Return the work an input line (title or URL) resolved to, fresh or not, or None."""
+    if _db is None:
+        return None
+    with _lock:
+        row = _db.execute(f'SELECT {_COLUMNS} FROM works JOIN work_keys ON work_keys.work_id = works.id '
+                          'WHERE work_keys.kind = ? AND work_keys.key = ?', _key(value)).fetchone()
+    return _row_to_work(row) if row else None
+
+
+def find_by_hint(value):
+    """Return the most recently updated work whose merged title or one of whose product URLs matches value
+    (a title or a URL), or None. Only a hint: different input lines can share a product URL."""
+    if _db is None:
+        return None
+    with _lock:
+        row = _db.execute(f'SELECT {_COLUMNS} FROM works JOIN work_hints ON work_hints.work_id = works.id '
+                          'WHERE work_hints.kind = ? AND work_hints.key = ? ORDER BY works.updated_at DESC',
+                          _key(value)).fetchone()
+    return _row_to_work(row) if row else None
+
+
+def is_fresh(work, now=None):
+    """Whether a work can be reused as is: no site failed, and younger than HIT_TTL (MISS_TTL if nothing was found)."""
+    if work['failed']:
+        return False
+    ttl = HIT_TTL if any(work['urls'].values()) else MISS_TTL
+    return (now or time.time()) - work['updated_at'] < ttl
+
+
+def lookup(value):
+    """Return the fresh work for an input line, or None if it is unknown or stale."""
+    work = find(value)
+    if work is None or not is_fresh(work):
+        return None
+    return work
+
+
+def store(value, merged, urls, site_infos=None, failed=(), checked=None):
+    """Record what an input line resolved to: merged fields (None: nothing found), {site: URL or None},
+    the per-site info dicts and the sites that could not be reached. The line's own work is updated
+    (or created); its merged title and URLs are saved as hints. Returns the work id.
+
+    checked lists the sites searched now (default: all in urls); other sites keep their last check time.
+    """
+    if _db is None:
+        return None
+    now = time.time()
+    urls = {k: (u if isinstance(u, str) and u.startswith('http') else None) for k, u in (urls or {}).items()}
+    kind, key = _key(value)
+    with _lock:
+        row = _db.execute('SELECT work_id FROM work_keys WHERE kind = ? AND key = ?', (kind, key)).fetchone()
+        work_id = row[0] if row else None
+        checked_at = {}
+        created_at = now
+        if work_id is not None:
+            row = _db.execute('SELECT checked_at, created_at FROM works WHERE id = ?', (work_id,)).fetchone()
+            if row:
+                checked_at, created_at = json.loads(row[0]), row[1]
+        for site in (urls if checked is None else checked):
+            checked_at[site] = now
+        values = (json.dumps(merged, ensure_ascii=False), json.dumps(urls, ensure_ascii=False),
+                  json.dumps(site_infos or {}, ensure_ascii=False), json.dumps(sorted(failed)),
+                  json.dumps(checked_at), created_at, now)
+        if work_id is None:
+            work_id = _db.execute('INSERT INTO works (merged, urls, site_infos, failed, checked_at, created_at, '
+                                  'updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)', values).lastrowid
+            _db.execute('INSERT INTO work_keys VALUES (?, ?, ?)', (kind, key, work_id))
+        else:
+            _db.execute('UPDATE works SET merged = ?, urls = ?, site_infos = ?, failed = ?, checked_at = ?, '
+                        'created_at = ?, updated_at = ? WHERE id = ?', values + (work_id,))
+        _db.execute('DELETE FROM work_hints WHERE work_id = ?', (work_id,))
+        _db.executemany('INSERT OR IGNORE INTO work_hints VALUES (?, ?, ?)',
+                        [(k, h, work_id) for k, h in _hints(merged, urls)])
+        _db.commit()
+    return work_id
+
+
+def count():
+    if _db is None:
+        return 0
+    with _lock:
+        return _db.execute('SELECT COUNT(*) FROM works').fetchone()[0]
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+# Progress of one batch run (search.py --resume): every finished row and every finished site lookup
+# (search answer, fetched product info) is committed as soon as it is known, so a run cut short by a crash,
+# Ctrl+C or a dropped network resumes where it stopped. Lookups that raised are not saved and run again.
+# Lines are identified by their position among the input's non-blank lines and checked against their text.
+
+_db = None
+_lock = threading.Lock()
+
+# What lookup() returns for a lookup that has not finished (None is a valid saved answer)
+MISSING = object()
+
+# Rows and lookups answered from the checkpoint in this run
+resumed_rows = 0
+resumed_lookups = 0
+
+
+def path_for(state_dir, input_path):
+    """Checkpoint file of an input file: one per input path, under state_dir/checkpoints/."""
+    digest = hashlib.sha1(os.path.abspath(input_path).encode('utf-8')).hexdigest()[:12]
+    name = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(state_dir, 'checkpoints', f"{name}-{digest}.sqlite")
+
+
+def open_checkpoint(path, resume=False):
+    """Open the checkpoint at path. Without resume whatever it held is dropped and the run starts over."""
+    global _db
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with _lock:
+        if _db is not None:
+            _db.close()
+        _db = sqlite3.connect(path, check_same_thread=False)
+        _db.execute('PRAGMA journal_mode=WAL')
+        _db.execute('PRAGMA synchronous=NORMAL')
+        _db.execute("""CREATE TABLE IF NOT EXISTS lines (
+            idx INTEGER PRIMARY KEY,
+            value TEXT NOT NULL,
+            row TEXT NOT NULL)""")
+        _db.execute("""CREATE TABLE IF NOT EXISTS lookups (
+            idx INTEGER NOT NULL,
+            value TEXT NOT NULL,
+            step TEXT NOT NULL,
+            site TEXT NOT NULL,
+            result TEXT NOT NULL,
+            PRIMARY KEY (idx, step, site))""")
+        if not resume:
+            _db.execute('DELETE FROM lines')
+            _db.execute('DELETE FROM lookups')
+        _db.commit()
+
+
+def close_checkpoint(remove=False):
+    """Close the checkpoint; remove=True deletes the file (the run finished)."""
+    global _db
+    with _lock:
+        if _db is None:
+            return
+        path = _db.execute('PRAGMA database_list').fetchone()[2]
+        _db.close()
+        _db = None
+    if remove and path:
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(path + suffix)
+            except OSError:
+                pass
+
+
+def is_open():
+    return _db is not None
+
+
+def finished_row(index, value):
+    """The row a previous attempt finished for this line, or None."""
+    global resumed_rows
+    if _db is None:
+        return None
+    with _lock:
+        row = _db.execute('SELECT row FROM lines WHERE idx = ? AND value = ?', (index, value)).fetchone()
+    if row is None:
+        return None
+    resumed_rows += 1
+    return row[0]
+
+
+def finish_row(index, value, row):
+    if _db is None:
+        return
+    with _lock:
+        _db.execute('INSERT OR REPLACE INTO lines VALUES (?, ?, ?)', (index, value, row))
+        # the line's lookups are not needed any more
+        _db.execute('DELETE FROM lookups WHERE idx = ?', (index,))
+        _db.commit()
+
+
+def lookup(index, value, step, site):
+    """The saved result of one site lookup ('search', 'fetch' or 'primary') for a line, or MISSING."""
+    global resumed_lookups
+    if _db is None:
+        return MISSING
+    with _lock:
+        row = _db.execute('SELECT result FROM lookups WHERE idx = ? AND value = ? AND step = ? AND site = ?',
+                          (index, value, step, site)).fetchone()
+    if row is None:
+        return MISSING
+    resumed_lookups += 1
+    return json.loads(row[0])
+
+
+def store(index, value, step, site, result):
+    if _db is None:
+        return
+    with _lock:
+        _db.execute('INSERT OR REPLACE INTO lookups VALUES (?, ?, ?, ?, ?)',
+                    (index, value, step, site, json.dumps(result, ensure_ascii=False)))
+        _db.commit()
@@ -1,125 +1,139 @@
-import requests
-from bs4 import BeautifulSoup
+import aio
+import singleflight
+import metrics
+import sitespec
+import urllib.parse
+import json
 import re
 
+# Try the product JSON API (/api/=/product.json) before scraping the work page (search.py --api).
+# Off by default: the JSON has no イベント名, which the page gives from its icon_EVT label.
+USE_API = False
 
-def extract_product_info(product_url):
+PRODUCT_ID = re.compile(r'/product_id/([A-Z]{2}\d+)')
+
+
+# Extraction rules (see sitespec.py), in priority order
+SPEC = sitespec.compile_spec([
+    # 1) H1 with itemprop/name, e.g. <h1 itemprop="name" id="work_name">Title</h1>, then less strict matches
+    {'tag': 'h1', 'attrs': {'itemprop': 'name', 'id': 'work_name'}, 'fields': {'作品名': 0}},
+    {'tag': 'h1', 'attrs': {'itemprop': 'name'}, 'fields': {'作品名': 0}},
+    {'tag': 'h1', 'attrs': {'id': 'work_name'}, 'fields': {'作品名': 0}},
+    {'tag': 'h1', 'fields': {'作品名': 0}},
+    # 2) og:title as a fallback (may contain circle info): "作品名（サークル名）...", "作品名 / サークル名"
+    {'meta': 'og:title', 'pattern': r'^(.*?)（(.*?)）', 'fields': {'作品名': 1, 'サークル名': 2}},
+    {'meta': 'og:title', 'pattern': r'^(.*?)\s*[/-]\s*(.*?)$', 'fields': {'作品名': 1, 'サークル名': 2}},
+    {'meta': 'og:title', 'fields': {'作品名': 0}},
+    # the explicit maker span wins over og:title: <span itemprop="brand" class="maker_name"> <a>Circle</a> </span>
+    {'tag': 'span', 'attrs': {'itemprop': 'brand', 'class': 'maker_name'}, 'prefer': 'a', 'override': True,
+     'fields': {'サークル名': 0}},
+    # a circle/maker link anywhere
+    {'tag': 'a', 'attrs': {'href': re.compile(r'/maker/')}, 'fields': {'サークル名': 0}},
+    # author: <th>作者</th><td><a>Author</a></td>, or itemprop="author"
+    {'label': ('th', r'作者|著者'), 'next': 'td', 'prefer': 'a', 'fields': {'作家名': 0}},
+    {'tag': True, 'attrs': {'itemprop': 'author'}, 'fields': {'作家名': 0}},
+    # release date: the element after the one holding 発売日/販売日/登録日
+    {'string': r'発売日|販売日|登録日', 'next': True, 'fields': {'発売日': 0}},
+    # event: <span class="icon_EVT" title="..."> <a>イベント名</a> </span>; 'コミックマーケット107' -> 'C107'
+    {'tag': 'span', 'attrs': {'class': re.compile(r'icon_EVT')}, 'find': 'a', 'fields': {'イベント名': 0},
+     'replace': [('コミックマーケット', 'C')]},
+    {'tag': 'span', 'attrs': {'class': re.compile(r'icon_EVT')}, 'attr': 'title', 'fields': {'イベント名': 0},
+     'replace': [('コミックマーケット', 'C')]},
+    {'tag': 'span', 'attrs': {'class': re.compile(r'icon_EVT')}, 'fields': {'イベント名': 0},
+     'replace': [('コミックマーケット', 'C')]},
+])
+
+# Creator roles in the API's "creaters", in the order the page's 作者 row would list them
+API_AUTHOR_ROLES = ['created_by', 'scenario_by', 'illust_by']
+
+
+@singleflight.coalesced('extract:dlsite')
+async def extract_product_info_async(product_url):
     """Extract basic product metadata from a DLsite product page.
 
     Returns a dict with the same keys as other site modules:
     {'作品名','サークル名','作家名','発売日','イベント名'}
     """
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
+    if USE_API:
+        info = await _extract_from_api(product_url)
+        if info:
+            return info
+
     try:
-        resp = requests.get(product_url, headers=headers, timeout=10)
+        resp = await aio.get(product_url, timeout=10)
         resp.raise_for_status()
     except Exception:
         raise
+    return parse_product_page(resp.content)
+
+
+def api_url(product_url):
+    """Product JSON for a work URL in the same section: .../maniax/work/=/product_id/RJ123456.html ->
+    .../maniax/api/=/product.json?workno=RJ123456. None if the URL is not a work page.
+    """
+    parts = urllib.parse.urlsplit(product_url)
+    m = PRODUCT_ID.search(parts.path)
+    if not m or '/work/' not in parts.path:
+        return None
+    section = parts.path.split('/work/')[0]
+    return urllib.parse.urlunsplit((parts.scheme, parts.netloc, f"{section}/api/=/product.json",
+                                    f"workno={m.group(1)}", ''))
 
-    soup = BeautifulSoup(resp.content, 'html.parser')
 
-    title = None
-    circle = None
+async def _extract_from_api(product_url):
+    # None on any failure so the caller falls back to the work page
+    url = api_url(product_url)
+    if not url:
+        return None
+    try:
+        resp = await aio.get(url, timeout=10)
+        if resp.status_code != 200:
+            return None
+        return parse_api_payload(resp.content)
+    except Exception:
+        return None
+
+
+def parse_api_payload(content):
+    """Map a product.json response (str or bytes, a list with one work) into the common info dict.
+
+    Returns None if it holds no work. The API has no event field, so イベント名 stays empty.
+    """
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return None
+    if isinstance(data, list):
+        data = data[0] if data else None
+    if not isinstance(data, dict) or not data.get('work_name'):
+        return None
     author = None
+    creaters = data.get('creaters') if isinstance(data.get('creaters'), dict) else {}
+    for role in API_AUTHOR_ROLES:
+        names = [c.get('name') for c in creaters.get(role) or [] if isinstance(c, dict) and c.get('name')]
+        if names:
+            # the page's 作者 row gives its first link
+            author = names[0].strip()
+            break
+    # "2024-01-02 00:00:00" -> "2024年01月02日" as on the work page
     release_date = None
-    event_name = None
-
-    # 1) Prefer H1 with itemprop/name for DLsite pages, e.g. <h1 itemprop="name" id="work_name">Title</h1>
-    h1 = soup.find('h1', attrs={'itemprop': 'name', 'id': 'work_name'})
-    if not h1:
-        # try less strict matches
-        h1 = soup.find('h1', attrs={'itemprop': 'name'}) or soup.find('h1', id='work_name') or soup.find('h1')
-    if h1:
-        title = h1.get_text(strip=True)
-
-    # 2) Try og:title as a fallback (may contain circle info)
-    meta_title = soup.find('meta', attrs={'property': 'og:title'})
-    if meta_title and meta_title.get('content'):
-        content = meta_title['content']
-        # common patterns: "作品名（サークル名）...", "作品名 / サークル名"
-        m = re.search(r'^(.*?)（(.*?)）', content)
-        if m:
-            # only set title if missing; always prefer h1-derived title
-            if not title:
-                title = m.group(1).strip()
-            if not circle:
-                circle = m.group(2).strip()
-        else:
-            m2 = re.search(r'^(.*?)\s*[/-]\s*(.*?)$', content)
-            if m2:
-                if not title:
-                    title = m2.group(1).strip()
-                if not circle:
-                    circle = m2.group(2).strip()
-            else:
-                if not title:
-                    title = content.strip()
-
-    # First try the explicit maker span used on DLsite pages: <span itemprop="brand" class="maker_name"> <a>Circle</a> </span>
-    circle_span = soup.find('span', attrs={'itemprop': 'brand', 'class': 'maker_name'})
-    if circle_span:
-        a = circle_span.find('a')
-        if a and a.get_text(strip=True):
-            circle = a.get_text(strip=True)
-        else:
-            circle = circle_span.get_text(strip=True)
-
-    # Fallback: try to find a circle/maker link anywhere
-    if not circle:
-        circle_link = soup.find('a', href=re.compile(r'/maker/'))
-        if circle_link and circle_link.get_text(strip=True):
-            circle = circle_link.get_text(strip=True)
-
-    # Try to extract author: DLsite pages often have a table row like <th>作者</th><td><a>Author</a></td>
-    author_th = soup.find('th', string=re.compile(r'作者|著者'))
-    if author_th:
-        td = author_th.find_next_sibling('td')
-        if td:
-            a = td.find('a')
-            if a and a.get_text(strip=True):
-                author = a.get_text(strip=True)
-            else:
-                author = td.get_text(strip=True)
-
-    # Fallback: some pages use itemprop="author"
-    if not author:
-        author_tag = soup.find(attrs={'itemprop': 'author'})
-        if author_tag and author_tag.get_text(strip=True):
-            author = author_tag.get_text(strip=True)
-
-    # Try to locate release date: look for nodes containing 発売日/販売日/登録日
-    date_label = soup.find(text=re.compile(r'発売日|販売日|登録日'))
-    if date_label:
-        # sometimes label is in a dt/th and value is next sibling
-        parent = date_label.parent
-        if parent:
-            sibling = parent.find_next_sibling()
-            if sibling:
-                date_text = sibling.get_text(strip=True)
-                if date_text:
-                    release_date = date_text
-
-    # Try to extract event name: DLsite often uses <span class="icon_EVT" title="..."> <a>イベント名</a> </span>
-    evt_span = soup.find('span', class_=re.compile(r'icon_EVT'))
-    if evt_span:
-        a = evt_span.find('a')
-        evt_text = None
-        if a and a.get_text(strip=True):
-            evt_text = a.get_text(strip=True)
-        else:
-            evt_text = evt_span.get('title') or (evt_span.get_text(strip=True) if evt_span.get_text(strip=True) else None)
-        if evt_text:
-            # Normalize: shorten 'コミックマーケット' to 'C' (e.g., 'コミックマーケット107' -> 'C107')
-            evt_text = evt_text.replace('コミックマーケット', 'C')
-            event_name = evt_text
-
-    # If nothing found, leave fields as None
+    m = re.match(r'(\d{4})-(\d{2})-(\d{2})', data.get('regist_date') or '')
+    if m:
+        release_date = f"{m.group(1)}年{m.group(2)}月{m.group(3)}日"
     return {
-        '作品名': title,
-        'サークル名': circle,
+        '作品名': data['work_name'].strip(),
+        'サークル名': (data.get('maker_name') or '').strip() or None,
         '作家名': author,
         '発売日': release_date,
-        'イベント名': event_name
+        'イベント名': None
     }
+
+
+@metrics.timed('parse', 'dlsite')
+def parse_product_page(content):
+    """Parse a fetched DLsite product page (bytes or str) into the common info dict."""
+    return sitespec.extract(SPEC, content)
+
+
+def extract_product_info(product_url):
+    return aio.run(extract_product_info_async(product_url))
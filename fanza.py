@@ -1,17 +1,22 @@
-import requests
-from bs4 import BeautifulSoup
+import aio
+import singleflight
+import htmlparse
+import metrics
+import structured
+from bs4 import CData, NavigableString
 import re
 import urllib.parse
 
 
-def _maybe_follow_age_check(session, response, original_url):
+async def _maybe_follow_age_check(response, original_url):
     """If the response is an age check page, try to follow the 'はい' / declared=yes link and re-fetch original_url.
     Returns the new response object (may be the same if no action taken).
     """
     try:
-        soup = BeautifulSoup(response.text, 'html.parser')
-        # detect age-check by URL or by page text/title
-        if '/age_check/' in response.url or any(k in response.text for k in ['年齢認証', '年齢確認', '18歳']):
+        soup = htmlparse.make_soup(response.text)
+        # detect age-check by URL or by page text/title; once the age_check_done cookie is held, only by URL
+        if '/age_check/' in response.url or (not aio.has_cookie('age_check_done', '.dmm.co.jp')
+                                             and any(k in response.text for k in ['年齢認証', '年齢確認', '18歳'])):
             yes_link = None
             for a in soup.find_all('a', href=True):
                 href = a['href']
@@ -21,12 +26,12 @@ def _maybe_follow_age_check(session, response, original_url):
                     break
             if yes_link:
                 try:
-                    session.get(yes_link, timeout=10)
+                    await aio.get(yes_link, timeout=10, cache=False)
                 except Exception:
                     pass
                 # re-fetch original product URL
                 try:
-                    new_resp = session.get(original_url, timeout=10)
+                    new_resp = await aio.get(original_url, timeout=10, refresh=True)
                     return new_resp
                 except Exception:
                     return response
@@ -35,85 +40,120 @@ def _maybe_follow_age_check(session, response, original_url):
         return response
 
 
-def extract_product_info(product_url):
+@singleflight.coalesced('extract:fanza')
+async def extract_product_info_async(product_url):
     """Extract basic product metadata from a FANZA (DMM) product detail page.
 
     Returns dict with keys: {'作品名','サークル名','作家名','発売日','イベント名'}
     Event is not attempted per request.
     """
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    session = requests.Session()
-    session.headers.update(headers)
-
     try:
-        resp = session.get(product_url, timeout=10)
+        resp = await aio.get(product_url, timeout=10)
         resp.raise_for_status()
     except Exception:
         raise
 
     # If this is an age check page, follow the flow and re-fetch
-    resp = _maybe_follow_age_check(session, resp, product_url)
+    resp = await _maybe_follow_age_check(resp, product_url)
+    return parse_product_page(resp.content, resp.encoding)
+
+
+# Labels whose following element (or "label: value" text) holds the author / circle, in priority order
+LABELS = ['作者', 'サークル', 'サークル名', 'ブランド', 'メーカー']
+MAKER_HREF = re.compile(r'/maker/|/circle/|/company/|/brand/')
+_HIGH_CHARS = re.compile('[\u0800-\U0010ffff]')
+
 
-    # Ensure we have a text string. Some DMM pages are mis-labeled or contain Shift_JIS/cp932 bytes
-    b = resp.content
+# What a response reports when the server declared no charset (the HTTP default requests/aiohttp fall back to)
+_UNDECLARED_CHARSETS = {'', 'iso-8859-1', 'latin-1', 'latin1'}
+
+
+def _decode(b, encoding):
+    """Decode the page once with the declared charset; fall back to cp932 only if the result looks garbled.
+
+    Without a declared charset the page is tried as strict UTF-8 first, so a UTF-8 page is never read as Latin-1.
+    """
+    if (encoding or '').lower() in _UNDECLARED_CHARSETS:
+        try:
+            return b.decode('utf-8')
+        except UnicodeDecodeError:
+            encoding = None
+    # Some DMM pages are mis-labeled or contain Shift_JIS/cp932 bytes
     try:
-        text = b.decode(resp.encoding or 'utf-8', errors='replace')
+        text = b.decode(encoding or 'utf-8', errors='replace')
     except Exception:
-        text = resp.text
+        text = b.decode('utf-8', errors='replace')
+    # Garbled: many replacement chars, or more than 30% of the characters above U+07FF
+    # (counted with a regex instead of a Python loop; ASCII-only pages skip the count)
+    if text.count('\ufffd') > 2 or (text and not text.isascii()
+                                    and (len(text) - len(_HIGH_CHARS.sub('', text))) / len(text) > 0.3):
+        text = b.decode('cp932', errors='replace')
+    return text
 
-    # If text looks garbled (many replacement chars), try cp932/shift_jis
-    if text.count('\ufffd') > 2 or (len(text) > 0 and sum(1 for c in text if ord(c) > 0x7ff) / max(1, len(text)) > 0.3):
-        try:
-            text = b.decode('cp932', errors='replace')
-        except Exception:
-            try:
-                text = b.decode('shift_jis', errors='replace')
-            except Exception:
-                pass
 
-    soup = BeautifulSoup(text, 'html.parser')
+def _walk(soup):
+    """Collect everything the extraction looks at in one pass over the tree.
 
-    title = None
-    circle = None
-    author = None
-    release_date = None
-    event_name = None
+    Same matches as the separate find()/find_all()/get_text() calls: first og:title meta, h1, title,
+    circle anchor and maker link, every string containing each label (any string type, like
+    find_all(text=...)) and the stripped text strings get_text() would join.
+    """
+    text_types = getattr(soup, 'interesting_string_types', (NavigableString, CData))
+    found = {'og_title': None, 'h1': None, 'title': None, 'circle_a': None, 'maker': None,
+             'labels': {label: [] for label in LABELS}, 'strings': []}
+    for el in soup.descendants:
+        if isinstance(el, NavigableString):
+            for label in LABELS:
+                if label in el:
+                    found['labels'][label].append(el)
+            if type(el) in text_types:
+                s = el.strip()
+                if s:
+                    found['strings'].append(s)
+            continue
+        name = el.name
+        if name == 'meta':
+            if found['og_title'] is None and el.get('property') == 'og:title':
+                found['og_title'] = el
+        elif name == 'h1':
+            if found['h1'] is None:
+                found['h1'] = el
+        elif name == 'title':
+            if found['title'] is None:
+                found['title'] = el
+        elif name == 'a':
+            if found['circle_a'] is None and 'circleName__txt' in el.get_attribute_list('class'):
+                found['circle_a'] = el
+            if found['maker'] is None and el.string is not None and MAKER_HREF.search(el.get('href') or ''):
+                found['maker'] = el
+    return found
 
-    # 1) Try JSON-LD structured data
+
+@metrics.timed('parse', 'fanza')
+def parse_product_page(content, encoding=None):
+    """Parse a FANZA product page from its raw bytes; encoding is the charset the server declared, if any."""
+    b = content
+    text = _decode(b, encoding)
+    soup = htmlparse.make_soup(text)
+    found = _walk(soup)
+
+    # 1) Structured data (JSON-LD / microdata): whatever it answers skips the text heuristics below
     try:
-        for script in soup.find_all('script', type='application/ld+json'):
-            try:
-                j = script.string
-                if not j:
-                    continue
-                # simple look for datePublished or name or author in JSON-LD string
-                m_name = re.search(r'"name"\s*:\s*"([^"]+)"', j)
-                if m_name and not title:
-                    title = m_name.group(1).strip()
-                m_date = re.search(r'"datePublished"\s*:\s*"([^"]+)"', j)
-                if m_date and not release_date:
-                    release_date = m_date.group(1).strip()
-                m_author = re.search(r'"author"\s*:\s*\{[^}]*"name"\s*:\s*"([^"]+)"', j)
-                if m_author and not author:
-                    author = m_author.group(1).strip()
-                if title and (release_date or author):
-                    break
-            except Exception:
-                continue
+        fields, _ = structured.extract(soup)
     except Exception:
-        pass
+        fields = dict.fromkeys(structured.FIELD_PROPS)
+    title = fields['作品名']
+    circle = None
+    author = fields['作家名']
+    release_date = fields['発売日']
+    event_name = None
 
-    # 2) Try extracting raw <title> bytes from the original content first - this reliably contains the product name
+    # 2) Try extracting the raw <title> from the page source first - this reliably contains the product name
+    # (taken from the decoded text so cp932 pages give the same title as UTF-8 ones)
     try:
-        m = re.search(rb'<title>(.*?)</title>', resp.content, flags=re.I | re.S)
+        m = re.search(r'<title>(.*?)</title>', text, flags=re.I | re.S)
         if m:
-            raw = m.group(1)
-            try:
-                raw_txt = raw.decode('utf-8', errors='replace')
-            except Exception:
-                raw_txt = raw.decode('cp932', errors='replace')
+            raw_txt = m.group(1)
             # prefer parenthetical title: "FullName (Title) - FANZA"
             p = re.search(r'[（\(]([^）\)]{1,200})[）\)]', raw_txt)
             if p:
@@ -125,81 +165,78 @@ def extract_product_info(product_url):
 
     # 3) Try meta og:title if still missing
     if not title:
-        og = soup.find('meta', property='og:title')
+        og = found['og_title']
         if og and og.get('content'):
             title = og['content'].strip()
 
     # 3) Try h1 or title tag
     if not title:
-        h1 = soup.find('h1')
+        h1 = found['h1']
         if h1 and h1.get_text(strip=True):
             title = h1.get_text(strip=True)
     if not title:
-        if soup.title and soup.title.get_text(strip=True):
-            title = soup.title.get_text(strip=True)
+        if found['title'] and found['title'].get_text(strip=True):
+            title = found['title'].get_text(strip=True)
 
     # 3.5) FANZA uses a specific anchor class for circle links on product pages
-    try:
-        a_circle = soup.find('a', class_='circleName__txt')
-        if a_circle and a_circle.get_text(strip=True):
-            circle = a_circle.get_text(strip=True)
-    except Exception:
-        pass
+    a_circle = found['circle_a']
+    if a_circle and a_circle.get_text(strip=True):
+        circle = a_circle.get_text(strip=True)
+    if not circle:
+        circle = fields['サークル名']
 
     # 4) Extract author/circle: look for table rows or labels
-    try:
-        # look for labels like '作者' or 'サークル' and take next sibling
-        for label in ['作者', 'サークル', 'サークル名', 'ブランド', 'メーカー']:
-            # find element with the label text
-            elems = soup.find_all(text=re.compile(label))
-            for e in elems:
-                parent = e.parent
-                # try next sibling
-                sib = parent.find_next_sibling()
-                if sib and sib.get_text(strip=True):
-                    v = sib.get_text(strip=True)
-                    # heuristic: if contains author-like characters, assign
-                    if label in ['作者']:
-                        author = v
-                        break
-                    else:
-                        # only overwrite circle if we haven't already extracted it from anchor
-                        if not circle:
-                            circle = v
-                        # sometimes author is also present in v separated by '/'
-                        # if pattern like "circle / author"
-                        if '/' in v and not author:
-                            parts = [p.strip() for p in v.split('/')]
-                            if len(parts) >= 2:
-                                if not circle:
-                                    circle = parts[0]
-                                author = parts[1]
+    if not (author and circle):
+        try:
+            # look for labels like '作者' or 'サークル' and take next sibling
+            for label in LABELS:
+                for e in found['labels'][label]:
+                    parent = e.parent
+                    # try next sibling
+                    sib = parent.find_next_sibling()
+                    if sib and sib.get_text(strip=True):
+                        v = sib.get_text(strip=True)
+                        if label in ['作者']:
+                            author = v
+                            break
+                        else:
+                            # only overwrite circle if we haven't already extracted it from anchor
+                            if not circle:
+                                circle = v
+                            # sometimes author is also present in v separated by '/'
+                            # if pattern like "circle / author"
+                            if '/' in v and not author:
+                                parts = [p.strip() for p in v.split('/')]
+                                if len(parts) >= 2:
+                                    author = parts[1]
+                            break
+                    # sometimes the label and value are separated by ':' in the same string
+                    s = e.strip()
+                    m = re.search(rf'{label}\s*[:：]\s*(.+)', s)
+                    if m:
+                        v = m.group(1).strip()
+                        if label == '作者':
+                            author = v
+                        else:
+                            if not circle:
+                                circle = v
                         break
-                # sometimes the label and value are separated by ':' in the same string
-                s = e.strip()
-                m = re.search(rf'{label}\s*[:：]\s*(.+)', s)
-                if m:
-                    v = m.group(1).strip()
-                    if label == '作者':
-                        author = v
-                    else:
-                        if not circle:
-                            circle = v
+                if author and circle:
                     break
-            if author and circle:
-                break
-    except Exception:
-        pass
+        except Exception:
+            pass
+    # structured data's author stands over a label on the page
+    author = fields['作家名'] or author
 
     # 5) Fallback: try to find a maker link
     if not circle:
-        maker = soup.find('a', href=re.compile(r'/maker/|/circle/|/company/|/brand/'), text=True)
+        maker = found['maker']
         if maker:
             circle = maker.get_text(strip=True)
 
-    # 6) Release date: search for nearby labels and date patterns
-    try:
-        text_all = soup.get_text(separator=' ', strip=True)
+    # 6) Release date (unless structured data gave one): search for nearby labels and date patterns
+    if not release_date:
+        text_all = ' '.join(found['strings'])
         # common patterns: 2025/12/28 00:00 or 2025年12月28日 00:00
         m = re.search(r'(20\d{2}[年/.-]\s?\d{1,2}[月/.-]\s?\d{1,2}日?\s*(?:\d{2}:\d{2})?)', text_all)
         if not m:
@@ -211,21 +248,16 @@ def extract_product_info(product_url):
             m2 = re.search(r'配信開始日\s*[:：]?\s*([0-9０-９年/月\-\.\s:：]+)', text_all)
             if m2:
                 release_date = m2.group(1).strip()
-    except Exception:
-        pass
 
     # Clean up release_date: normalize full-width digits to ASCII and pad times if missing
-    try:
-        if release_date:
-            # convert full-width digits
-            trans = str.maketrans('０１２３４５６７８９', '0123456789')
-            release_date = release_date.translate(trans)
-            release_date = release_date.replace('年', '/').replace('月', '/').replace('日', '').replace('.', '/').replace('-', '/').strip()
-            # ensure time exists: if only date, add '00:00'
-            if re.match(r'^\d{4}/\d{1,2}/\d{1,2}$', release_date):
-                release_date = release_date + ' 00:00'
-    except Exception:
-        pass
+    if release_date:
+        # convert full-width digits
+        trans = str.maketrans('０１２３４５６７８９', '0123456789')
+        release_date = release_date.translate(trans)
+        release_date = release_date.replace('年', '/').replace('月', '/').replace('日', '').replace('.', '/').replace('-', '/').strip()
+        # ensure time exists: if only date, add '00:00'
+        if re.match(r'^\d{4}/\d{1,2}/\d{1,2}$', release_date):
+            release_date = release_date + ' 00:00'
 
     # If author not found but title contains parentheses with author, attempt extraction such as 'タイトル（作者）'
     if not author and title:
@@ -242,3 +274,7 @@ def extract_product_info(product_url):
         '発売日': release_date,
         'イベント名': event_name
     }
+
+
+def extract_product_info(product_url):
+    return aio.run(extract_product_info_async(product_url))
@@ -1,9 +1,102 @@
 import requests
-from bs4 import BeautifulSoup
+import aio
+import memo
+import metrics
+import singleflight
+import htmlparse
 import urllib.parse
 import re
 
-def get_first_search_url_from_melonbooks(query):
+# 検索結果の1件（カード・行）から拾える項目と、その要素を探すときの class 名の手がかり
+ENTRY_FIELD_CLASSES = {
+    'サークル名': ('circle', 'maker', 'shop', 'brand'),
+    '作家名': ('author', 'writer', 'artist'),
+    '発売日': ('date', 'release', 'sales'),
+}
+
+
+# 検索結果ページの商品リンクの href
+SEARCH_LINKS = {
+    'melonbooks': re.compile(r'detail\.php\?product_id='),
+    'dlsite': re.compile(r'https://www.dlsite.com/maniax/work/=/product_id/'),
+    'toranoana': re.compile(r'https://ec.toranoana.jp/tora_r/ec/item/'),
+    'toranoana_joshi': re.compile(r'https://ec.toranoana.jp/joshi_r/ec/item/'),
+    'booth': re.compile(r'/ja/items/|booth\.pm/.*/items/'),
+    'fanza': re.compile(r'/detail/'),
+}
+
+
+def _is_entry(name, classes):
+    """検索結果の1件分になりうる要素（li/tr やカード状の div）か。classes は空白区切りの class 属性。"""
+    if name in ('li', 'tr', 'article'):
+        return True
+    return name in ('div', 'dl') and any(k in classes for k in ('item', 'product', 'work', 'card'))
+
+
+def _entry_container(link_elem):
+    """検索結果の商品リンクを含む1件分の要素（li/tr やカード状の div）を返す。"""
+    return link_elem.find_parent(lambda tag: _is_entry(tag.name, ' '.join(tag.get('class') or [])))
+
+
+def _results_filter(is_link):
+    """商品リンクと、それを囲む1件分の要素だけを木にする解析フィルタ（_search_entry_info 用に1件分は丸ごと残す）。"""
+    return htmlparse.TagFilter(lambda name, attrs: _is_entry(name, attrs.get('class', ''))
+                               or (name == 'a' and is_link(attrs)))
+
+
+def _href_filter(site):
+    return _results_filter(lambda attrs: SEARCH_LINKS[site].search(attrs.get('href', '')) is not None)
+
+
+# サイトごとの検索結果ページの解析フィルタ。ヘッダ・メニュー・スクリプトなど使わない部分は木を作らずに読み飛ばす
+SEARCH_FILTERS = {
+    'melonbooks': _href_filter('melonbooks'),
+    'dlsite': _href_filter('dlsite'),
+    'toranoana': _href_filter('toranoana'),
+    'toranoana_joshi': _href_filter('toranoana_joshi'),
+    'booth': _results_filter(lambda attrs: attrs.get('data-tracking') == 'click_item'
+                             or SEARCH_LINKS['booth'].search(attrs.get('href', '')) is not None),
+    'fanza': _href_filter('fanza'),
+    # 1件ずつ div.item_box に入っていて、リンクもその中から探す
+    'alicebooks': htmlparse.TagFilter(lambda name, attrs: name == 'div' and 'item_box' in attrs.get('class', '').split()),
+}
+
+
+def _search_entry_info(link_elem, container=None):
+    """
+    検索結果の1件から作品名・サークル名・作家名・発売日を拾って、各サイトの extract_product_info と同じ形の dict を返す。
+    拾えなかった項目は None のまま（詳細ページで補う）。
+    """
+    info = {'作品名': None, 'サークル名': None, '作家名': None, '発売日': None, 'イベント名': None}
+    info['作品名'] = link_elem.get_text(strip=True) or link_elem.get('title') or None
+    container = container or _entry_container(link_elem)
+    if container is None:
+        return info
+    for field, keys in ENTRY_FIELD_CLASSES.items():
+        elem = container.find(lambda t: t is not link_elem and any(k in ' '.join(t.get('class') or []).lower() for k in keys))
+        if elem is None:
+            continue
+        text = elem.get_text(' ', strip=True)
+        # 「サークル名：〇〇」のようなラベルを落とす
+        text = re.sub(r'^[^:：]{1,10}[:：]\s*', '', text)
+        if text:
+            info[field] = text
+    return info
+
+
+def _hit(url, link_elem, container=None):
+    """検索でヒットした URL について、結果一覧に載っていた情報を memo に残してから URL を返す。"""
+    try:
+        memo.remember_hit(url, _search_entry_info(link_elem, container))
+    except Exception:
+        pass
+    return url
+
+
+@metrics.timed('search', 'melonbooks')
+@memo.memoized('melonbooks')
+@singleflight.coalesced('search:melonbooks', memo.normalize_query)
+async def get_first_search_url_from_melonbooks_async(query):
     """
     Melonbooksで指定のクエリを検索し、最初の結果のURLを返す。
     複数の結果からクエリとの一致度が高いものを優先する。
@@ -14,21 +107,16 @@ def get_first_search_url_from_melonbooks(query):
     # 検索URLを構築
     search_url = f"https://www.melonbooks.co.jp/search/search.php?mode=search&search_disp=&chara=&orderby=&disp_number=100&pageno=1&is_sp_view=0&name={encoded_query}&text_type=all&fromagee_flg=2&search_target_all=0&additional_all=1&is_end_of_sale%5B%5D=1&is_end_of_sale2=1&sale_date_before=&sale_date_after=&publication_date_before=&publication_date_after=&co_name=&ci_name=&price_low=0&price_high=0"
     
-    # ヘッダーを設定（ボット検知回避）
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    
     try:
         # 検索ページを取得
-        response = requests.get(search_url, headers=headers, timeout=10)
+        response = await aio.get(search_url, timeout=10)
         response.raise_for_status()
         
-        # HTMLを解析
-        soup = BeautifulSoup(response.text, 'html.parser')
+        # HTMLを解析（商品リンクまわりだけ）
+        soup = htmlparse.make_soup(response.text, SEARCH_FILTERS['melonbooks'])
         
         # 複数の商品リンクを取得
-        link_elems = soup.find_all('a', href=re.compile(r'detail\.php\?product_id='))
+        link_elems = soup.find_all('a', href=SEARCH_LINKS['melonbooks'])
         
         if not link_elems:
             return "N/A"
@@ -42,19 +130,25 @@ def get_first_search_url_from_melonbooks(query):
             if query_lower in title or any(word in title for word in query_lower.split()):
                 href = link_elem['href']
                 if href.startswith('/'):
-                    return f"https://www.melonbooks.co.jp{href}"
+                    return _hit(f"https://www.melonbooks.co.jp{href}", link_elem)
                 else:
-                    return href
+                    return _hit(href, link_elem)
         
         # 部分一致がなければ N/A を返す
         return "N/A"
     
+    except aio.TransientError:
+        # リトライしても失敗した場合は「見つからない」(N/A) と区別して呼び出し元に伝える
+        raise
     except requests.RequestException as e:
         return "N/A"
     except Exception as e:
         return "N/A"
     
-def get_first_search_url_from_dlsite(query):
+@metrics.timed('search', 'dlsite')
+@memo.memoized('dlsite')
+@singleflight.coalesced('search:dlsite', memo.normalize_query)
+async def get_first_search_url_from_dlsite_async(query):
     """
     DLsiteで指定のクエリを検索し、最初の結果のURLを返す。
     複数の結果からクエリとの一致度が高いものを優先する。
@@ -65,21 +159,16 @@ def get_first_search_url_from_dlsite(query):
     # 検索URLを構築
     search_url = f"https://www.dlsite.com/maniax/fsr/=/language/jp/sex_category%5B0%5D/male/keyword/{encoded_query}/work_category%5B0%5D/doujin/work_category%5B1%5D/books/work_category%5B2%5D/pc/work_category%5B3%5D/app/order%5B0%5D/trend/options_and_or/and/per_page/30/page/1/from/fs.header"
     
-    # ヘッダーを設定（ボット検知回避）
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    
     try:
         # 検索ページを取得
-        response = requests.get(search_url, headers=headers, timeout=10)
+        response = await aio.get(search_url, timeout=10)
         response.raise_for_status()
         
-        # HTMLを解析
-        soup = BeautifulSoup(response.text, 'html.parser')
+        # HTMLを解析（商品リンクまわりだけ）
+        soup = htmlparse.make_soup(response.text, SEARCH_FILTERS['dlsite'])
         
         # 複数の商品リンクを取得
-        link_elems = soup.find_all('a', href=re.compile(r'https://www.dlsite.com/maniax/work/=/product_id/'))
+        link_elems = soup.find_all('a', href=SEARCH_LINKS['dlsite'])
         
         if not link_elems:
             return "N/A"
@@ -92,17 +181,23 @@ def get_first_search_url_from_dlsite(query):
             title = link_elem.get_text(strip=True).lower()
             if query_lower in title:
                 href = link_elem['href']
-                return href if not href.startswith('/') else f"https://www.dlsite.com{href}"
+                return _hit(href if not href.startswith('/') else f"https://www.dlsite.com{href}", link_elem)
         
         # 完全一致がなければ N/A を返す
         return "N/A"
     
+    except aio.TransientError:
+        # リトライしても失敗した場合は「見つからない」(N/A) と区別して呼び出し元に伝える
+        raise
     except requests.RequestException as e:
         return "N/A"
     except Exception as e:
         return "N/A"
     
-def get_first_search_url_from_toranoana(query):
+@metrics.timed('search', 'toranoana')
+@memo.memoized('toranoana')
+@singleflight.coalesced('search:toranoana', memo.normalize_query)
+async def get_first_search_url_from_toranoana_async(query):
     """
     Toranoanaで指定のクエリを検索し、最初の結果のURLを返す。
     複数の結果からクエリとの一致度が高いものを優先する。
@@ -113,25 +208,20 @@ def get_first_search_url_from_toranoana(query):
     # 検索URLを構築
     search_url = f"https://ec.toranoana.jp/tora_r/ec/app/catalog/list?searchWord={encoded_query}"
     
-    # ヘッダーを設定（ボット検知回避）
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    
     try:
         # 検索ページを取得
-        response = requests.get(search_url, headers=headers, timeout=10)
+        response = await aio.get(search_url, timeout=10)
         response.raise_for_status()
         
-        # HTMLを解析
-        soup = BeautifulSoup(response.text, 'html.parser')
+        # HTMLを解析（商品リンクまわりだけ）
+        soup = htmlparse.make_soup(response.text, SEARCH_FILTERS['toranoana'])
         
         # 複数の商品リンクを取得
-        link_elems = soup.find_all('a', href=re.compile(r'https://ec.toranoana.jp/tora_r/ec/item/'))
+        link_elems = soup.find_all('a', href=SEARCH_LINKS['toranoana'])
         
         if not link_elems:
             # メイン検索が失敗した場合は女子部で試す
-            return get_first_search_url_from_toranoana_joshi(query)
+            return await get_first_search_url_from_toranoana_joshi_async(query)
         
         # クエリと一致するものを探す（小文字で比較）
         query_lower = query.lower()
@@ -141,17 +231,23 @@ def get_first_search_url_from_toranoana(query):
             title = link_elem.get_text(strip=True).lower()
             if query_lower in title or any(word in title for word in query_lower.split()):
                 href = link_elem['href']
-                return href if not href.startswith('/') else f"https://ec.toranoana.jp/tora_r/ec/item/{href}"
+                return _hit(href if not href.startswith('/') else f"https://ec.toranoana.jp/tora_r/ec/item/{href}", link_elem)
         
         # 部分一致がなければ女子部で試す
-        return get_first_search_url_from_toranoana_joshi(query)
+        return await get_first_search_url_from_toranoana_joshi_async(query)
         
+    except aio.TransientError:
+        # リトライしても失敗した場合は「見つからない」(N/A) と区別して呼び出し元に伝える
+        raise
     except requests.RequestException as e:
-        return get_first_search_url_from_toranoana_joshi(query)
+        return await get_first_search_url_from_toranoana_joshi_async(query)
     except Exception as e:
-        return get_first_search_url_from_toranoana_joshi(query)
+        return await get_first_search_url_from_toranoana_joshi_async(query)
     
-def get_first_search_url_from_toranoana_joshi(query):
+@metrics.timed('search', 'toranoana_joshi')
+@memo.memoized('toranoana_joshi')
+@singleflight.coalesced('search:toranoana_joshi', memo.normalize_query)
+async def get_first_search_url_from_toranoana_joshi_async(query):
     """
     Toranoana(女子部)で指定のクエリを検索し、最初の結果のURLを返す。
     複数の結果からクエリとの一致度が高いものを優先する。
@@ -162,21 +258,16 @@ def get_first_search_url_from_toranoana_joshi(query):
     # 検索URLを構築
     search_url = f"https://ec.toranoana.jp/joshi_r/ec/app/catalog/list?searchWord={encoded_query}"
     
-    # ヘッダーを設定（ボット検知回避）
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    
     try:
         # 検索ページを取得
-        response = requests.get(search_url, headers=headers, timeout=10)
+        response = await aio.get(search_url, timeout=10)
         response.raise_for_status()
         
-        # HTMLを解析
-        soup = BeautifulSoup(response.text, 'html.parser')
+        # HTMLを解析（商品リンクまわりだけ）
+        soup = htmlparse.make_soup(response.text, SEARCH_FILTERS['toranoana_joshi'])
         
         # 複数の商品リンクを取得
-        link_elems = soup.find_all('a', href=re.compile(r'https://ec.toranoana.jp/joshi_r/ec/item/'))
+        link_elems = soup.find_all('a', href=SEARCH_LINKS['toranoana_joshi'])
         
         if not link_elems:
             return "N/A"
@@ -189,18 +280,24 @@ def get_first_search_url_from_toranoana_joshi(query):
             title = link_elem.get_text(strip=True).lower()
             if query_lower in title or any(word in title for word in query_lower.split()):
                 href = link_elem['href']
-                return href if not href.startswith('/') else f"https://ec.toranoana.jp/joshi_r/ec/item/{href}"
+                return _hit(href if not href.startswith('/') else f"https://ec.toranoana.jp/joshi_r/ec/item/{href}", link_elem)
         
         # 部分一致がなければ N/A を返す
         return "N/A"
         
+    except aio.TransientError:
+        # リトライしても失敗した場合は「見つからない」(N/A) と区別して呼び出し元に伝える
+        raise
     except requests.RequestException as e:
         return "N/A"
     except Exception as e:
         return "N/A"
 
 
-def get_first_search_url_from_booth(query):
+@metrics.timed('search', 'booth')
+@memo.memoized('booth')
+@singleflight.coalesced('search:booth', memo.normalize_query)
+async def get_first_search_url_from_booth_async(query):
     """
     Boothで指定のクエリを検索し、最初の結果のURLを返す。年齢確認ページが出た場合は「はい」を選択して検索を継続する。
     """
@@ -210,25 +307,23 @@ def get_first_search_url_from_booth(query):
     # Boothの検索URL（adult を含め、在庫有りに絞る）
     search_url = f"https://booth.pm/ja/search/{encoded_query}?adult=include"
 
-    # ヘッダーを設定（ボット検知回避）
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-
-    session = requests.Session()
-    session.headers.update(headers)
-
     try:
         # 検索ページを取得
-        response = session.get(search_url, timeout=10)
+        response = await aio.get(search_url, timeout=10)
         response.raise_for_status()
 
-        soup = BeautifulSoup(response.text, 'html.parser')
-
         # 年齢確認ページが表示されているか判定する（簡易判定）
+        # adult cookie を持っている場合はゲート要素が出たときだけ確認し直す（キーワードは通常ページにも出るため）
         age_keywords = ['年齢確認', '18歳', '18 才', '年齢を確認', 'Are you 18', 'age verification']
         page_text = response.text
-        is_age_page = any(k in page_text for k in age_keywords)
+        keyword_gate = not aio.has_cookie('adult', 'booth.pm') and any(k in page_text for k in age_keywords)
+        if 'js-approve-adult' in page_text or keyword_gate:
+            soup = htmlparse.make_soup(page_text)
+            is_age_page = soup.select_one('.js-approve-adult') is not None or keyword_gate
+        else:
+            # 年齢確認の心配がなければ商品リンクまわりだけ解析する
+            soup = htmlparse.make_soup(page_text, SEARCH_FILTERS['booth'])
+            is_age_page = False
 
         if is_age_page:
             # まずは JS ハンドラ（.js-approve-adult）が存在するか確認。
@@ -236,11 +331,11 @@ def get_first_search_url_from_booth(query):
             # ここでも同様に cookie をセットして再取得すれば同様の挙動を得られる。
             if soup.select_one('.js-approve-adult') is not None:
                 # ドメイン指定で cookie をセット
-                session.cookies.set('adult', 't', domain='booth.pm', path='/')
+                aio.set_cookie('adult', 't', domain='booth.pm', path='/')
                 try:
-                    response = session.get(search_url, timeout=10)
+                    response = await aio.get(search_url, timeout=10, refresh=True)
                     response.raise_for_status()
-                    soup = BeautifulSoup(response.text, 'html.parser')
+                    soup = htmlparse.make_soup(response.text, SEARCH_FILTERS['booth'])
                 except requests.RequestException:
                     return "N/A"
             else:
@@ -302,20 +397,20 @@ def get_first_search_url_from_booth(query):
                                 break
 
                     try:
-                        session.post(action, data=data, timeout=10, headers={'Referer': response.url})
+                        await aio.post(action, data=data, timeout=10, headers={'Referer': response.url})
                     except requests.RequestException:
                         pass
 
                     try:
-                        response = session.get(search_url, timeout=10)
+                        response = await aio.get(search_url, timeout=10, refresh=True)
                         response.raise_for_status()
-                        soup = BeautifulSoup(response.text, 'html.parser')
+                        soup = htmlparse.make_soup(response.text, SEARCH_FILTERS['booth'])
                     except requests.RequestException:
                         return "N/A"
 
         # 年齢確認通過後または最初から確認がない場合、結果の複数のリンクを取得する
         # data-tracking 属性の a タグ優先、なければ /ja/items/ を含む href を探す
-        link_elems = soup.find_all('a', attrs={'data-tracking': 'click_item'}) or soup.find_all('a', href=re.compile(r'/ja/items/|booth\.pm/.*/items/'))
+        link_elems = soup.find_all('a', attrs={'data-tracking': 'click_item'}) or soup.find_all('a', href=SEARCH_LINKS['booth'])
         
         if not link_elems:
             return "N/A"
@@ -329,38 +424,39 @@ def get_first_search_url_from_booth(query):
             if query_lower in title or any(word in title for word in query_lower.split()):
                 href = link_elem['href']
                 full_url = urllib.parse.urljoin('https://booth.pm', href)
-                return full_url
+                return _hit(full_url, link_elem)
         
         # 部分一致がなければ N/A を返す
         return "N/A"
 
+    except aio.TransientError:
+        # リトライしても失敗した場合は「見つからない」(N/A) と区別して呼び出し元に伝える
+        raise
     except requests.RequestException:
         return "N/A"
     except Exception:
         return "N/A"
 
 
-def get_first_search_url_from_fanza(query):
+@metrics.timed('search', 'fanza')
+@memo.memoized('fanza')
+@singleflight.coalesced('search:fanza', memo.normalize_query)
+async def get_first_search_url_from_fanza_async(query):
     """
     FANZA(DMM)で指定のクエリを検索し、最初の結果のURLを返す。年齢確認ページが出た場合は「はい」を選択して検索を継続する。
     """
     encoded_query = urllib.parse.quote(query)
     search_url = f"https://www.dmm.co.jp/dc/doujin/-/list/narrow/=/word={encoded_query}/"
 
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-
-    session = requests.Session()
-    session.headers.update(headers)
-
     try:
-        response = session.get(search_url, timeout=10, allow_redirects=True)
+        response = await aio.get(search_url, timeout=10, allow_redirects=True)
         response.raise_for_status()
 
-        # If redirected to age_check page or content indicates age check, find the 'はい' link and follow it
-        soup = BeautifulSoup(response.text, 'html.parser')
-        if '/age_check/' in response.url or any(k in response.text for k in ['年齢', '18歳', 'Age verification']):
+        # If redirected to age_check page or content indicates age check, find the 'はい' link and follow it.
+        # With the age_check_done cookie in the jar only the redirect counts; the keywords also appear on normal pages.
+        if '/age_check/' in response.url or (not aio.has_cookie('age_check_done', '.dmm.co.jp')
+                                             and any(k in response.text for k in ['年齢', '18歳', 'Age verification'])):
+            soup = htmlparse.make_soup(response.text)
             # prefer an anchor with 'はい' or declared=yes
             yes_link = None
             for a in soup.find_all('a', href=True):
@@ -370,16 +466,19 @@ def get_first_search_url_from_fanza(query):
             if yes_link:
                 yes_link = urllib.parse.urljoin(response.url, yes_link)
                 try:
-                    session.get(yes_link, timeout=10)
+                    await aio.get(yes_link, timeout=10, cache=False)
                 except requests.RequestException:
                     pass
                 # re-fetch the search page (the rurl parameter in the yes link often points back to the listing)
                 try:
-                    response = session.get(search_url, timeout=10)
+                    response = await aio.get(search_url, timeout=10, refresh=True)
                     response.raise_for_status()
-                    soup = BeautifulSoup(response.text, 'html.parser')
+                    soup = htmlparse.make_soup(response.text, SEARCH_FILTERS['fanza'])
                 except requests.RequestException:
                     return "N/A"
+        else:
+            # 商品詳細へのリンクまわりだけ解析する
+            soup = htmlparse.make_soup(response.text, SEARCH_FILTERS['fanza'])
 
         # Now find the product link - prefer links with titles matching the query
         query_lower = query.lower()
@@ -396,26 +495,32 @@ def get_first_search_url_from_fanza(query):
             if p.path.startswith('/dc/doujin/') and '/detail/' in p.path:
                 # collect all detailed product links
                 title = a.get_text(strip=True).lower()
-                matched_links.append((full_href, title))
+                matched_links.append((full_href, title, a))
         
         if not matched_links:
             return "N/A"
         
         # Try to find exact or partial match first
         query_lower = query.lower()
-        for link, title in matched_links:
+        for link, title, a in matched_links:
             if query_lower in title or any(word in title for word in query_lower.split()):
-                return link
+                return _hit(link, a)
         
         # 部分一致がなければ N/A を返す
         return "N/A"
+    except aio.TransientError:
+        # リトライしても失敗した場合は「見つからない」(N/A) と区別して呼び出し元に伝える
+        raise
     except requests.RequestException:
         return "N/A"
     except Exception:
         return "N/A"
 
 
-def get_first_search_url_from_alicebooks(query):
+@metrics.timed('search', 'alicebooks')
+@memo.memoized('alicebooks')
+@singleflight.coalesced('search:alicebooks', memo.normalize_query)
+async def get_first_search_url_from_alicebooks_async(query):
     """
     AliceBooks (alice-books.com) で指定のクエリを検索し、最初の結果のURLを返す。
     複数の結果からクエリとの一致度が高いものを優先する。
@@ -427,19 +532,14 @@ def get_first_search_url_from_alicebooks(query):
     # 検索URLを構築（on_sale パラメータなし = 品切れ含む）
     search_url = f"https://alice-books.com/item/list/all?keyword={encoded_query}"
     
-    # ヘッダーを設定（ボット検知回避）
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    
     try:
         # 検索ページを取得
-        response = requests.get(search_url, headers=headers, timeout=10)
+        response = await aio.get(search_url, timeout=10)
         response.raise_for_status()
         
         # HTMLを解析（エンコーディングを明示的に指定）
         response.encoding = 'utf-8'
-        soup = BeautifulSoup(response.text, 'html.parser')
+        soup = htmlparse.make_soup(response.text, SEARCH_FILTERS['alicebooks'])
         
         # 商品ボックスを取得（item_box は各商品のコンテナ）
         item_boxes = soup.find_all('div', class_='item_box')
@@ -466,14 +566,47 @@ def get_first_search_url_from_alicebooks(query):
             if query_lower in title or any(word in title for word in query_lower.split()):
                 href = link_elem['href']
                 if href.startswith('/'):
-                    return f"https://alice-books.com{href}"
+                    return _hit(f"https://alice-books.com{href}", link_elem, item_box)
                 else:
-                    return href
+                    return _hit(href, link_elem, item_box)
         
         # 部分一致がなければ N/A を返す
         return "N/A"
     
+    except aio.TransientError:
+        # リトライしても失敗した場合は「見つからない」(N/A) と区別して呼び出し元に伝える
+        raise
     except requests.RequestException as e:
         return "N/A"
     except Exception as e:
-        return "N/A"
\ No newline at end of file
+        return "N/A"
+
+
+# 同期版: 既存の呼び出し元向けに共有イベントループ上で非同期版を実行する
+
+def get_first_search_url_from_melonbooks(query):
+    return aio.run(get_first_search_url_from_melonbooks_async(query))
+
+
+def get_first_search_url_from_dlsite(query):
+    return aio.run(get_first_search_url_from_dlsite_async(query))
+
+
+def get_first_search_url_from_toranoana(query):
+    return aio.run(get_first_search_url_from_toranoana_async(query))
+
+
+def get_first_search_url_from_toranoana_joshi(query):
+    return aio.run(get_first_search_url_from_toranoana_joshi_async(query))
+
+
+def get_first_search_url_from_booth(query):
+    return aio.run(get_first_search_url_from_booth_async(query))
+
+
+def get_first_search_url_from_fanza(query):
+    return aio.run(get_first_search_url_from_fanza_async(query))
+
+
+def get_first_search_url_from_alicebooks(query):
+    return aio.run(get_first_search_url_from_alicebooks_async(query))
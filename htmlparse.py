@@ -0,0 +1,145 @@
+import os
+import re
+import sys
+from bs4 import BeautifulSoup, SoupStrainer
+
+# BeautifulSoup tree builders in order of preference. lxml is several times faster than the
+# pure-Python html.parser; it is optional (py -m pip lxml) and html.parser is always there.
+PREFERRED_BACKENDS = ['lxml', 'html.parser']
+
+# Streaming extraction (--stream): product pages are read only until every field's marker has been seen
+STREAMING = False
+
+# Site name -> module with parse_product_page(), for check_backends()
+SITE_MODULES = {
+    'melonbooks': 'melon',
+    'toranoana': 'tora',
+    'dlsite': 'dlsite',
+    'booth': 'booth',
+    'fanza': 'fanza',
+    'alicebooks': 'alicebooks',
+}
+
+
+def available_backends():
+    """Return the installed tree builders, fastest first."""
+    found = []
+    for name in PREFERRED_BACKENDS:
+        try:
+            BeautifulSoup('', name)
+        except Exception:
+            continue
+        found.append(name)
+    return found
+
+
+def _pick_backend():
+    wanted = os.environ.get('SEARCHDOJIN_PARSER')
+    backends = available_backends()
+    if wanted and wanted in backends:
+        return wanted
+    return backends[0] if backends else 'html.parser'
+
+
+BACKEND = _pick_backend()
+
+
+def set_backend(name):
+    """Force a tree builder ('lxml' or 'html.parser'). Raises ValueError if it is not installed."""
+    global BACKEND
+    if name not in available_backends():
+        raise ValueError(f"HTML parser backend not available: {name}")
+    BACKEND = name
+
+
+def make_soup(markup, parse_only=None, backend=None):
+    """Parse markup (str or bytes) with the selected backend. Every site module builds its soup here."""
+    return BeautifulSoup(markup, backend or BACKEND, parse_only=parse_only)
+
+
+def stream_until(markers):
+    """Return a stop_when for aio.get from a site's {field: regex} markers, or None when not streaming.
+
+    Each marker matches once the element that field is parsed from has been received completely,
+    so parse_product_page gives the same result on the prefix as on the whole page.
+    Fields whose marker never matches (missing on the page) simply make the whole body load.
+    """
+    if not STREAMING or not markers:
+        return None
+    # markers are written as text; product pages are matched as UTF-8 bytes
+    patterns = [re.compile(m.encode('utf-8') if isinstance(m, str) else m, re.S) for m in markers.values()]
+
+    def done(body):
+        # drop markers as they match so each chunk only rescans the ones still missing
+        patterns[:] = [p for p in patterns if p.search(body) is None]
+        return not patterns
+    return done
+
+
+class TagFilter(SoupStrainer):
+    """parse_only filter from a keep(name, attrs) predicate: only kept tags (with everything inside them) are built.
+
+    attrs is a plain dict of strings ('class' joined with spaces). Text outside kept tags is dropped.
+    """
+
+    def __init__(self, keep):
+        super().__init__()
+        self.keep = keep
+
+    def _keep(self, name, attrs):
+        attrs = dict(attrs or {})
+        if isinstance(attrs.get('class'), (list, tuple)):
+            attrs['class'] = ' '.join(attrs['class'])
+        return self.keep(name, attrs)
+
+    # bs4 >= 4.13 asks these while parsing
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        return self._keep(name, attrs)
+
+    def allow_string_creation(self, string):
+        return False
+
+    # older bs4 asks this instead
+    def search_tag(self, markup_name=None, markup_attrs={}):
+        if hasattr(markup_name, 'attrs'):
+            markup_name, markup_attrs = markup_name.name, markup_name.attrs
+        return markup_name if self._keep(markup_name, markup_attrs) else None
+
+
+def check_backends(site, paths):
+    """Run site's parse_product_page over saved pages with every installed backend.
+
+    Returns a list of (path, {backend: info}) for pages where the backends disagree.
+    """
+    import importlib
+    module = importlib.import_module(SITE_MODULES[site])
+    global BACKEND
+    original = BACKEND
+    mismatches = []
+    try:
+        for path in paths:
+            with open(path, 'rb') as f:
+                content = f.read()
+            results = {}
+            for name in available_backends():
+                BACKEND = name
+                results[name] = module.parse_product_page(content)
+            if len({repr(r) for r in results.values()}) > 1:
+                mismatches.append((path, results))
+    finally:
+        BACKEND = original
+    return mismatches
+
+
+if __name__ == "__main__":
+    # python htmlparse.py <site> <saved page>... : check that every backend extracts the same fields
+    if len(sys.argv) < 3 or sys.argv[1] not in SITE_MODULES:
+        print(f"Usage: python htmlparse.py <{'|'.join(SITE_MODULES)}> <saved product page>...", file=sys.stderr)
+        sys.exit(1)
+    print(f"backends: {', '.join(available_backends())}", file=sys.stderr)
+    mismatches = check_backends(sys.argv[1], sys.argv[2:])
+    for path, results in mismatches:
+        print(f"MISMATCH {path}")
+        for name, info in results.items():
+            print(f"  {name}: {info}")
+    sys.exit(1 if mismatches else 0)
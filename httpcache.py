@@ -0,0 +1,246 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Default freshness per page type, in seconds. Search pages change as new items list;
+# product pages rarely change once published.
+DEFAULT_TTL = {
+    'search': 6 * 3600,
+    'product': 30 * 24 * 3600,
+    'other': 24 * 3600,
+}
+
+# Per-site overrides, keyed by host suffix: {'booth.pm': {'search': 3600}}
+SITE_TTL = {}
+
+# Size bound of the cache file contents (bodies + headers); least recently used entries go first
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# (host suffix, page type, path/query pattern) — first match wins
+PAGE_TYPES = [
+    ('melonbooks.co.jp', 'search', re.compile(r'/search/')),
+    ('melonbooks.co.jp', 'product', re.compile(r'detail\.php')),
+    ('toranoana.jp', 'search', re.compile(r'/catalog/list')),
+    ('toranoana.jp', 'product', re.compile(r'/ec/item/')),
+    ('dlsite.com', 'search', re.compile(r'/fsr/')),
+    ('dlsite.com', 'product', re.compile(r'/work/|/api/=/product\.json')),
+    ('booth.pm', 'search', re.compile(r'/search/')),
+    ('booth.pm', 'product', re.compile(r'/items/')),
+    ('dmm.co.jp', 'search', re.compile(r'/list/')),
+    ('dmm.co.jp', 'product', re.compile(r'/detail/')),
+    ('alice-books.com', 'search', re.compile(r'/item/list')),
+    ('alice-books.com', 'product', re.compile(r'/item/show|item_id=')),
+]
+
+# Query parameters that never change the page (tracking), dropped from cache keys
+IGNORED_PARAMS = {'srsltid', 'utm_source', 'utm_medium', 'utm_campaign', 'utm_content', 'utm_term'}
+
+# Cache hits update accessed_at (the LRU order) in batches: at most every TOUCH_INTERVAL seconds or
+# TOUCH_BATCH hits, and before anything is evicted, instead of a write and commit per hit
+TOUCH_INTERVAL = 5.0
+TOUCH_BATCH = 256
+
+_db = None
+_lock = threading.Lock()
+_max_bytes = DEFAULT_MAX_BYTES
+# Sum of the size column, kept up to date by store()/invalidate() so eviction needs no full-table scan
+_total = 0
+# key -> time of its last hit, not written yet
+_touched = {}
+_touched_at = 0.0
+
+
+def canonical_url(url):
+    """Normalize a URL into a cache key: lower-case scheme/host, sorted query without tracking params, no fragment."""
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in IGNORED_PARAMS)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', urlencode(query), ''))
+
+
+def page_type(url):
+    """Classify a URL as 'search', 'product' or 'other' for TTL purposes."""
+    parts = urlsplit(url)
+    host = parts.hostname or ''
+    target = parts.path + ('?' + parts.query if parts.query else '')
+    for suffix, kind, pattern in PAGE_TYPES:
+        if host.endswith(suffix) and pattern.search(target):
+            return kind
+    return 'other'
+
+
+def ttl_for(url):
+    """Return the freshness lifetime in seconds for url, honoring SITE_TTL overrides."""
+    kind = page_type(url)
+    host = urlsplit(url).hostname or ''
+    for suffix, ttls in SITE_TTL.items():
+        if host.endswith(suffix) and kind in ttls:
+            return ttls[kind]
+    return DEFAULT_TTL[kind]
+
+
+def configure(search_ttl=None, product_ttl=None, site_ttl=None, max_bytes=None):
+    """Adjust default TTLs (seconds), per-site overrides and the size bound."""
+    global _max_bytes
+    if search_ttl is not None:
+        DEFAULT_TTL['search'] = search_ttl
+    if product_ttl is not None:
+        DEFAULT_TTL['product'] = product_ttl
+    if site_ttl:
+        SITE_TTL.update(site_ttl)
+    if max_bytes is not None:
+        _max_bytes = max_bytes
+
+
+def open_cache(path):
+    """Open (creating if needed) the cache database at path. Lookups return None until this is called."""
+    global _db, _total, _touched_at
+    with _lock:
+        if _db is not None:
+            _flush_touched()
+            _db.close()
+        _db = sqlite3.connect(path, check_same_thread=False)
+        _db.execute('PRAGMA journal_mode=WAL')
+        _db.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            status INTEGER NOT NULL,
+            reason TEXT,
+            headers TEXT NOT NULL,
+            body BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            fetched_at REAL NOT NULL,
+            accessed_at REAL NOT NULL)""")
+        _db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)')
+        _db.commit()
+        _total = _db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        _touched.clear()
+        _touched_at = time.monotonic()
+
+
+def close_cache():
+    global _db
+    with _lock:
+        if _db is not None:
+            _flush_touched()
+            _db.close()
+            _db = None
+
+
+def is_open():
+    return _db is not None
+
+
+def lookup(url):
+    """Return the cached entry for url as a dict (url, status, reason, headers, body, fetched_at), or None."""
+    if _db is None:
+        return None
+    key = canonical_url(url)
+    with _lock:
+        row = _db.execute('SELECT url, status, reason, headers, body, fetched_at FROM responses WHERE key = ?',
+                          (key,)).fetchone()
+        if row is None:
+            return None
+        _touched[key] = time.time()
+        if len(_touched) >= TOUCH_BATCH or time.monotonic() - _touched_at >= TOUCH_INTERVAL:
+            _flush_touched()
+    return {
+        'url': row[0],
+        'status': row[1],
+        'reason': row[2],
+        'headers': json.loads(row[3]),
+        'body': row[4],
+        'fetched_at': row[5],
+        'key_url': url,
+    }
+
+
+def _flush_touched():
+    # write the pending accessed_at updates in one transaction (caller holds _lock)
+    global _touched_at
+    _touched_at = time.monotonic()
+    if not _touched:
+        return
+    _db.executemany('UPDATE responses SET accessed_at = ? WHERE key = ?', [(t, k) for k, t in _touched.items()])
+    _db.commit()
+    _touched.clear()
+
+
+def is_fresh(entry):
+    return time.time() - entry['fetched_at'] < ttl_for(entry['key_url'])
+
+
+def conditional_headers(entry):
+    """Headers for revalidating an expired entry (If-None-Match / If-Modified-Since), possibly empty."""
+    headers = {}
+    h = {k.lower(): v for k, v in entry['headers'].items()}
+    if h.get('etag'):
+        headers['If-None-Match'] = h['etag']
+    if h.get('last-modified'):
+        headers['If-Modified-Since'] = h['last-modified']
+    return headers
+
+
+def mark_fresh(url):
+    """Restart the TTL of url's entry after a 304 Not Modified."""
+    if _db is None:
+        return
+    now = time.time()
+    key = canonical_url(url)
+    with _lock:
+        _db.execute('UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE key = ?', (now, now, key))
+        _touched.pop(key, None)
+        _db.commit()
+
+
+def store(url, status, reason, headers, final_url, body):
+    """Save a response body under url's canonical key and evict old entries past the size bound."""
+    global _total
+    if _db is None:
+        return
+    headers_json = json.dumps(dict(headers), ensure_ascii=False)
+    size = len(body) + len(headers_json)
+    now = time.time()
+    key = canonical_url(url)
+    with _lock:
+        _total -= _size_of(key)
+        _db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (key, final_url, status, reason, headers_json, body, size, now, now))
+        _touched.pop(key, None)
+        _total += size
+        _evict()
+        _db.commit()
+
+
+def _size_of(key):
+    row = _db.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else 0
+
+
+def _evict():
+    global _total
+    if _total <= _max_bytes:
+        return
+    # the LRU order has to include the hits not written yet
+    _flush_touched()
+    # drop least recently used entries until 90% of the bound is left
+    target = _max_bytes * 0.9
+    for key, size in _db.execute('SELECT key, size FROM responses ORDER BY accessed_at').fetchall():
+        if _total <= target:
+            break
+        _db.execute('DELETE FROM responses WHERE key = ?', (key,))
+        _total -= size
+
+
+def invalidate(url):
+    global _total
+    if _db is None:
+        return
+    key = canonical_url(url)
+    with _lock:
+        _total -= _size_of(key)
+        _db.execute('DELETE FROM responses WHERE key = ?', (key,))
+        _touched.pop(key, None)
+        _db.commit()
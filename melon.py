@@ -1,8 +1,8 @@
-import requests
-from bs4 import BeautifulSoup
-import re
-import sys
-import urllib.parse
+import aio
+import singleflight
+import htmlparse
+import metrics
+import sitespec
 from urllib.parse import urlparse, parse_qs, urlunparse
 
 def clean_url(url):
@@ -19,63 +19,40 @@ def clean_url(url):
         return urlunparse(parsed)
     return url
     
-def extract_product_info(product_url):
+# --stream のとき、項目ごとに「ここまで読めば取れる」印（parse_product_page が見る要素の閉じタグまで）
+STREAM_MARKERS = {
+    '作品名': r'<meta[^>]*og:title[^>]*>',
+    'サークル名': r'<meta[^>]*og:title[^>]*>',
+    '作家名': r'<th[^>]*>[^<]*作家名[^<]*</th>.*?</td>',
+    '発売日': r'<th[^>]*>[^<]*発行日[^<]*</th>.*?</td>',
+    'イベント名': r'<th[^>]*>[^<]*イベント[^<]*</th>.*?</td>',
+}
+
+# 商品ページから項目を取る規則（sitespec.py）。作品名・サークル名は og:title、残りは th/td の表から
+SPEC = sitespec.compile_spec([
+    {'meta': 'og:title', 'pattern': r'^(.*?)（(.*?)）の通販・購入はメロンブックス', 'fields': {'作品名': 1, 'サークル名': 2}},
+    {'label': ('th', r'作家名'), 'next': 'td', 'find': 'a', 'fields': {'作家名': 0}},
+    {'label': ('th', r'発行日'), 'next': 'td', 'fields': {'発売日': 0}},
+    {'label': ('th', r'イベント'), 'next': 'td', 'replace': [('コミックマーケット', 'C')], 'fields': {'イベント名': 0}},
+])
+
+@singleflight.coalesced('extract:melonbooks')
+async def extract_product_info_async(product_url):
 
     # URLにパラメータを追加
     modified_url = product_url + '&adult_view=1&nrdp=1'
     
-    # ページを取得
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    response = requests.get(modified_url, headers=headers)
+    # ページを取得（--stream なら必要な項目が揃ったところで読むのをやめる）
+    response = await aio.get(modified_url, timeout=10, stop_when=htmlparse.stream_until(STREAM_MARKERS))
     response.raise_for_status()
-    
-    soup = BeautifulSoup(response.content, 'html.parser')
-    
-    # --- 1. 作品名(meta descriptionから) ---
-    title = None
-    circle = None
-    meta_desc = soup.find('meta', attrs={'property': 'og:title'})
-    if meta_desc and meta_desc.get('content'):
-        content_text = meta_desc['content']
-        match = re.search(r'^(.*?)（(.*?)）の通販・購入はメロンブックス', content_text)
-        if match:
-            title = match.group(1).strip()
-            circle = match.group(2).strip()
-
-    author = None
-    # 作家名
-    author_th = soup.find('th', string=re.compile(r'作家名'))
-    if author_th:
-        author_a = author_th.find_next_sibling('td').find('a')
-        if author_a:
-            author = author_a.get_text(strip=True)
+    return parse_product_page(response.content)
 
-    release_date = None
-    # --- 2. 発売日 ---
-    release_td = soup.find('th', string=re.compile(r'発行日'))
-    if release_td:
-        release_date_text = release_td.find_next_sibling('td').get_text(strip=True)
-        if release_date_text:
-            release_date = release_date_text
 
-    # --- 4. イベント名 [追加] ---
-    event_name = None
-    # まず、指示通り「イベント」<th> を探す
-    event_th = soup.find('th', string=re.compile(r'イベント'))
-    if event_th:
-        event_td = event_th.find_next_sibling('td')
-        if event_td:
-            event_name = event_td.get_text(strip=True)
-            if 'コミックマーケット' in event_name:
-                event_name = str.replace(event_name, 'コミックマーケット', 'C')
+@metrics.timed('parse', 'melonbooks')
+def parse_product_page(content):
+    """Parse a fetched melonbooks product page (bytes or str) into the common info dict."""
+    return sitespec.extract(SPEC, content)
 
-    return {
-        '作品名': title,
-        'サークル名': circle,
-        '作家名': author,
-        '発売日': release_date,
-        'イベント名': event_name
-    }
 
+def extract_product_info(product_url):
+    return aio.run(extract_product_info_async(product_url))
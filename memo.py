@@ -0,0 +1,143 @@
+import functools
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# How long a remembered search answer is trusted, in seconds. A found URL rarely changes;
+# "N/A" is kept shorter because works do show up on a store later.
+HIT_TTL = 30 * 24 * 3600
+MISS_TTL = 24 * 3600
+
+_memory = {}
+# What the search result entry itself said about a hit URL (title/circle/author/date), see google._hit
+_hit_info = {}
+_db = None
+_lock = threading.Lock()
+
+# Searches answered from memory instead of a request
+hits = 0
+
+
+def normalize_query(query):
+    """Normalize a search query for use as a key: NFKC, lower-case, single spaces."""
+    q = unicodedata.normalize('NFKC', query or '')
+    return re.sub(r'\s+', ' ', q).strip().lower()
+
+
+def configure(hit_ttl=None, miss_ttl=None):
+    global HIT_TTL, MISS_TTL
+    if hit_ttl is not None:
+        HIT_TTL = hit_ttl
+    if miss_ttl is not None:
+        MISS_TTL = miss_ttl
+
+
+def open_memo(path):
+    """Persist memoized answers in the SQLite file at path (loaded lazily per key)."""
+    global _db
+    with _lock:
+        if _db is not None:
+            _db.close()
+        _db = sqlite3.connect(path, check_same_thread=False)
+        _db.execute("""CREATE TABLE IF NOT EXISTS searches (
+            site TEXT NOT NULL,
+            query TEXT NOT NULL,
+            result TEXT NOT NULL,
+            stored_at REAL NOT NULL,
+            info TEXT,
+            PRIMARY KEY (site, query))""")
+        try:
+            # files written before the info column existed
+            _db.execute('ALTER TABLE searches ADD COLUMN info TEXT')
+        except sqlite3.OperationalError:
+            pass
+        _db.commit()
+
+
+def close_memo():
+    global _db
+    with _lock:
+        if _db is not None:
+            _db.close()
+            _db = None
+
+
+def _expired(result, stored_at):
+    ttl = HIT_TTL if result.startswith('http') else MISS_TTL
+    return time.time() - stored_at >= ttl
+
+
+def lookup(site, query):
+    """Return the remembered answer for (site, normalized query), or None if unknown or expired."""
+    key = (site, normalize_query(query))
+    hit = _memory.get(key)
+    if hit is None and _db is not None:
+        with _lock:
+            row = _db.execute('SELECT result, stored_at, info FROM searches WHERE site = ? AND query = ?',
+                              key).fetchone()
+        if row is not None:
+            hit = _memory[key] = (row[0], row[1])
+            if row[2] and row[0] not in _hit_info:
+                _hit_info[row[0]] = json.loads(row[2])
+    if hit is None or _expired(*hit):
+        return None
+    return hit[0]
+
+
+def store(site, query, result):
+    """Remember a search answer (a URL or "N/A") in process and, if open, on disk."""
+    if not isinstance(result, str):
+        return
+    key = (site, normalize_query(query))
+    now = time.time()
+    _memory[key] = (result, now)
+    if _db is not None:
+        info = _hit_info.get(result)
+        info_json = json.dumps(info, ensure_ascii=False) if info else None
+        with _lock:
+            _db.execute('INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?, ?)',
+                        (key[0], key[1], result, now, info_json))
+            _db.commit()
+
+
+def remember_hit(url, info):
+    """Record the metadata a search result entry showed for url (kept with the search answer)."""
+    if info and any(info.values()):
+        _hit_info[url] = info
+
+
+def hit_info(url):
+    """Return the search-result metadata recorded for url, or None."""
+    return _hit_info.get(url)
+
+
+def forget(site, query):
+    key = (site, normalize_query(query))
+    _memory.pop(key, None)
+    if _db is not None:
+        with _lock:
+            _db.execute('DELETE FROM searches WHERE site = ? AND query = ?', key)
+            _db.commit()
+
+
+def memoized(site):
+    """Decorator for the async get_first_search_url_from_* helpers: answer repeated queries from memory.
+
+    Exceptions (e.g. aio.TransientError) are not remembered, so failed lookups are retried next time.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(query):
+            global hits
+            hit = lookup(site, query)
+            if hit is not None:
+                hits += 1
+                return hit
+            result = await fn(query)
+            store(site, query, result)
+            return result
+        return wrapper
+    return decorator
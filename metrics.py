@@ -0,0 +1,210 @@
+import contextvars
+import functools
+import inspect
+import json
+import sys
+import time
+import urllib.parse
+
+# Run metrics (--stats / --metrics-json): latencies of search calls, HTTP requests, page parses and pipeline
+# stages, per site and per input line. Nothing is recorded unless ENABLED, so the hooks cost one check otherwise.
+ENABLED = False
+
+# Host suffix -> site name used in the summary
+SITE_NAMES = {
+    'melonbooks.co.jp': 'melonbooks',
+    'toranoana.jp': 'toranoana',
+    'dlsite.com': 'dlsite',
+    'booth.pm': 'booth',
+    'dmm.co.jp': 'fanza',
+    'alice-books.com': 'alicebooks',
+}
+
+# Input line (its index) the running code works for; pipeline stage workers set it per job and tasks
+# started from there inherit it, so requests and parses are attributed to the line that caused them
+current_line = contextvars.ContextVar('current_line', default=None)
+
+_started = time.perf_counter()
+# (kind, name) -> list of seconds; kind is 'search', 'http', 'parse' or 'stage'
+_latencies = {}
+# (kind, name) -> {counter: n}
+_counts = {}
+# line index -> {'value', 'stages': {stage: seconds}, 'requests', 'bytes'}
+_lines = {}
+
+
+def reset():
+    """Forget everything recorded so far and restart the run clock."""
+    global _started
+    _started = time.perf_counter()
+    _latencies.clear()
+    _counts.clear()
+    _lines.clear()
+
+
+def site_of(url):
+    host = urllib.parse.urlsplit(url).hostname or ''
+    for suffix, name in SITE_NAMES.items():
+        if host.endswith(suffix):
+            return name
+    return host or 'other'
+
+
+def _count(kind, name, counter, n=1):
+    c = _counts.setdefault((kind, name), {})
+    c[counter] = c.get(counter, 0) + n
+
+
+def record(kind, name, seconds, outcome=None):
+    """Record one timed call; outcome (e.g. 'na', 'error') is counted next to the call count."""
+    if not ENABLED:
+        return
+    _latencies.setdefault((kind, name), []).append(seconds)
+    _count(kind, name, 'calls')
+    if outcome:
+        _count(kind, name, outcome)
+
+
+def count(kind, name, counter, n=1):
+    if ENABLED:
+        _count(kind, name, counter, n)
+
+
+def line_started(index, value):
+    if ENABLED:
+        _lines[index] = {'value': value, 'stages': {}, 'requests': 0, 'bytes': 0}
+
+
+def stage(name, index, seconds):
+    """Record a pipeline stage's time for one input line."""
+    if not ENABLED:
+        return
+    record('stage', name, seconds)
+    line = _lines.get(index)
+    if line is not None:
+        line['stages'][name] = line['stages'].get(name, 0.0) + seconds
+
+
+def http(url, seconds, source, size):
+    """Record one HTTP request: source is 'network', 'cache' (fresh hit), 'revalidated' (304) or 'failed'
+    (gave up, e.g. aio.TransientError); size is the body length in bytes."""
+    if not ENABLED:
+        return
+    site = site_of(url)
+    record('http', site, seconds)
+    _count('http', site, source)
+    if source == 'network':
+        _count('http', site, 'bytes', size)
+    line = _lines.get(current_line.get())
+    if line is not None:
+        line['requests'] += 1
+        if source == 'network':
+            line['bytes'] += size
+
+
+def _outcome(result):
+    # search helpers answer "N/A" (or None) for "no such work"
+    return 'na' if result is None or result == 'N/A' else None
+
+
+def timed(kind, name):
+    """Decorator recording every call of a sync or async function under (kind, name).
+
+    Calls that raise are counted as 'error', calls returning None / "N/A" as 'na'.
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                if not ENABLED:
+                    return await fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    result = await fn(*args, **kwargs)
+                except BaseException:
+                    record(kind, name, time.perf_counter() - start, 'error')
+                    raise
+                record(kind, name, time.perf_counter() - start, _outcome(result))
+                return result
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not ENABLED:
+                    return fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException:
+                    record(kind, name, time.perf_counter() - start, 'error')
+                    raise
+                record(kind, name, time.perf_counter() - start, _outcome(result))
+                return result
+        return wrapper
+    return decorator
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of values (p in 0-100), None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+def _latency_summary(values):
+    return {f'p{p}_ms': round(percentile(values, p) * 1000, 2) for p in (50, 90, 99)} if values else {}
+
+
+def summary():
+    """Everything recorded, as a JSON-serializable dict."""
+    out = {'elapsed_s': round(time.perf_counter() - _started, 3), 'sites': {}, 'stages': {}, 'lines': []}
+    for (kind, name) in sorted(set(_latencies) | set(_counts)):
+        entry = dict(_counts.get((kind, name), {}))
+        entry.update(_latency_summary(_latencies.get((kind, name))))
+        if kind == 'stage':
+            out['stages'][name] = entry
+        else:
+            out['sites'].setdefault(name, {})[kind] = entry
+    for index in sorted(_lines):
+        line = _lines[index]
+        out['lines'].append({
+            'index': index,
+            'value': line['value'],
+            'stages_ms': {k: round(v * 1000, 2) for k, v in line['stages'].items()},
+            'requests': line['requests'],
+            'bytes': line['bytes'],
+        })
+    return out
+
+
+def _ms(entry, p):
+    v = entry.get(f'p{p}_ms')
+    return '-' if v is None else f"{v:.0f}"
+
+
+def print_summary(file=sys.stderr):
+    """Print the per-site and per-stage tables of the --stats summary."""
+    s = summary()
+    print(f"--- stats: {s['elapsed_s']:.1f}s, {len(s['lines'])} lines ---", file=file)
+    print(f"{'site':16} {'search':>6} {'N/A%':>5} {'err':>4} {'p50/p90/p99 ms':>15}  "
+          f"{'req':>5} {'cache':>5} {'fail':>4} {'MB':>7} {'retry':>5} {'http p50/p90/p99':>16}  {'parse p50/p90':>13}", file=file)
+    for site, kinds in s['sites'].items():
+        se, ht, pa = kinds.get('search', {}), kinds.get('http', {}), kinds.get('parse', {})
+        calls = se.get('calls', 0)
+        na = f"{100 * se.get('na', 0) / calls:.0f}" if calls else '-'
+        print(f"{site:16} {calls:6} {na:>5} {se.get('error', 0):4} "
+              f"{_ms(se, 50) + '/' + _ms(se, 90) + '/' + _ms(se, 99):>15}  "
+              f"{ht.get('calls', 0):5} {ht.get('cache', 0) + ht.get('revalidated', 0):5} {ht.get('failed', 0):4} "
+              f"{ht.get('bytes', 0) / 1e6:7.2f} {ht.get('retries', 0):5} "
+              f"{_ms(ht, 50) + '/' + _ms(ht, 90) + '/' + _ms(ht, 99):>16}  "
+              f"{_ms(pa, 50) + '/' + _ms(pa, 90):>13}", file=file)
+    for name, entry in s['stages'].items():
+        print(f"stage {name:10} {entry.get('calls', 0):6} lines, p50/p90/p99 "
+              f"{_ms(entry, 50)}/{_ms(entry, 90)}/{_ms(entry, 99)} ms", file=file)
+
+
+def dump(path):
+    """Write summary() as JSON to path."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary(), f, ensure_ascii=False, indent=1)
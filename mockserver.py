@@ -0,0 +1,504 @@
+import argparse
+import hashlib
+import html
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the six storefronts, for load tests of concurrency and caching without touching the real sites:
+#   python mockserver.py [--port 8800] [--latency 0.2] [--error-rate 0.05] [--throttle-rate fanza=0.3] ...
+#   python search.py titles.txt --mock-server http://127.0.0.1:8800
+# The real host is the first path segment (aio.use_mock_server rewrites https://booth.pm/ja/items/1 to
+# http://127.0.0.1:8800/booth.pm/ja/items/1). Every search answers with a deterministic work whose title
+# contains the query (unless --miss-rate says it is not there) and its product page has the fields the
+# extractors read. Booth's adult gate and FANZA's age_check redirect are served until their cookie is sent.
+
+DEFAULT_PORT = 8800
+
+# Host -> site; shop subdomains (*.booth.pm) count as booth
+HOSTS = {
+    'www.melonbooks.co.jp': 'melonbooks',
+    'ec.toranoana.jp': 'toranoana',
+    'www.dlsite.com': 'dlsite',
+    'booth.pm': 'booth',
+    'www.dmm.co.jp': 'fanza',
+    'alice-books.com': 'alicebooks',
+}
+SITES = sorted(set(HOSTS.values()))
+
+# Settings that can be given per site ('fanza=0.3'); the plain value applies to the other sites
+PER_SITE = ('latency', 'error_rate', 'throttle_rate')
+
+DEFAULTS = {
+    'latency': 0.0,        # seconds before every response
+    'jitter': 0.0,         # plus up to this many seconds, uniformly
+    'error_rate': 0.0,     # share of requests answered 503
+    'throttle_rate': 0.0,  # share of requests answered 429 with Retry-After
+    'retry_after': 1,      # seconds in the Retry-After of 429 answers
+    'miss_rate': 0.0,      # share of queries the site has no work for
+    'items': 30,           # results per search page
+    'pad_kb': 40,          # filler per page, real pages are 100 KB and more
+    'seed': 0,             # random seed for error/throttle injection and jitter
+}
+
+
+def _hash(*parts):
+    return int(hashlib.md5('\x00'.join(str(p) for p in parts).encode('utf-8')).hexdigest()[:12], 16)
+
+
+def site_of(host):
+    host = host.lower()
+    for h, site in HOSTS.items():
+        if host == h or host.endswith('.' + h):
+            return site
+    return None
+
+
+class Catalog:
+    """Works the mock knows about: one per (site, query), numbered so product pages match the search results."""
+
+    def __init__(self, miss_rate=0.0):
+        self.miss_rate = miss_rate
+        self._works = {}
+        self._lock = threading.Lock()
+
+    def search(self, site, query):
+        """The work a search for query finds on site, or None."""
+        h = _hash(site, query.strip().lower())
+        if (h % 10000) / 10000 < self.miss_rate:
+            return None
+        work_id = 100000 + h % 900000
+        with self._lock:
+            return self._works.setdefault((site, work_id), self._make(site, work_id, query.strip()))
+
+    def work(self, site, work_id):
+        """The work behind a product URL; ids nobody searched for get a generic title."""
+        with self._lock:
+            return self._works.get((site, work_id)) or self._make(site, work_id, None)
+
+    @staticmethod
+    def _make(site, work_id, query):
+        h = _hash(site, work_id)
+        return {
+            'id': work_id,
+            'title': query or f"作品{work_id}",
+            'circle': f"サークル{h % 1000}",
+            'author': f"作家{h % 997}",
+            'date': (2015 + h % 10, 1 + h % 12, 1 + h % 28),
+            'event': 90 + h % 15,
+            # toranoana only: which catalog (tora_r or joshi_r) has the work
+            'joshi': h % 4 == 0,
+        }
+
+
+def _e(text):
+    return html.escape(str(text))
+
+
+def _page(title, body, pad_kb, head=''):
+    pad = ''
+    if pad_kb:
+        pad = '<div class="recommend">' + ''.join(
+            f'<div class="rec"><a href="/genre/{i}">おすすめ{i}</a><p>紹介文の一部です。</p></div>'
+            for i in range(pad_kb * 1024 // 90)) + '</div>'
+    return (f'<!DOCTYPE html><html lang="ja"><head><meta charset="utf-8"><title>{_e(title)}</title>{head}</head>'
+            f'<body><main>{body}</main>{pad}</body></html>')
+
+
+def _results(works, items, link, entry):
+    # the hit (if any) at a position depending on the query, dummies around it
+    entries = []
+    hit = works[0] if works else None
+    at = hit['id'] % items if hit else -1
+    for i in range(items):
+        if i == at:
+            entries.append(entry(link(hit['id']), hit['title'], hit['circle']))
+        else:
+            entries.append(entry(link(900000 + i), f"サンプル作品{i}", f"サークル{i}"))
+    return ''.join(entries)
+
+
+def _ymd(work, sep='/'):
+    y, m, d = work['date']
+    return f"{y}{sep}{m:02d}{sep}{d:02d}"
+
+
+# ---- per-site pages: search(query) and product(work) return (status, content type, body[, extra headers])
+
+def _melonbooks(handler, path, params):
+    if path == '/search/search.php':
+        work = handler.catalog.search('melonbooks', params.get('name', ''))
+        rows = _results([work] if work else [], handler.settings['items'],
+                        lambda i: f"/detail/detail.php?product_id={i}",
+                        lambda href, t, c: f'<li class="product"><div class="title"><a href="{href}">{_e(t)}</a></div>'
+                                           f'<p class="circle">{_e(c)}</p></li>')
+        return 200, 'text/html; charset=utf-8', _page('検索結果 | メロンブックス', f'<ul class="products">{rows}</ul>',
+                                                      handler.settings['pad_kb'])
+    if path == '/detail/detail.php' and params.get('product_id', '').isdigit():
+        w = handler.catalog.work('melonbooks', int(params['product_id']))
+        og = f"{w['title']}（{w['circle']}）の通販・購入はメロンブックス"
+        table = (f'<table class="table-wrapper"><tr><th>サークル名</th><td><a href="/circle/1">{_e(w["circle"])}</a></td></tr>'
+                 f'<tr><th>作家名</th><td><a href="/search/?name=a">{_e(w["author"])}</a></td></tr>'
+                 f'<tr><th>発行日</th><td>{_ymd(w)}</td></tr>'
+                 f'<tr><th>イベント</th><td>コミックマーケット{w["event"]}</td></tr></table>')
+        return 200, 'text/html; charset=utf-8', _page(og, f'<h1>{_e(w["title"])}</h1>{table}', handler.settings['pad_kb'],
+                                                      f'<meta property="og:title" content="{_e(og)}">')
+    return None
+
+
+def _toranoana(handler, path, params):
+    m = re.match(r'^/(tora_r|joshi_r)/ec/app/catalog/list$', path)
+    if m:
+        work = handler.catalog.search('toranoana', params.get('searchWord', ''))
+        section = m.group(1)
+        if work and work['joshi'] != (section == 'joshi_r'):
+            work = None
+        rows = _results([work] if work else [], handler.settings['items'],
+                        lambda i: f"https://ec.toranoana.jp/{section}/ec/item/04{i:010d}/",
+                        lambda href, t, c: f'<li class="product-list-item"><div class="product-list-title">'
+                                           f'<a href="{href}">{_e(t)}</a></div><div class="product-list-name">'
+                                           f'<a class="circle">{_e(c)}</a></div></li>')
+        return 200, 'text/html; charset=utf-8', _page('検索結果 | とらのあな', f'<ul class="product-list">{rows}</ul>',
+                                                      handler.settings['pad_kb'])
+    m = re.match(r'^/(?:tora_r|joshi_r)/ec/item/04(\d{10})/?$', path)
+    if m:
+        w = handler.catalog.work('toranoana', int(m.group(1)))
+        title = f"{w['title']} [{w['circle']}({w['author']})] オリジナル - 同人誌のとらのあな通販"
+        table = (f'<table class="product-detail-spec"><tr><td>サークル</td><td>{_e(w["circle"])}</td></tr>'
+                 f'<tr><td>発行日</td><td>{_ymd(w)}</td></tr>'
+                 f'<tr><td>初出イベント</td><td>{_ymd(w)} C{w["event"]}</td></tr></table>')
+        return 200, 'text/html; charset=utf-8', _page(title, table, handler.settings['pad_kb'])
+    return None
+
+
+def _dlsite(handler, path, params):
+    if path.startswith('/maniax/fsr/'):
+        m = re.search(r'/keyword/([^/]*)', path)
+        work = handler.catalog.search('dlsite', urllib.parse.unquote(m.group(1)) if m else '')
+        rows = _results([work] if work else [], handler.settings['items'],
+                        lambda i: f"https://www.dlsite.com/maniax/work/=/product_id/RJ01{i:06d}.html",
+                        lambda href, t, c: f'<tr><td><dl class="work_1col"><dt class="work_name"><a href="{href}">{_e(t)}</a>'
+                                           f'</dt><dd class="maker_name"><a href="/maniax/circle/">{_e(c)}</a></dd></dl></td></tr>')
+        return 200, 'text/html; charset=utf-8', _page('検索結果 | DLsite', f'<table class="work_1col_table">{rows}</table>',
+                                                      handler.settings['pad_kb'])
+    m = re.match(r'^/maniax/work/=/product_id/RJ01(\d{6})\.html$', path)
+    if m:
+        w = handler.catalog.work('dlsite', int(m.group(1)))
+        y, mo, d = w['date']
+        body = (f'<h1 itemprop="name" id="work_name">{_e(w["title"])}</h1>'
+                f'<span itemprop="brand" class="maker_name"><a href="/maniax/circle/profile/=/maker_id/RG1.html">{_e(w["circle"])}</a></span>'
+                f'<span class="icon_EVT" title="コミックマーケット{w["event"]}"><a href="/event/">コミックマーケット{w["event"]}</a></span>'
+                f'<table id="work_outline"><tr><th>販売日</th><td><a href="/maniax/new/">{y}年{mo:02d}月{d:02d}日</a></td></tr>'
+                f'<tr><th>作者</th><td><a href="/maniax/fsr/=/keyword_creater/a">{_e(w["author"])}</a></td></tr></table>')
+        return 200, 'text/html; charset=utf-8', _page(f"{w['title']} [{w['circle']}] | DLsite", body, handler.settings['pad_kb'])
+    if path == '/maniax/api/=/product.json':
+        m = re.match(r'^RJ01(\d{6})$', params.get('workno', ''))
+        if not m:
+            return 200, 'application/json', '[]'
+        w = handler.catalog.work('dlsite', int(m.group(1)))
+        return 200, 'application/json', json.dumps([{
+            'workno': params['workno'], 'work_name': w['title'], 'maker_name': w['circle'],
+            'regist_date': f"{_ymd(w, '-')} 00:00:00", 'creaters': {'created_by': [{'id': '1', 'name': w['author']}]},
+        }], ensure_ascii=False)
+    return None
+
+
+BOOTH_GATE = ('<div class="adult-check"><p>このページは成人向けの内容を含みます。</p>'
+              '<button class="js-approve-adult">はい</button></div>')
+
+
+def _booth(handler, path, params):
+    m = re.match(r'^/(?:ja/)?items/(\d+)\.json$', path)
+    if m:
+        # the item JSON is not behind the gate
+        w = handler.catalog.work('booth', int(m.group(1)))
+        return 200, 'application/json', json.dumps({
+            'id': w['id'], 'name': w['title'], 'published_at': f"{_ymd(w, '-')}T12:00:00.000+09:00",
+            'shop': {'name': w['circle'], 'url': 'https://booth.pm/'},
+            'tags': [{'name': f"コミックマーケット{w['event']}"}],
+        }, ensure_ascii=False)
+    search = re.match(r'^/ja/search/([^/]*)$', path)
+    item = re.match(r'^/(?:ja/)?items/(\d+)$', path)
+    if not (search or item):
+        return None
+    if handler.cookie('adult') != 't':
+        return 200, 'text/html; charset=utf-8', _page('BOOTH', BOOTH_GATE, handler.settings['pad_kb'])
+    if search:
+        work = handler.catalog.search('booth', urllib.parse.unquote(search.group(1)))
+        rows = _results([work] if work else [], handler.settings['items'],
+                        lambda i: f"https://booth.pm/ja/items/{i}",
+                        lambda href, t, c: f'<li class="item-card"><a data-tracking="click_item" href="{href}">'
+                                           f'<div class="item-card__title">{_e(t)}</div></a>'
+                                           f'<div class="item-card__shop-name">{_e(c)}</div></li>')
+        return 200, 'text/html; charset=utf-8', _page('検索結果 - BOOTH', f'<ul class="item-list">{rows}</ul>',
+                                                      handler.settings['pad_kb'])
+    w = handler.catalog.work('booth', int(item.group(1)))
+    og = f"{w['title']} - {w['circle']} - BOOTH"
+    body = (f'<h2>{_e(w["title"])}</h2><a href="https://booth.pm/">{_e(w["circle"])}</a>'
+            f'<div class="description">コミックマーケット{w["event"]} で頒布</div>'
+            f'<p>公開日 {w["date"][0]}年{w["date"][1]}月{w["date"][2]}日</p>')
+    return 200, 'text/html; charset=utf-8', _page(og, body, handler.settings['pad_kb'],
+                                                  f'<meta property="og:title" content="{_e(og)}">')
+
+
+def _fanza(handler, path, params):
+    if path.startswith('/age_check/'):
+        rurl = params.get('rurl') or 'https://www.dmm.co.jp/'
+        if 'declared=yes' in path:
+            # like the real site: remember the answer and go back where the visitor came from
+            return 302, 'text/html', '', [('Set-Cookie', f"age_check_done=1; Path=/{handler.host}/"),
+                                          ('Location', handler.mock_url(rurl))]
+        yes = 'https://www.dmm.co.jp/age_check/=/declared=yes/?rurl=' + urllib.parse.quote(rurl, safe='')
+        return 200, 'text/html; charset=utf-8', _page(
+            '年齢認証 - FANZA', f'<p>18歳未満の方のアクセスはお断りします。</p><a href="{_e(yes)}">はい</a>'
+                              f'<a href="https://www.dmm.com/">いいえ</a>', 0)
+    search = re.match(r'^/dc/doujin/-/list/narrow/=/word=([^/]*)/?$', path)
+    detail = re.match(r'^/dc/doujin/-/detail/=/cid=d_(\d+)/?$', path)
+    if not (search or detail):
+        return None
+    if handler.cookie('age_check_done') != '1':
+        rurl = 'https://www.dmm.co.jp' + handler.real_path
+        return 302, 'text/html', '', [('Location', handler.mock_url(
+            'https://www.dmm.co.jp/age_check/=/?rurl=' + urllib.parse.quote(rurl, safe='')))]
+    if search:
+        work = handler.catalog.search('fanza', urllib.parse.unquote(search.group(1)))
+        rows = _results([work] if work else [], handler.settings['items'],
+                        lambda i: f"https://www.dmm.co.jp/dc/doujin/-/detail/=/cid=d_{i}/",
+                        lambda href, t, c: f'<li class="productList__item"><a href="{href}"><span class="productTitle">{_e(t)}'
+                                           f'</span></a><div class="circleName"><a href="/dc/doujin/-/list/=/article=maker/">'
+                                           f'{_e(c)}</a></div></li>')
+        return 200, 'text/html; charset=utf-8', _page('同人 検索結果 - FANZA同人', f'<ul class="productList">{rows}</ul>',
+                                                      handler.settings['pad_kb'])
+    w = handler.catalog.work('fanza', int(detail.group(1)))
+    body = (f'<h1 class="productTitle__txt">{_e(w["title"])}</h1><div class="circleName">'
+            f'<a class="circleName__txt" href="/dc/doujin/-/list/=/article=maker/">{_e(w["circle"])}</a></div>'
+            f'<div class="productInformation"><dl><dt>配信開始日</dt><dd>{_ymd(w)} 16:00</dd></dl>'
+            f'<dl><dt>作者</dt><dd>{_e(w["author"])}</dd></dl></div>')
+    return 200, 'text/html; charset=utf-8', _page(f"{w['title']} - {w['circle']} - FANZA同人", body, handler.settings['pad_kb'],
+                                                  f'<meta property="og:title" content="{_e(w["title"])}">')
+
+
+def _alicebooks(handler, path, params):
+    if path == '/item/list/all':
+        work = handler.catalog.search('alicebooks', params.get('keyword', ''))
+        rows = _results([work] if work else [], handler.settings['items'],
+                        lambda i: f"/item/show/{i}-1",
+                        lambda href, t, c: f'<div class="item_box"><dl><dt class="item_name"><a href="{href}">{_e(t)}</a>'
+                                           f'</dt><dd class="circle">{_e(c)}</dd></dl></div>')
+        return 200, 'text/html; charset=utf-8', _page('商品一覧 | アリスブックス', f'<div class="item_list">{rows}</div>',
+                                                      handler.settings['pad_kb'])
+    m = re.match(r'^/item/show/(\d+)-\d+$', path)
+    if m:
+        w = handler.catalog.work('alicebooks', int(m.group(1)))
+        table = (f'<table class="item_detail"><tr><th>サークル</th><td><a href="/circle/show?circle_id=1">{_e(w["circle"])}</a></td></tr>'
+                 f'<tr><th>主な作家</th><td><a href="/author/1">{_e(w["author"])}</a></td></tr>'
+                 f'<tr><th>発行日</th><td>{_ymd(w)}</td></tr></table>')
+        return 200, 'text/html; charset=utf-8', _page(f"{w['title']} / {w['circle']} | アリスブックス",
+                                                      f'<h1>{_e(w["title"])} / {_e(w["circle"])}</h1>{table}',
+                                                      handler.settings['pad_kb'])
+    return None
+
+
+PAGES = {
+    'melonbooks': _melonbooks,
+    'toranoana': _toranoana,
+    'dlsite': _dlsite,
+    'booth': _booth,
+    'fanza': _fanza,
+    'alicebooks': _alicebooks,
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def settings(self):
+        return self.server.settings
+
+    @property
+    def catalog(self):
+        return self.server.catalog
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def mock_url(self, url):
+        """This server's address for a real storefront URL."""
+        parts = urllib.parse.urlsplit(url)
+        return f"/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else '')
+
+    def cookie(self, name):
+        for part in (self.headers.get('Cookie') or '').split(';'):
+            k, _, v = part.strip().partition('=')
+            if k == name:
+                return v
+        return None
+
+    def _setting(self, name, site):
+        value = self.settings[name]
+        if isinstance(value, dict):
+            return value.get(site, value.get('*', 0.0))
+        return value
+
+    def _respond(self, site, status, ctype, body, headers=()):
+        data = body.encode('utf-8') if isinstance(body, str) else body
+        etag = None
+        if status == 200:
+            etag = '"' + hashlib.md5(data).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == etag:
+                status, data = 304, b''
+        self.server.count(site, status)
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+        if status != 304:
+            self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(data)))
+        for k, v in headers:
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(data)
+
+    def _handle(self):
+        if self.command == 'POST':
+            length = int(self.headers.get('Content-Length') or 0)
+            self.rfile.read(length)
+        target = urllib.parse.urlsplit(self.path)
+        self.host, _, rest = target.path.lstrip('/').partition('/')
+        self.real_path = '/' + rest + (f"?{target.query}" if target.query else '')
+        site = site_of(self.host)
+
+        delay = self._setting('latency', site) + self.server.random() * self.settings['jitter']
+        if delay > 0:
+            time.sleep(delay)
+        if site is None:
+            return self._respond('other', 404, 'text/plain', f"not a storefront: {self.host}\n")
+        roll = self.server.random()
+        if roll < self._setting('error_rate', site):
+            return self._respond(site, 503, 'text/html', '<h1>503 Service Unavailable</h1>')
+        if roll < self._setting('error_rate', site) + self._setting('throttle_rate', site):
+            return self._respond(site, 429, 'text/html', '<h1>429 Too Many Requests</h1>',
+                                 [('Retry-After', str(self.settings['retry_after']))])
+        if self.command == 'POST':
+            # form posts (Booth's age form fallback) are accepted and ignored
+            return self._respond(site, 200, 'text/html; charset=utf-8', _page('OK', '', 0))
+
+        params = {k: v[0] for k, v in urllib.parse.parse_qs(target.query, keep_blank_values=True).items()}
+        try:
+            result = PAGES[site](self, '/' + rest, params)
+        except Exception as e:
+            return self._respond(site, 500, 'text/plain', f"mock error: {e}\n")
+        if result is None:
+            return self._respond(site, 404, 'text/html', '<h1>404 Not Found</h1>')
+        self._respond(site, *result)
+
+    do_GET = do_HEAD = do_POST = _handle
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, verbose=False, **settings):
+        super().__init__(address, Handler)
+        unknown = set(settings) - set(DEFAULTS)
+        if unknown:
+            raise TypeError(f"unknown mock server settings: {', '.join(sorted(unknown))}")
+        self.settings = dict(DEFAULTS, **settings)
+        self.catalog = Catalog(self.settings['miss_rate'])
+        self.verbose = verbose
+        self._random = random.Random(self.settings['seed'])
+        self._lock = threading.Lock()
+        # site -> {status: requests}
+        self.stats = {}
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def random(self):
+        with self._lock:
+            return self._random.random()
+
+    def count(self, site, status):
+        with self._lock:
+            counts = self.stats.setdefault(site, {})
+            counts[status] = counts.get(status, 0) + 1
+
+    def print_stats(self, file=sys.stderr):
+        for site, counts in sorted(self.stats.items()):
+            statuses = ', '.join(f"{status}: {n}" for status, n in sorted(counts.items()))
+            print(f"{site:12} {sum(counts.values()):6} requests ({statuses})", file=file)
+
+
+def start(port=0, host='127.0.0.1', **settings):
+    """Run a mock server in a background thread (port 0: any free port) and return it; .url is its address,
+    .shutdown() stops it. Settings are the DEFAULTS keys; latency/error_rate/throttle_rate may be {site: value}."""
+    server = MockServer((host, port), **settings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _per_site(values):
+    """['0.1', 'fanza=0.5'] -> 0.1 or {'*': 0.1, 'fanza': 0.5}."""
+    plain = 0.0
+    sites = {}
+    for value in values or []:
+        site, sep, number = value.rpartition('=')
+        if sep and site not in SITES:
+            raise argparse.ArgumentTypeError(f"unknown site {site!r} (one of {', '.join(SITES)})")
+        if sep:
+            sites[site] = float(number)
+        else:
+            plain = float(number)
+    return dict(sites, **{'*': plain}) if sites else plain
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Serve stand-ins for the six storefronts (see search.py --mock-server).')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'(default: {DEFAULT_PORT})')
+    parser.add_argument('--latency', action='append', metavar='[SITE=]SECONDS',
+                        help='delay before every response, e.g. 0.2 or fanza=1.5 (can be given more than once)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random extra delay of up to this many seconds')
+    parser.add_argument('--error-rate', action='append', metavar='[SITE=]RATE',
+                        help='share of requests answered 503, e.g. 0.05 or booth=0.2')
+    parser.add_argument('--throttle-rate', action='append', metavar='[SITE=]RATE',
+                        help='share of requests answered 429 Too Many Requests')
+    parser.add_argument('--retry-after', type=int, default=DEFAULTS['retry_after'],
+                        help='Retry-After seconds of the 429 answers (default: %(default)s)')
+    parser.add_argument('--miss-rate', type=float, default=0.0, help='share of queries a site has no work for')
+    parser.add_argument('--items', type=int, default=DEFAULTS['items'], help='results per search page (default: %(default)s)')
+    parser.add_argument('--pad-kb', type=int, default=DEFAULTS['pad_kb'], help='filler per page in KB (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the injected failures')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args(argv)
+    try:
+        per_site = {name: _per_site(getattr(args, name)) for name in PER_SITE}
+    except (argparse.ArgumentTypeError, ValueError) as e:
+        parser.error(str(e))
+
+    server = MockServer((args.host, args.port), verbose=args.verbose, jitter=args.jitter, retry_after=args.retry_after,
+                        miss_rate=args.miss_rate, items=max(1, args.items), pad_kb=max(0, args.pad_kb), seed=args.seed,
+                        **per_site)
+    print(f"mock storefronts on {server.url} (search.py --mock-server {server.url}); Ctrl+C to stop", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.print_stats()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,122 @@
+import json
+import sys
+
+# One output schema for every input line, written as a TSV row and/or a JSON Lines record:
+#   input    the input line (title or URL)
+#   status   'ok', 'not_found' (no site had it) or 'error' (the line failed; see error)
+#   fields   作品名/サークル名/作家名/発売日/イベント名 (None when unknown)
+#   urls     product URL per site (None when not found)
+#   sources  the site each field was taken from ('url': the product URL given as input)
+#   failed   sites that could not be reached, so their empty URL means "unknown" rather than "not there"
+
+# TSV columns: the fields, then the URL per site
+FIELDS = ['サークル名', '作家名', '作品名', '発売日', 'イベント名']
+URL_COLUMNS = ['dlsite', 'fanza', 'booth', 'toranoana', 'melonbooks', 'alicebooks']
+
+
+def _url(value):
+    return value if isinstance(value, str) and value.startswith('http') else None
+
+
+def record(value, fields=None, urls=None, sources=None, status='ok', error=None, failed=()):
+    """Build the output record of one input line."""
+    return {
+        'input': value,
+        'status': status,
+        'fields': {k: (fields or {}).get(k) or None for k in FIELDS},
+        'urls': {k: _url((urls or {}).get(k)) for k in URL_COLUMNS},
+        'sources': {k: v for k, v in (sources or {}).items() if v},
+        'failed': sorted(set(failed)),
+        'error': error,
+    }
+
+
+def tsv_row(rec):
+    """The TSV row of a record (None for error records, which have no row).
+
+    A line nothing was found for keeps its input in the 作品名 column, so the row still says what was looked up.
+    """
+    if rec['status'] == 'error':
+        return None
+    fields = dict(rec['fields'])
+    if rec['status'] == 'not_found':
+        fields['作品名'] = rec['input']
+    cells = [fields.get(k) or '' for k in FIELDS] + [rec['urls'].get(k) or '' for k in URL_COLUMNS]
+    return '\t'.join(tsv_cell(c) for c in cells)
+
+
+def tsv_cell(value):
+    # a tab or newline inside a value would shift the columns
+    return (value or '').replace('\t', ' ').replace('\r', ' ').replace('\n', ' ')
+
+
+def parse_tsv_row(line):
+    """Split a row of an exported TSV into ({field: text}, {site: text}, cells, line ending).
+
+    Rows a spreadsheet copied without their trailing empty cells are padded; returns None for a row
+    with more columns than FIELDS + URL_COLUMNS or for the header row.
+    """
+    body = line.rstrip('\r\n')
+    ending = line[len(body):]
+    cells = body.split('\t')
+    if len(cells) > len(FIELDS) + len(URL_COLUMNS) or cells[0].strip() == FIELDS[0]:
+        return None
+    cells += [''] * (len(FIELDS) + len(URL_COLUMNS) - len(cells))
+    fields = {k: cells[i].strip() for i, k in enumerate(FIELDS)}
+    urls = {k: cells[len(FIELDS) + i].strip() for i, k in enumerate(URL_COLUMNS)}
+    return fields, urls, cells, ending
+
+
+def jsonl_line(rec):
+    return json.dumps(rec, ensure_ascii=False)
+
+
+class Writer:
+    """Write records as TSV rows and/or JSON Lines, flushing after every record so a consumer
+    (or a crashed run's output file) sees each line as soon as it is done.
+
+    Each line goes out in one write through the text stream, so it gets the platform's line ending
+    (CRLF on Windows, like print()) and the stream's errors='replace' handles unencodable characters.
+    """
+
+    def __init__(self, tsv=None, jsonl=None):
+        self.tsv = tsv
+        self.jsonl = jsonl
+
+    @staticmethod
+    def _write(stream, text):
+        stream.write(text + '\n')
+        stream.flush()
+
+    @staticmethod
+    def _write_raw(stream, text):
+        # text is written exactly as given (its own line ending, no newline translation): --enrich passes
+        # rows through byte for byte
+        buffer = getattr(stream, 'buffer', None)
+        if buffer is not None:
+            stream.flush()
+            buffer.write(text.encode(stream.encoding or 'utf-8', errors='replace'))
+            buffer.flush()
+        else:
+            stream.write(text)
+            stream.flush()
+
+    def write(self, rec, line=None):
+        """Write a record; with line (a TSV row including its line ending) that line is the TSV output as is.
+
+        rec may be None for a line that has no record (e.g. the header row of an exported TSV).
+        """
+        if self.tsv is not None:
+            if line is not None:
+                self._write_raw(self.tsv, line)
+            elif rec is not None:
+                row = tsv_row(rec)
+                if row is not None:
+                    self._write(self.tsv, row)
+        if self.jsonl is not None and rec is not None:
+            self._write(self.jsonl, jsonl_line(rec))
+
+    def close(self):
+        for stream in (self.tsv, self.jsonl):
+            if stream is not None and stream not in (sys.stdout, sys.stderr):
+                stream.close()
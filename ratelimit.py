@@ -0,0 +1,90 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+# Default request budget per host: sustained requests per second, and how many may go out back to back
+DEFAULT_RATE = 2.0
+DEFAULT_BURST = 4
+
+# Per-site overrides keyed by host suffix: {'booth.pm': (1.0, 2)}
+SITE_RATES = {}
+
+# After throttling the rate is halved, but never below this; each success wins back a tenth of the configured rate
+MIN_RATE = 0.1
+RECOVERY_STEP = 0.1
+
+_buckets = {}
+
+
+class _Bucket:
+    """Token bucket for one host. Only used from the engine loop."""
+
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        # set when the host asked us to back off; nobody sends before then
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+
+def configure(rate=None, burst=None, site_rates=None):
+    """Change the default per-host rate/burst and per-site overrides. Existing buckets are rebuilt."""
+    global DEFAULT_RATE, DEFAULT_BURST
+    if rate:
+        DEFAULT_RATE = rate
+    if burst:
+        DEFAULT_BURST = burst
+    if site_rates:
+        SITE_RATES.update(site_rates)
+    _buckets.clear()
+
+
+def _host(url):
+    return (urlsplit(url).hostname or '').lower()
+
+
+def _bucket_for(url):
+    host = _host(url)
+    b = _buckets.get(host)
+    if b is None:
+        rate, burst = DEFAULT_RATE, DEFAULT_BURST
+        for suffix, (r, bu) in SITE_RATES.items():
+            if host.endswith(suffix):
+                rate, burst = r, bu
+                break
+        b = _buckets[host] = _Bucket(rate, burst)
+    return b
+
+
+async def acquire(url):
+    """Wait until the host of url may receive another request."""
+    b = _bucket_for(url)
+    async with b.lock:
+        while True:
+            now = time.monotonic()
+            if now < b.blocked_until:
+                await asyncio.sleep(b.blocked_until - now)
+                continue
+            b.tokens = min(b.burst, b.tokens + (now - b.updated) * b.rate)
+            b.updated = now
+            if b.tokens >= 1:
+                b.tokens -= 1
+                return
+            await asyncio.sleep((1 - b.tokens) / b.rate)
+
+
+def throttled(url, delay):
+    """Record that the host throttled us: halve its rate and hold every request to it for delay seconds."""
+    b = _bucket_for(url)
+    b.rate = max(MIN_RATE, b.rate / 2)
+    b.blocked_until = max(b.blocked_until, time.monotonic() + delay)
+
+
+def succeeded(url):
+    """Record a normal response: step the host's rate back towards its configured value."""
+    b = _bucket_for(url)
+    if b.rate < b.max_rate:
+        b.rate = min(b.max_rate, b.rate + b.max_rate * RECOVERY_STEP)
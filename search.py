@@ -1,13 +1,31 @@
 import sys
 import os
 import re
-from melon import clean_url, extract_product_info as extract_product_info_melon
-from tora import extract_product_info as extract_product_info_tora
-from google import get_first_search_url_from_booth, get_first_search_url_from_dlsite, get_first_search_url_from_toranoana, get_first_search_url_from_melonbooks, get_first_search_url_from_fanza, get_first_search_url_from_alicebooks
-from dlsite import extract_product_info as extract_product_info_dlsite
-from booth import extract_product_info as extract_product_info_booth
-from fanza import extract_product_info as extract_product_info_fanza
-from alicebooks import extract_product_info as extract_product_info_alicebooks
+import argparse
+import asyncio
+import collections
+import functools
+import json
+import time
+import aio
+import catalog
+import checkpoint
+import htmlparse
+import httpcache
+import memo
+import metrics
+import output
+import ratelimit
+import singleflight
+import booth
+import dlsite
+from melon import clean_url, extract_product_info_async as extract_product_info_melon_async
+from tora import extract_product_info_async as extract_product_info_tora_async
+from google import get_first_search_url_from_booth_async, get_first_search_url_from_dlsite_async, get_first_search_url_from_toranoana_async, get_first_search_url_from_melonbooks_async, get_first_search_url_from_fanza_async, get_first_search_url_from_alicebooks_async
+from dlsite import extract_product_info_async as extract_product_info_dlsite_async
+from booth import extract_product_info_async as extract_product_info_booth_async
+from fanza import extract_product_info_async as extract_product_info_fanza_async
+from alicebooks import extract_product_info_async as extract_product_info_alicebooks_async
 
 # Prefer python output to use UTF-8 and replace unencodable chars to avoid crashes when capturing output on Windows
 os.environ.setdefault('PYTHONIOENCODING', 'utf-8:replace')
@@ -84,7 +102,7 @@ def _normalize_date_to_ymd(s):
     return s
 
 
-def _find_booth_url_with_fallback(title, circle, author):
+async def _find_booth_url_with_fallback(title, circle, author):
     """Try multiple queries to find a booth URL when a plain title search fails."""
     tried = []
     candidates = [title, f"{title} {circle}" if circle else None, f"{title} {author}" if author else None, circle, author]
@@ -95,36 +113,38 @@ def _find_booth_url_with_fallback(title, circle, author):
         if not q or q in tried:
             continue
         tried.append(q)
-        url = get_first_search_url_from_booth(q)
+        url = await get_first_search_url_from_booth_async(q)
         if url and isinstance(url, str) and url.startswith('http'):
             return url
     return None
 
 
-def _fetch_site_info(site_name, url):
+async def _fetch_site_info(site_name, url):
     """Given a site identifier and URL, call the corresponding extractor and return its info dict or None."""
     try:
         if not url or not isinstance(url, str) or not url.startswith('http'):
             return None
         if site_name == 'dlsite':
-            return extract_product_info_dlsite(url)
+            return await extract_product_info_dlsite_async(url)
         elif site_name == 'melonbooks':
-            return extract_product_info_melon(url)
+            return await extract_product_info_melon_async(url)
         elif site_name == 'toranoana':
-            return extract_product_info_tora(url)
+            return await extract_product_info_tora_async(url)
         elif site_name == 'booth':
-            return extract_product_info_booth(url)
+            return await extract_product_info_booth_async(url)
         elif site_name == 'fanza':
-            return extract_product_info_fanza(url)
+            return await extract_product_info_fanza_async(url)
         elif site_name == 'alicebooks':
-            return extract_product_info_alicebooks(url)
+            return await extract_product_info_alicebooks_async(url)
         else:
             return None
+    except aio.TransientError:
+        raise
     except Exception:
         return None
 
 
-def execute_url(url):
+async def execute_url_async(url):
     """Fetch product metadata from a given product URL and return (info_dict, cleaned_url).
 
     This no longer prints; callers should handle printing and cross-site aggregation.
@@ -133,232 +153,934 @@ def execute_url(url):
     info = None
     if 'melonbooks' in url:
         cleaned_url = clean_url(url)
-        info = extract_product_info_melon(cleaned_url)
+        info = await extract_product_info_melon_async(cleaned_url)
     elif 'toranoana' in url:
-        info = extract_product_info_tora(cleaned_url)
+        info = await extract_product_info_tora_async(cleaned_url)
     elif 'dlsite' in url or 'dlsite.com' in url:
-        info = extract_product_info_dlsite(cleaned_url)
+        info = await extract_product_info_dlsite_async(cleaned_url)
     elif 'booth' in url or 'booth.pm' in url:
-        info = extract_product_info_booth(cleaned_url)
+        info = await extract_product_info_booth_async(cleaned_url)
     elif 'alice-books' in url or 'alice-books.com' in url:
-        info = extract_product_info_alicebooks(cleaned_url)
+        info = await extract_product_info_alicebooks_async(cleaned_url)
     # Defensive: if info is not set, it means the URL was unsupported or invalid
     if not info:
         raise ValueError(f"Unsupported or invalid URL: {url}")
     return info, cleaned_url
 
 
-if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python script.py <file_path or URL>", file=sys.stderr)
-        sys.exit(1)
-    
-    file_path = sys.argv[1]
+def execute_url(url):
+    return aio.run(execute_url_async(url))
+
+
+# Search helpers in the order their hits are collected for a raw query.
+# FANZA is last: it only becomes the primary source when no other site matched.
+SEARCH_FNS = [
+    ('melonbooks', get_first_search_url_from_melonbooks_async),
+    ('toranoana', get_first_search_url_from_toranoana_async),
+    ('dlsite', get_first_search_url_from_dlsite_async),
+    ('booth', get_first_search_url_from_booth_async),
+    ('alicebooks', get_first_search_url_from_alicebooks_async),
+    ('fanza', get_first_search_url_from_fanza_async),
+]
+
+# Prefer a primary source for extraction: dlsite > booth > melonbooks > toranoana > alicebooks
+PRIMARY_PREF = ['dlsite', 'booth', 'melonbooks', 'toranoana', 'alicebooks']
+
+# Priority for metadata: melonbooks > toranoana > alicebooks > dlsite = fanza > booth
+INFO_PREF = ['melonbooks', 'toranoana', 'alicebooks', 'dlsite', 'fanza', 'booth']
+
+# Column order of the URL part of a TSV row
+URL_COLUMNS = output.URL_COLUMNS
+
+# Fields fast mode tries to fill from search results before it fetches any detail page
+FAST_FIELDS = ['作品名', 'サークル名', '作家名', '発売日', 'イベント名']
+
+# Refresh mode: sites whose empty URL column is searched again (a work can show up on a store months later),
+# how long a site's answer is left alone, and how many requests one refresh run may send
+REFRESH_SITES = list(URL_COLUMNS)
+DEFAULT_REFRESH_INTERVAL = 7 * 24 * 3600
+DEFAULT_REFRESH_BUDGET = 300
+
+# Most requests one refresh lookup (site search + product page) can send: the age checks of the search and
+# product pages, toranoana's joshi search, booth's fallback queries and the JSON API try (--api) included.
+# Every request can be retried aio.MAX_RETRIES times, so a lookup reserves this times MAX_RETRIES + 1 and
+# only starts when that much is left of the budget; a run never goes over it.
+REFRESH_LOOKUP_COST = {
+    'melonbooks': 4,
+    'toranoana': 3,
+    'dlsite': 3,
+    'booth': 18,
+    'alicebooks': 2,
+    'fanza': 6,
+}
+
+# Pipeline sizing: tasks per stage, and input lines in flight (including rows waiting for their turn to print)
+DEFAULT_WORKERS = 6
+DEFAULT_WINDOW = 64
+
+# Queue sentinel telling a stage worker that its input is exhausted
+_DONE = object()
+
+
+def _is_url(value):
+    return bool(value) and isinstance(value, str) and value.startswith('http')
+
+
+async def _checkpointed(job, step, site, coro):
+    """Await one site lookup of a pipeline job, answering it from the checkpoint if an earlier attempt
+    finished it (--resume) and saving its result otherwise. Lookups that raise are not saved."""
+    if job is None or not checkpoint.is_open():
+        return await coro
+    saved = checkpoint.lookup(job['index'], job['value'], step, site)
+    if saved is not checkpoint.MISSING:
+        coro.close()
+        return saved
+    result = await coro
+    checkpoint.store(job['index'], job['value'], step, site, result)
+    return result
+
+
+async def _gather_dict(coros, failed=None, job=None, step=None):
+    """Await a {key: coroutine} dict concurrently and return {key: result}; failures become None.
+
+    Keys whose lookup hit aio.TransientError (retries exhausted) are reported and appended to `failed`,
+    so a site that could not be reached is not mistaken for a site that has no such work.
+    With a pipeline job, every lookup is checkpointed as `step` under its key.
+    """
+    if job is not None:
+        coros = {k: _checkpointed(job, step, k, c) for k, c in coros.items()}
+    keys = list(coros)
+    values = await asyncio.gather(*coros.values(), return_exceptions=True)
+    out = {}
+    for k, v in zip(keys, values):
+        if isinstance(v, aio.TransientError):
+            print(f"Warning: {k} lookup failed: {_safe_console_str(str(v))}", file=sys.stderr)
+            if failed is not None:
+                failed.append(k)
+        out[k] = None if isinstance(v, Exception) else v
+    return out
+
+
+async def _search_all_sites(query, failed=None, job=None):
+    """Run every site search for query at once and return {site: url} for the sites that matched.
+
+    The dict keeps SEARCH_FNS order so the primary fallback and the log line are stable.
+    """
+    found = await _gather_dict({name: fn(query) for name, fn in SEARCH_FNS}, failed, job, 'search')
+    return {name: url for name, url in found.items() if _is_url(url)}
+
+
+async def _search_sites_by_title(info, include_fanza=False, failed=None, job=None, searched=None):
+    """Search every site by the title in info concurrently and return the site_urls mapping.
+
+    The sites actually queried are appended to `searched` (FANZA only with include_fanza).
+    """
+    title_q = info.get('作品名') or ''
+    searches = {
+        'dlsite': get_first_search_url_from_dlsite_async(title_q),
+        'melonbooks': get_first_search_url_from_melonbooks_async(title_q),
+        'toranoana': get_first_search_url_from_toranoana_async(title_q),
+        'booth': _find_booth_url_with_fallback(title_q, info.get('サークル名'), info.get('作家名')),
+    }
+    if include_fanza:
+        searches['fanza'] = get_first_search_url_from_fanza_async(title_q)
+    searches['alicebooks'] = get_first_search_url_from_alicebooks_async(title_q)
+    if searched is not None:
+        searched.extend(searches)
+    site_urls = await _gather_dict(searches, failed, job, 'search')
+    # Ensure FANZA slot exists even if empty
+    site_urls.setdefault('fanza', None)
+    return site_urls
+
+
+async def _fetch_all_site_infos(site_urls, failed=None, job=None):
+    """Run _fetch_site_info for every site URL at once and return {site: info or None}."""
+    return await _gather_dict({k: _fetch_site_info(k, u) for k, u in site_urls.items()}, failed, job, 'fetch')
+
+
+async def _extract_primary(url, source):
+    """Extract the primary info dict, returning (info, cleaned_url)."""
+    # If the chosen primary source is FANZA, use the dedicated extractor
+    if source == 'fanza':
+        try:
+            return await extract_product_info_fanza_async(url), url
+        except Exception:
+            raise ValueError(f"Unsupported or invalid URL: {url}")
+    return await execute_url_async(url)
+
+
+def _merge_site_infos(info, site_infos, sources=None, primary=None):
+    """Merge per-site info dicts into one record using INFO_PREF, falling back to the primary info.
+
+    If a sources dict is given, it is filled with the site each field came from (primary for the fallback).
+    """
+    def pick(field):
+        for s in INFO_PREF:
+            si = site_infos.get(s)
+            if si and si.get(field):
+                if sources is not None:
+                    sources[field] = s
+                return si.get(field)
+        if sources is not None and info.get(field):
+            sources[field] = primary
+        return info.get(field)
+
+    return {
+        'サークル名': pick('サークル名'),
+        '作家名': pick('作家名'),
+        '作品名': pick('作品名'),
+        # Normalize release date to YYYY/MM/DD when possible
+        '発売日': _normalize_date_to_ymd(pick('発売日')),
+        'イベント名': pick('イベント名'),
+    }
+
+
+# --- Pipeline stages ---
+# Each input line travels through the stages as a job dict:
+#   index, value           position in the input (for ordered output) and the raw line
+#   results, found_source  search hits and the chosen primary site (query lines only)
+#   target_url             URL of the primary page
+#   info, site_urls, site_infos
+#   failed                 sites whose search or fetch hit a transient error (retries exhausted)
+#   searched               sites whose search was run for this line (the catalog's check times)
+#   merged                 the merged fields the record was built from
+#   record                 finished output record (output.record), also for lines that failed
+#   done                   set once the record is final, later stages pass the job through
+#   cached                 the row came from the catalog (--incremental) or the checkpoint (--resume)
 
-    if 'https://' in file_path:
-        # 直接URLが渡された場合
+async def _search_stage(job):
+    """Query search: find candidate URLs for a title, or extract a URL line and search by its title."""
+    value = job['value']
+    # If the line looks like a URL, process it directly
+    if value.startswith('http'):
+        job['target_url'] = value
+        job['info'], _ = await _checkpointed(job, 'primary', 'url', _extract_primary(value, None))
+        # No initial search results; perform fresh site searches by title
+        job['site_urls'] = await _search_sites_by_title(job['info'], failed=job['failed'], job=job,
+                                                        searched=job['searched'])
+        return
+
+    # Treat as a search query (fallback): try every search helper and collect all candidate URLs
+    results = await _search_all_sites(value, job['failed'], job)
+    job['searched'].extend(name for name, _ in SEARCH_FNS)
+    if not results:
+        if job['failed']:
+            print(f"Warning: lookup failed for query: {_safe_console_str(value)} (unreachable: {', '.join(job['failed'])})",
+                  file=sys.stderr)
+        else:
+            print(f"Warning: no search result for query: {_safe_console_str(value)}", file=sys.stderr)
+        # エラー時も空行を出力する
+        job['record'] = output.record(value, status='not_found', failed=job['failed'])
+        job['done'] = True
+        return
+    primary = None
+    for p in PRIMARY_PREF:
+        if p in results:
+            primary = results[p]
+            job['found_source'] = p
+            break
+    # fallback to any found (only FANZA can be left here)
+    if primary is None:
+        job['found_source'], primary = next(iter(results.items()))
+
+    # Log all found candidate URLs
+    found_list = ', '.join([f"{k}:{v}" for k, v in results.items()])
+    print(f"Found URLs for query: {_safe_console_str(value)} -> {found_list}", file=sys.stderr)
+    job['results'] = results
+    job['target_url'] = primary
+    # If we started from a raw query, only use the sites' URLs we already found.
+    # Do NOT try to re-query other sites based on the title (this avoids spurious matches).
+    job['site_urls'] = {name: results.get(name) for name in URL_COLUMNS}
+
+
+async def _fetch_missing_fields(job):
+    """Fast mode detail fetch: start from what the search result entries showed, then fetch detail pages
+    one site at a time in INFO_PREF order, only while some field is still empty (usually the event)."""
+    site_urls = job['site_urls']
+    site_infos = {k: memo.hit_info(u) for k, u in site_urls.items() if _is_url(u) and memo.hit_info(u)}
+    info = memo.hit_info(job['target_url']) or {}
+    for site in INFO_PREF:
+        merged = _merge_site_infos(info, site_infos)
+        if all(merged.get(f) for f in FAST_FIELDS):
+            break
+        url = site_urls.get(site)
+        if not _is_url(url):
+            continue
         try:
-            info, cleaned = execute_url(file_path)
-            # Build search URLs for related sites based on extracted title
-            title_q = info.get('作品名') or ''
-            site_urls = {
-                'dlsite': get_first_search_url_from_dlsite(title_q),
-                'melonbooks': get_first_search_url_from_melonbooks(title_q),
-                'toranoana': get_first_search_url_from_toranoana(title_q),
-                'booth': _find_booth_url_with_fallback(title_q, info.get('サークル名'), info.get('作家名')),
-                'fanza': get_first_search_url_from_fanza(title_q),
-                'alicebooks': get_first_search_url_from_alicebooks(title_q)
-            }
-
-            # Fetch metadata from available sites
-            site_infos = {k: _fetch_site_info(k, u) for k, u in site_urls.items()}
-
-            # Priority for metadata: melonbooks > toranoana > alicebooks > dlsite = fanza > booth
-            pref = ['melonbooks', 'toranoana', 'alicebooks', 'dlsite', 'fanza', 'booth']
-            def pick(field):
-                for s in pref:
-                    si = site_infos.get(s)
-                    if si and si.get(field):
-                        return si.get(field)
-                # fallback to primary info
-                return info.get(field)
-
-            circle = pick('サークル名')
-            author = pick('作家名')
-            title = pick('作品名')
-            release = pick('発売日')
-            event = pick('イベント名')
-
-            # Normalize release date to YYYY/MM/DD when possible
-            release_norm = _normalize_date_to_ymd(release)
-
-            dlsiteurl = site_urls.get('dlsite') or ''
-            fanza = ''
-            boothurl = site_urls.get('booth') or ''
-            toraurl = site_urls.get('toranoana') or ''
-            melonurl = site_urls.get('melonbooks') or ''
-            alicebooksurl = site_urls.get('alicebooks') or ''
-
-            # Print with safe encoding
-            print(f"{_safe_console_str(circle)}\t{_safe_console_str(author)}\t{_safe_console_str(title)}\t{_safe_console_str(release_norm)}\t{_safe_console_str(event)}\t{dlsiteurl}\t{fanza}\t{boothurl}\t{toraurl}\t{melonurl}\t{alicebooksurl}\t{cleaned}")
+            full = await _checkpointed(job, 'fetch', site, _fetch_site_info(site, url))
+        except aio.TransientError as e:
+            print(f"Warning: {site} lookup failed: {_safe_console_str(str(e))}", file=sys.stderr)
+            job['failed'].append(site)
+            continue
+        if full:
+            site_infos[site] = dict(site_infos.get(site) or {}, **{k: v for k, v in full.items() if v})
+    job['info'] = info
+    job['site_infos'] = site_infos
+
+
+async def _fetch_stage(job, fast=False):
+    """Detail fetch: extract every found product page (and the primary page for query lines) at once."""
+    if fast and 'info' not in job:
+        await _fetch_missing_fields(job)
+        return
+    if 'info' in job:
+        job['site_infos'] = await _fetch_all_site_infos(job['site_urls'], job['failed'], job)
+        return
+    primary, site_infos = await asyncio.gather(
+        _checkpointed(job, 'primary', job.get('found_source') or 'url',
+                      _extract_primary(job['target_url'], job.get('found_source'))),
+        _fetch_all_site_infos(job['site_urls'], job['failed'], job),
+    )
+    job['info'], _ = primary
+    job['site_infos'] = site_infos
+
+
+async def _merge_stage(job):
+    """Cross-site merge: build the TSV row from the per-site infos."""
+    sources = {}
+    # fields only the primary page had come from the site that was searched, or the URL given as input
+    job['merged'] = _merge_site_infos(job['info'], job['site_infos'], sources, job.get('found_source') or 'url')
+    job['record'] = output.record(job['value'], job['merged'], job['site_urls'], sources, failed=job['failed'])
+    job['done'] = True
 
-        except Exception as e:
-            print(f"Error processing {_safe_console_str(file_path)}: {e}", file=sys.stderr)
-            sys.exit(1)
-        sys.exit(0)
 
+def _catalog_record(value, work):
+    """The output record for an input line from its catalog record."""
+    if work['merged'] is None:
+        return output.record(value, status='not_found', failed=work['failed'])
+    sources = {}
+    _merge_site_infos(work['merged'], work['site_infos'], sources)
+    return output.record(value, work['merged'], work['urls'], sources, failed=work['failed'])
+
+
+def _catalog_store(job):
+    """Record a finished line in the catalog: its merged fields, or that nothing was found."""
+    record = job.get('record')
+    if job.get('cached') or record is None or record['status'] == 'error' or not catalog.is_open():
+        return
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                value = line.strip()
-                if not value:
-                    continue
-                # If the line looks like a URL, process it directly
-                if value.startswith('http'):
-                    target_url = value
-                else:
-                    # Treat as a search query (fallback): try multiple search helpers and collect all candidate URLs
-                    search_fns = [
-                        ('melonbooks', get_first_search_url_from_melonbooks),
-                        ('toranoana', get_first_search_url_from_toranoana),
-                        ('dlsite', get_first_search_url_from_dlsite),
-                        ('booth', get_first_search_url_from_booth),
-                        ('alicebooks', get_first_search_url_from_alicebooks),
-                    ]
-                    results = {}
-                    for name, fn in search_fns:
-                        try:
-                            candidate = fn(value)
-                        except Exception:
-                            candidate = None
-                        if candidate and isinstance(candidate, str) and candidate.startswith('http'):
-                            results[name] = candidate
-
-                    # If no candidate links found yet, try FANZA as a last resort before giving up
-                    if not results:
-                        try:
-                            fz = get_first_search_url_from_fanza(value)
-                            if fz and isinstance(fz, str) and fz.startswith('http'):
-                                results['fanza'] = fz
-                        except Exception:
-                            pass
-                    if not results:
-                        print(f"Warning: no search result for query: {_safe_console_str(value)}", file=sys.stderr)
-                        # エラー時も空行を出力する
-                        print(f"\t\t{_safe_console_str(value)}\t\t\t\t\t")
-                        continue
-                    else:
-                        # Prefer a primary source for extraction: dlsite > booth > melonbooks > toranoana > alicebooks
-                        preferred = ['dlsite', 'booth', 'melonbooks', 'toranoana', 'alicebooks']
-                        primary = None
-                        for p in preferred:
-                            if p in results:
-                                primary = results[p]
-                                primary_name = p
-                                break
-                        # Ensure we also record fanza if present in results
-                        if 'fanza' in results:
-                            # already present
-                            pass
-                        else:
-                            # try to populate fanza as well using query
-                            try:
-                                fz = get_first_search_url_from_fanza(value)
-                                if fz and isinstance(fz, str) and fz.startswith('http'):
-                                    results['fanza'] = fz
-                            except Exception:
-                                pass
-                        # fallback to any found
-                        if primary is None:
-                            primary_name, primary = next(iter(results.items()))
-
-                        # Log all found candidate URLs
-                        found_list = ', '.join([f"{k}:{v}" for k, v in results.items()])
-                        print(f"Found URLs for query: {_safe_console_str(value)} -> {found_list}", file=sys.stderr)
-
-                        target_url = primary
-                        found_source = primary_name
-                try:
-                    # If the chosen primary source is FANZA, use the dedicated extractor
-                    if 'found_source' in locals() and found_source == 'fanza':
-                        try:
-                            info = extract_product_info_fanza(target_url)
-                            cleaned = target_url
-                        except Exception:
-                            raise ValueError(f"Unsupported or invalid URL: {target_url}")
-                    else:
-                        info, cleaned = execute_url(target_url)
-
-                    # Build site_urls mapping: prefer previously discovered `results` (if present), otherwise search by title
-                    title_q = info.get('作品名') or ''
-                    site_urls = {}
-                    # If we started from a raw query and found some candidate URLs, only use those sites' URLs.
-                    # Do NOT try to re-query other sites based on the title (this avoids spurious matches).
-                    if 'results' in locals() and isinstance(results, dict) and results:
-                        site_urls['dlsite'] = results.get('dlsite')
-                        site_urls['melonbooks'] = results.get('melonbooks')
-                        site_urls['toranoana'] = results.get('toranoana')
-                        site_urls['booth'] = results.get('booth')
-                        site_urls['fanza'] = results.get('fanza')
-                        site_urls['alicebooks'] = results.get('alicebooks')
-                    else:
-                        # No initial search results; perform fresh site searches by title
-                        site_urls['dlsite'] = get_first_search_url_from_dlsite(title_q)
-                        site_urls['melonbooks'] = get_first_search_url_from_melonbooks(title_q)
-                        site_urls['toranoana'] = get_first_search_url_from_toranoana(title_q)
-                        site_urls['booth'] = _find_booth_url_with_fallback(title_q, info.get('サークル名'), info.get('作家名'))
-                        site_urls['alicebooks'] = get_first_search_url_from_alicebooks(title_q)
-                        # Ensure FANZA slot exists even if empty
-                        site_urls['fanza'] = None
-
-                    # Fetch metadata from each available site
-                    site_infos = {k: _fetch_site_info(k, u) for k, u in site_urls.items()}
-
-                    # Priority for metadata: melonbooks > toranoana > alicebooks > dlsite = fanza > booth
-                    pref = ['melonbooks', 'toranoana', 'alicebooks', 'dlsite', 'fanza', 'booth']
-                    def pick(field):
-                        for s in pref:
-                            si = site_infos.get(s)
-                            if si and si.get(field):
-                                return si.get(field)
-                        return info.get(field)
-
-                    circle = pick('サークル名')
-                    author = pick('作家名')
-                    title = pick('作品名')
-                    release = pick('発売日')
-                    event = pick('イベント名')
-
-                    # Normalize release date to YYYY/MM/DD when possible
-                    release_norm = _normalize_date_to_ymd(release)
-
-                    dlsiteurl = site_urls.get('dlsite') or ''
-                    if dlsiteurl == 'N/A':
-                        dlsiteurl = ''
-                    fanza = site_urls.get('fanza') or ''
-                    if fanza == 'N/A':
-                        fanza = ''
-                    boothurl = site_urls.get('booth') or ''
-                    if boothurl == 'N/A':
-                        boothurl = ''
-                    toraurl = site_urls.get('toranoana') or ''
-                    if toraurl == 'N/A':
-                        toraurl = ''
-                    melonurl = site_urls.get('melonbooks') or ''
-                    if melonurl == 'N/A':
-                        melonurl = ''
-                    alicebooksurl = site_urls.get('alicebooks') or ''
-                    if alicebooksurl == 'N/A':
-                        alicebooksurl = ''
-
-                    print(f"{_safe_console_str(circle)}\t{_safe_console_str(author)}\t{_safe_console_str(title)}\t{_safe_console_str(release_norm)}\t{_safe_console_str(event)}\t{dlsiteurl}\t{fanza}\t{boothurl}\t{toraurl}\t{melonurl}\t{alicebooksurl}")
+        catalog.store(job['value'], job.get('merged'), job.get('site_urls') or {}, job.get('site_infos'), job['failed'],
+                      checked=[site for site in job['searched'] if site not in job['failed']])
+    except Exception as e:
+        print(f"Warning: could not update the catalog: {e}", file=sys.stderr)
 
+
+async def _run_stage(name, fn, inq, outq, workers, downstream_workers):
+    """Run `workers` tasks applying fn to jobs from inq, then signal the next stage."""
+    async def worker():
+        while True:
+            job = await inq.get()
+            if job is _DONE:
+                return
+            if not job.get('done'):
+                # requests and parses started from here are counted for this input line (--stats)
+                metrics.current_line.set(job['index'])
+                started = time.perf_counter()
+                try:
+                    await fn(job)
                 except Exception as e:
                     # Use safe string formatting for URLs or error messages that may contain unicode
-                    print(f"Error processing {_safe_console_str(target_url)}: {e}", file=sys.stderr)
-    except FileNotFoundError:
-        print(f"File not found: {file_path}", file=sys.stderr)
+                    target = job.get('target_url') or job['value']
+                    print(f"Error processing {_safe_console_str(target)}: {e}", file=sys.stderr)
+                    job['record'] = output.record(job['value'], status='error', error=str(e), failed=job['failed'])
+                    job['done'] = True
+                metrics.stage(name, job['index'], time.perf_counter() - started)
+            await outq.put(job)
+
+    await asyncio.gather(*[worker() for _ in range(workers)])
+    for _ in range(downstream_workers):
+        await outq.put(_DONE)
+
+
+async def run_pipeline(lines, emit, workers=DEFAULT_WORKERS, window=DEFAULT_WINDOW, fast=False, incremental=False):
+    """Resolve input lines through the search -> fetch -> merge -> emit stages and call emit(record) in input order.
+
+    Queues between stages are bounded and at most `window` lines are in flight, so memory stays flat
+    however long the input is. Blank lines are skipped; lines that fail give a record with status 'error'.
+    With fast=True, query lines take their metadata from the search results and only fetch
+    detail pages for fields those leave empty. With incremental=True, lines the catalog has a fresh
+    record for are answered from it without any request. Finished lines are recorded in the catalog if it is open.
+    If a checkpoint is open, finished rows and site lookups are saved there and rows an earlier attempt
+    finished are emitted from it.
+    """
+    search_q = asyncio.Queue(maxsize=workers)
+    fetch_q = asyncio.Queue(maxsize=workers)
+    merge_q = asyncio.Queue(maxsize=workers)
+    emit_q = asyncio.Queue(maxsize=workers)
+    slots = asyncio.Semaphore(window)
+
+    async def read():
+        index = 0
+        for line in lines:
+            value = line.strip()
+            if not value:
+                continue
+            await slots.acquire()
+            metrics.line_started(index, value)
+            job = {'index': index, 'value': value, 'failed': [], 'searched': []}
+            saved = checkpoint.finished_row(index, value)
+            work = catalog.lookup(value) if incremental and saved is None else None
+            if saved is not None:
+                job.update(record=json.loads(saved), done=True, cached=True)
+            elif work is not None:
+                # known and fresh: the stages pass it straight through to the writer
+                catalog.hits += 1
+                job.update(record=_catalog_record(value, work), done=True, cached=True)
+            await search_q.put(job)
+            index += 1
+        for _ in range(workers):
+            await search_q.put(_DONE)
+
+    async def write():
+        # Reorder buffer: rows finish out of order, print them as soon as every earlier row is out
+        pending = {}
+        next_index = 0
+        while True:
+            job = await emit_q.get()
+            if job is _DONE:
+                return
+            pending[job['index']] = job
+            while next_index in pending:
+                done = pending.pop(next_index)
+                _catalog_store(done)
+                record = done['record']
+                emit(record)
+                if record['status'] != 'error':
+                    # failed lines stay unfinished, --resume tries them again
+                    checkpoint.finish_row(done['index'], done['value'], output.jsonl_line(record))
+                slots.release()
+                next_index += 1
+
+    tasks = [
+        asyncio.ensure_future(read()),
+        asyncio.ensure_future(_run_stage('search', _search_stage, search_q, fetch_q, workers, workers)),
+        asyncio.ensure_future(_run_stage('fetch', functools.partial(_fetch_stage, fast=fast), fetch_q, merge_q, workers, 1)),
+        asyncio.ensure_future(_run_stage('merge', _merge_stage, merge_q, emit_q, 1, 1)),
+        asyncio.ensure_future(write()),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for t in tasks:
+            t.cancel()
+        # let cancelled stages unwind before returning (Ctrl+C: aio.run waits for this)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _refresh_candidates(works, sites, interval, now=None):
+    """(work, site) pairs worth searching again: the site's URL is empty and it was last checked more than
+    interval seconds ago, or it could not be reached last time. Newest releases first (they are the ones
+    still appearing on stores), then the site checked longest ago first (never checked ones before all others)."""
+    now = now or time.time()
+    pairs = []
+    for work in works:
+        for site in sites:
+            if work['urls'].get(site):
+                continue
+            checked = work['checked_at'].get(site)
+            if checked is not None and now - checked < interval and site not in work['failed']:
+                continue
+            pairs.append((work, site))
+    pairs.sort(key=lambda p: p[0]['checked_at'].get(p[1], 0))
+    # 発売日 is YYYY/MM/DD, so newer sorts higher as text; works without a date go last
+    pairs.sort(key=lambda p: (p[0]['merged'] or {}).get('発売日') or '', reverse=True)
+    return pairs
+
+
+async def _refresh_lookup(work, site, query):
+    """Search one site for a work again; returns (url or None, info or None)."""
+    merged = work['merged'] or {}
+    # the remembered "N/A" is what is being re-checked
+    memo.forget(site, query)
+    if site == 'booth':
+        url = await _find_booth_url_with_fallback(query, merged.get('サークル名'), merged.get('作家名'))
+    else:
+        url = await dict(SEARCH_FNS)[site](query)
+    if not _is_url(url):
+        return None, None
+    return url, await _fetch_site_info(site, url)
+
+
+async def refresh_catalog(lines, emit, budget=DEFAULT_REFRESH_BUDGET, sites=None, interval=DEFAULT_REFRESH_INTERVAL,
+                          workers=DEFAULT_WORKERS):
+    """Re-query only the empty URL columns of the input lines' catalog records, then emit every line's row in order.
+
+    Lookups run in _refresh_candidates order, each only once the budget has room for its REFRESH_LOOKUP_COST on
+    top of the requests sent and the cost reserved by the lookups still running, so `budget` is never exceeded;
+    the rest is left for the next run. Lines the catalog does not know are not searched; they get an empty
+    row like a line nothing was found for.
+    """
+    values = [v for v in (line.strip() for line in lines) if v]
+    works = {}
+    for value in values:
+        work = catalog.find(value)
+        if work is None:
+            print(f"Warning: not in the catalog, run without --refresh first: {_safe_console_str(value)}", file=sys.stderr)
+        elif work['id'] not in works:
+            works[work['id']] = dict(work, value=value)
+    pending = _refresh_candidates(list(works.values()), sites or REFRESH_SITES, interval)
+    total = len(pending)
+    start = aio.requests_sent
+    results = {}
+
+    reserved = 0
+    finished = asyncio.Condition()
+
+    def fits(cost):
+        return aio.requests_sent - start + reserved + cost <= budget
+
+    def cost_of(site):
+        return REFRESH_LOOKUP_COST.get(site, 1) * (aio.MAX_RETRIES + 1)
+
+    def next_fitting():
+        # the first pending lookup the budget has room for; a costly one (booth) does not hold up cheaper ones
+        return next((i for i, (_, site) in enumerate(pending) if fits(cost_of(site))), None)
+
+    async def worker():
+        nonlocal reserved
+        while pending:
+            i = next_fitting()
+            if i is None:
+                if not reserved:
+                    # nothing running that could give budget back
+                    return
+                async with finished:
+                    await finished.wait_for(lambda: not reserved or next_fitting() is not None)
+                continue
+            work, site = pending.pop(i)
+            cost = cost_of(site)
+            reserved += cost
+            query = (work['merged'] or {}).get('作品名') or work['value']
+            try:
+                results.setdefault(work['id'], {})[site] = await _refresh_lookup(work, site, query)
+            except aio.TransientError as e:
+                print(f"Warning: {site} lookup failed: {_safe_console_str(str(e))}", file=sys.stderr)
+                results.setdefault(work['id'], {})[site] = e
+            except Exception:
+                results.setdefault(work['id'], {})[site] = (None, None)
+            finally:
+                reserved -= cost
+                async with finished:
+                    finished.notify_all()
+
+    await asyncio.gather(*[worker() for _ in range(max(1, workers))])
+
+    found = 0
+    for work_id, answers in results.items():
+        work = works[work_id]
+        urls = dict(work['urls'])
+        site_infos = dict(work['site_infos'])
+        failed = set(work['failed']) - set(answers)
+        for site, answer in answers.items():
+            if isinstance(answer, Exception):
+                failed.add(site)
+                continue
+            url, info = answer
+            if url:
+                found += 1
+                print(f"Found {site} URL for: {_safe_console_str(work['value'])} -> {url}", file=sys.stderr)
+                urls[site] = url
+                site_infos[site] = info
+        merged = work['merged']
+        if any(urls.values()):
+            merged = _merge_site_infos(merged or {'作品名': work['value']}, site_infos)
+        # unreachable sites keep their last check time (and are in failed), so the next run asks them again
+        catalog.store(work['value'], merged, urls, site_infos, failed,
+                      checked=[site for site, answer in answers.items() if not isinstance(answer, Exception)])
+
+    for value in values:
+        work = catalog.find(value)
+        emit(_catalog_record(value, work) if work else output.record(value, status='not_found'))
+    checked = sum(len(a) for a in results.values())
+    print(f"Refresh: {checked} of {total} site lookups done with {aio.requests_sent - start} requests, "
+          f"{found} new URLs" + (f"; {len(pending)} left for the next run (budget {budget})" if pending else ''),
+          file=sys.stderr)
+
+
+def _catalog_work_for_row(fields, urls):
+    """The catalog record of an exported row's work, or None: found by its title (as an input line, then as
+    a merged title), or for a row without a title by one of its URLs. Product URLs are not matched for
+    rows with a title, since different titles can share a wrongly found product page."""
+    if not catalog.is_open():
+        return None
+    title = fields.get('作品名')
+    if title:
+        return catalog.find(title) or catalog.find_by_hint(title)
+    for url in (u for u in urls.values() if _is_url(u)):
+        work = catalog.find(url) or catalog.find_by_hint(url)
+        if work is not None:
+            return work
+    return None
+
+
+async def _enrich_row(fields, urls, sites=None, interval=DEFAULT_REFRESH_INTERVAL):
+    """Resolve only the empty cells of one row of an exported TSV, starting from what the row already has.
+
+    Empty fields are read from the row's own product pages (or the catalog's copy of them) and empty URL
+    columns are searched with the row's title, circle and author; cells that are filled are never looked up.
+    Sites the catalog checked for this work within `interval` seconds are not searched again.
+    Returns ({field: value}, {site: url}, sources, failed) for the cells that were filled.
+    """
+    missing_fields = [f for f in output.FIELDS if not fields.get(f)]
+    missing_sites = [s for s in (sites or URL_COLUMNS) if not urls.get(s)]
+    known = {s: u for s, u in urls.items() if _is_url(u)}
+    new_urls = {}
+    site_infos = {}
+    failed = []
+    searched = []
+
+    work = _catalog_work_for_row(fields, urls)
+    if work is not None:
+        now = time.time()
+        for site in list(missing_sites):
+            if _is_url(work['urls'].get(site)):
+                new_urls[site] = work['urls'][site]
+                missing_sites.remove(site)
+            elif site not in work['failed'] and now - work['checked_at'].get(site, 0) < interval:
+                # searched recently and not there
+                missing_sites.remove(site)
+        # product pages the catalog already read, if they are the row's pages
+        for site, info in work['site_infos'].items():
+            url = known.get(site) or new_urls.get(site)
+            if info and url and _is_url(work['urls'].get(site)) \
+                    and catalog.canonical_url(work['urls'][site]) == catalog.canonical_url(url):
+                site_infos[site] = info
+
+    def empty_fields():
+        merged = _merge_site_infos({}, site_infos)
+        return [f for f in missing_fields if not merged.get(f)]
+
+    async def read_pages(site_urls):
+        # one page at a time in INFO_PREF order, only while a field is still empty
+        for site in INFO_PREF:
+            url = site_urls.get(site)
+            if not _is_url(url) or site in site_infos or not empty_fields():
+                continue
+            try:
+                site_infos[site] = await _fetch_site_info(site, url)
+            except aio.TransientError as e:
+                print(f"Warning: {site} lookup failed: {_safe_console_str(str(e))}", file=sys.stderr)
+                failed.append(site)
+
+    await read_pages(dict(known, **new_urls))
+    merged = _merge_site_infos({}, site_infos)
+    title = fields.get('作品名') or merged.get('作品名')
+    if title and not _is_url(title) and missing_sites:
+        circle = fields.get('サークル名') or merged.get('サークル名')
+        author = fields.get('作家名') or merged.get('作家名')
+        searches = {site: _find_booth_url_with_fallback(title, circle, author) if site == 'booth'
+                    else dict(SEARCH_FNS)[site](title) for site in missing_sites}
+        found = await _gather_dict(searches, failed)
+        searched = [site for site in missing_sites if site not in failed]
+        new_urls.update({site: url for site, url in found.items() if _is_url(url)})
+        await read_pages(new_urls)
+
+    sources = {}
+    merged = _merge_site_infos({}, site_infos, sources)
+    filled = {f: merged[f] for f in missing_fields if merged.get(f)}
+
+    if catalog.is_open() and (searched or filled or new_urls):
+        row_fields = {f: fields.get(f) or filled.get(f) for f in output.FIELDS}
+        row_urls = {s: known.get(s) or new_urls.get(s) for s in URL_COLUMNS}
+        if work is not None:
+            site_infos = dict(work['site_infos'], **site_infos)
+        key = row_fields['作品名'] or next((u for u in row_urls.values() if u), None)
+        if key:
+            try:
+                catalog.store(key, row_fields if any(row_fields.values()) else None, row_urls, site_infos, failed,
+                              checked=searched)
+            except Exception as e:
+                print(f"Warning: could not update the catalog: {e}", file=sys.stderr)
+    return filled, new_urls, {f: sources[f] for f in filled}, failed
+
+
+async def enrich_tsv(lines, emit, sites=None, interval=DEFAULT_REFRESH_INTERVAL, workers=DEFAULT_WORKERS,
+                     window=DEFAULT_WINDOW):
+    """Fill only the empty cells of a previously exported TSV and call emit(record, line) for every row in input order.
+
+    Rows without empty cells, and rows nothing new was found for, are written back byte for byte (line ending
+    included); in the others only the empty cells change. Rows that are not data rows (blank lines, the
+    header, rows with too many columns) and rows that fail are written back unchanged as well.
+    """
+    slots = asyncio.Semaphore(workers)
+    pending = collections.deque()
+    counts = {'rows': 0, 'changed': 0, 'cells': 0}
+    start = aio.requests_sent
+
+    async def enrich(index, line):
+        parsed = output.parse_tsv_row(line)
+        if parsed is None or not line.strip():
+            return None, line
+        fields, urls, cells, ending = parsed
+        value = fields['作品名'] or next((u for u in urls.values() if u), '')
+        if all(fields.values()) and all(urls.get(s) for s in (sites or URL_COLUMNS)):
+            return output.record(value, fields, urls), line
+        counts['rows'] += 1
+        async with slots:
+            metrics.line_started(index, value)
+            metrics.current_line.set(index)
+            try:
+                filled, new_urls, sources, failed = await _enrich_row(fields, urls, sites, interval)
+            except Exception as e:
+                print(f"Error processing {_safe_console_str(value)}: {e}", file=sys.stderr)
+                return output.record(value, status='error', error=str(e)), line
+        if new_urls:
+            print(f"Found URLs for: {_safe_console_str(value)} -> "
+                  f"{', '.join(f'{k}:{v}' for k, v in new_urls.items())}", file=sys.stderr)
+        fields = dict(fields, **filled)
+        urls = dict(urls, **new_urls)
+        status = 'ok' if any(_is_url(u) for u in urls.values()) else 'not_found'
+        rec = output.record(value, fields, urls, sources, status=status, failed=failed)
+        if not filled and not new_urls:
+            return rec, line
+        counts['changed'] += 1
+        counts['cells'] += len(filled) + len(new_urls)
+        for i, f in enumerate(output.FIELDS):
+            if f in filled:
+                cells[i] = output.tsv_cell(filled[f])
+        for i, site in enumerate(URL_COLUMNS):
+            if site in new_urls:
+                cells[len(output.FIELDS) + i] = output.tsv_cell(new_urls[site])
+        return rec, '\t'.join(cells) + ending
+
+    try:
+        for index, line in enumerate(lines):
+            pending.append(asyncio.ensure_future(enrich(index, line)))
+            # rows are written in input order as soon as every earlier row is out
+            while pending and (pending[0].done() or len(pending) >= window):
+                emit(*await pending.popleft())
+        while pending:
+            emit(*await pending.popleft())
+    finally:
+        for t in pending:
+            t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    print(f"Enrich: {counts['rows']} rows with empty cells, {counts['cells']} cells filled in {counts['changed']} rows "
+          f"with {aio.requests_sent - start} requests", file=sys.stderr)
+
+
+async def resolve_url(url):
+    """Resolve a product URL given on the command line and return its output record (same schema as file lines)."""
+    info, cleaned = await execute_url_async(url)
+    failed = []
+    # Build search URLs for related sites based on extracted title
+    site_urls = await _search_sites_by_title(info, include_fanza=True, failed=failed)
+    # Fetch metadata from available sites
+    site_infos = await _fetch_all_site_infos(site_urls, failed)
+    sources = {}
+    merged = _merge_site_infos(info, site_infos, sources, 'url')
+    return output.record(url, merged, site_urls, sources, failed=failed)
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description='Resolve doujin titles or product URLs to a TSV row per line.')
+    parser.add_argument('target', help='input file (one title or URL per line) or a single product URL')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'concurrent lines per pipeline stage (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW,
+                        help=f'max input lines in flight, bounds memory on large inputs (default: {DEFAULT_WINDOW})')
+    parser.add_argument('--pool-size', type=int, default=aio.POOL_PER_HOST,
+                        help=f'kept-alive connections per storefront host (default: {aio.POOL_PER_HOST})')
+    parser.add_argument('--preconnect', action='store_true',
+                        help='open connections to all storefront hosts before the first lookup')
+    parser.add_argument('--cookie-file', default=aio.COOKIE_FILE,
+                        help='where age-verification and site cookies are kept between runs')
+    parser.add_argument('--no-cookie-file', action='store_true', help='do not load or save cookies')
+    parser.add_argument('--no-cache', action='store_true', help='do not use the on-disk response cache')
+    parser.add_argument('--cache-file', default=aio.CACHE_FILE, help='response cache database')
+    parser.add_argument('--cache-max-mb', type=int, default=httpcache.DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help='size bound of the response cache in MB')
+    parser.add_argument('--search-ttl', type=float, default=httpcache.DEFAULT_TTL['search'] / 3600,
+                        help='hours a cached search page stays fresh')
+    parser.add_argument('--product-ttl', type=float, default=httpcache.DEFAULT_TTL['product'] / 86400,
+                        help='days a cached product page stays fresh')
+    parser.add_argument('--rate', type=float, default=ratelimit.DEFAULT_RATE,
+                        help=f'requests per second per storefront host (default: {ratelimit.DEFAULT_RATE})')
+    parser.add_argument('--burst', type=int, default=ratelimit.DEFAULT_BURST,
+                        help=f'requests a host may get back to back (default: {ratelimit.DEFAULT_BURST})')
+    parser.add_argument('--retries', type=int, default=aio.MAX_RETRIES,
+                        help=f'retries for throttled/failed requests (default: {aio.MAX_RETRIES})')
+    parser.add_argument('--no-memo', action='store_true',
+                        help='do not remember search answers between runs (still shared within a run)')
+    parser.add_argument('--memo-ttl', type=float, default=memo.HIT_TTL / 86400,
+                        help='days a remembered search hit stays valid ("N/A" answers: 1 day)')
+    parser.add_argument('--fast', action='store_true',
+                        help='use title/circle/author/date shown in search results; fetch detail pages only for missing fields')
+    parser.add_argument('--stream', action='store_true',
+                        help='stop downloading a product page once every field it provides has been read (melonbooks, toranoana)')
+    parser.add_argument('--parser', choices=htmlparse.PREFERRED_BACKENDS, default=None,
+                        help=f'HTML parser backend (default: fastest installed, now {htmlparse.BACKEND})')
+    parser.add_argument('--api', action='store_true',
+                        help='try the JSON APIs before scraping product pages (booth, dlsite); faster, '
+                             'but Booth gives no 作家名 and DLsite no イベント名 that way')
+    parser.add_argument('--stats', action='store_true',
+                        help='print latency percentiles, request counts, bytes, N/A rate and cache hits per site at the end')
+    parser.add_argument('--metrics-json', default=None, metavar='PATH',
+                        help='write the run metrics (per site, per stage and per input line) to PATH as JSON')
+    parser.add_argument('--incremental', action='store_true',
+                        help='print lines the catalog already resolved at once; search only new or stale ones')
+    parser.add_argument('--catalog-file', default=aio.CATALOG_FILE, help='catalog of resolved works')
+    parser.add_argument('--no-catalog', action='store_true', help='do not use the catalog of resolved works (no --incremental either)')
+    parser.add_argument('--catalog-ttl', type=float, default=catalog.HIT_TTL / 86400,
+                        help='days a resolved work is reused by --incremental (works with nothing found: 1 day)')
+    parser.add_argument('--refresh', action='store_true',
+                        help='search again only the sites whose URL column is empty in the catalog, newest works first')
+    parser.add_argument('--budget', type=int, default=DEFAULT_REFRESH_BUDGET,
+                        help=f'requests one --refresh run may send (default: {DEFAULT_REFRESH_BUDGET})')
+    parser.add_argument('--refresh-sites', default=','.join(REFRESH_SITES), metavar='SITES',
+                        help='comma-separated sites --refresh / --enrich search (default: all, e.g. dlsite,fanza)')
+    parser.add_argument('--refresh-interval', type=float, default=DEFAULT_REFRESH_INTERVAL / 86400,
+                        help='days before --refresh / --enrich ask a site about the same work again (default: %(default)s)')
+    parser.add_argument('--enrich', action='store_true',
+                        help='target is a TSV exported earlier: fill only its empty cells, searching with what each row '
+                             'already has; other rows are written back unchanged')
+    parser.add_argument('--jsonl', default=None, metavar='PATH',
+                        help='also write one JSON record per line (fields, URLs, which site gave each field, errors) '
+                             'to PATH; "-" writes them to stdout instead of the TSV')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue an interrupted run of the same input file: finished lines and lookups are not redone')
+    parser.add_argument('--checkpoint-file', default=None, metavar='PATH',
+                        help='where the progress of this input is saved (default: .searchdojin/checkpoints/<input>-<hash>.sqlite)')
+    parser.add_argument('--no-checkpoint', action='store_true', help='do not save progress while running')
+    parser.add_argument('--mock-server', default=aio.MOCK_SERVER, metavar='URL',
+                        help='send every request to a local mockserver.py (e.g. http://127.0.0.1:8800) instead of the sites')
+    return parser.parse_args(argv)
+
+
+def _report_metrics(args):
+    """--stats / --metrics-json output at the end of a run."""
+    if args.stats:
+        metrics.print_summary(sys.stderr)
+    if args.metrics_json:
+        try:
+            metrics.dump(args.metrics_json)
+        except OSError as e:
+            print(f"Could not write metrics: {e}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    args = _parse_args(sys.argv[1:])
+    file_path = args.target
+    aio.configure(pool_per_host=max(1, args.pool_size))
+    ratelimit.configure(rate=args.rate, burst=args.burst)
+    aio.MAX_RETRIES = max(0, args.retries)
+    if args.parser:
+        try:
+            htmlparse.set_backend(args.parser)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+    htmlparse.STREAMING = args.stream
+    booth.USE_API = dlsite.USE_API = args.api
+    metrics.ENABLED = args.stats or bool(args.metrics_json)
+    memo_file = aio.MEMO_FILE
+    state_dir = aio.STATE_DIR
+    if args.mock_server:
+        # mock answers must not end up in the real cache/memo, nor mock cookies in the cookie file
+        aio.use_mock_server(args.mock_server)
+        args.no_cookie_file = True
+        mock_dir = state_dir = os.path.join(aio.STATE_DIR, 'mock')
+        os.makedirs(mock_dir, exist_ok=True)
+        memo_file = os.path.join(mock_dir, os.path.basename(aio.MEMO_FILE))
+        if args.cache_file == aio.CACHE_FILE:
+            args.cache_file = os.path.join(mock_dir, os.path.basename(aio.CACHE_FILE))
+        if args.catalog_file == aio.CATALOG_FILE:
+            args.catalog_file = os.path.join(mock_dir, os.path.basename(aio.CATALOG_FILE))
+    if not args.no_cookie_file:
+        aio.load_cookies(args.cookie_file)
+    if not args.no_memo:
+        os.makedirs(aio.STATE_DIR, exist_ok=True)
+        memo.configure(hit_ttl=args.memo_ttl * 86400)
+        memo.open_memo(memo_file)
+    if not args.no_cache:
+        httpcache.configure(search_ttl=args.search_ttl * 3600, product_ttl=args.product_ttl * 86400)
+        aio.enable_cache(args.cache_file, max_bytes=args.cache_max_mb * 1024 * 1024)
+    if not args.no_catalog:
+        os.makedirs(os.path.dirname(os.path.abspath(args.catalog_file)), exist_ok=True)
+        catalog.configure(hit_ttl=args.catalog_ttl * 86400)
+        catalog.open_catalog(args.catalog_file)
+    if args.preconnect:
+        aio.run(aio.preconnect())
+
+    try:
+        if args.jsonl == '-':
+            writer = output.Writer(jsonl=sys.stdout)
+        else:
+            writer = output.Writer(tsv=sys.stdout, jsonl=open(args.jsonl, 'w', encoding='utf-8', errors='replace')
+                                   if args.jsonl else None)
+    except OSError as e:
+        print(f"Could not open {args.jsonl}: {e}", file=sys.stderr)
         sys.exit(1)
-    except Exception as e:
-        print(f"Error reading file: {e}", file=sys.stderr)
-        sys.exit(1)
\ No newline at end of file
+
+    try:
+        if 'https://' in file_path:
+            # 直接URLが渡された場合
+            try:
+                writer.write(aio.run(resolve_url(file_path)))
+                _report_metrics(args)
+            except Exception as e:
+                print(f"Error processing {_safe_console_str(file_path)}: {e}", file=sys.stderr)
+                sys.exit(1)
+            sys.exit(0)
+
+        sites = [s.strip() for s in args.refresh_sites.split(',') if s.strip()]
+        unknown = [s for s in sites if s not in URL_COLUMNS]
+        if unknown:
+            print(f"Unknown site: {', '.join(unknown)} (one of {', '.join(URL_COLUMNS)})", file=sys.stderr)
+            sys.exit(1)
+
+        if args.enrich:
+            try:
+                # newline='' keeps each row's own line ending, so rows that are not changed come out byte for byte
+                with open(file_path, 'r', encoding='utf-8', newline='') as f:
+                    aio.run(enrich_tsv(f, writer.write, sites=sites, interval=args.refresh_interval * 86400,
+                                       workers=max(1, args.workers), window=max(1, args.window)))
+                _report_metrics(args)
+            except FileNotFoundError:
+                print(f"File not found: {file_path}", file=sys.stderr)
+                sys.exit(1)
+            sys.exit(0)
+
+        if args.refresh:
+            if not catalog.is_open():
+                print("--refresh needs the catalog (drop --no-catalog)", file=sys.stderr)
+                sys.exit(1)
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    aio.run(refresh_catalog(f, writer.write, budget=max(0, args.budget), sites=sites,
+                                            interval=args.refresh_interval * 86400, workers=max(1, args.workers)))
+                _report_metrics(args)
+            except FileNotFoundError:
+                print(f"File not found: {file_path}", file=sys.stderr)
+                sys.exit(1)
+            sys.exit(0)
+
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                if not args.no_checkpoint:
+                    checkpoint.open_checkpoint(args.checkpoint_file or checkpoint.path_for(state_dir, file_path),
+                                               resume=args.resume)
+                aio.run(run_pipeline(f, writer.write, workers=max(1, args.workers), window=max(1, args.window), fast=args.fast,
+                                     incremental=args.incremental))
+            # finished: nothing left to resume
+            checkpoint.close_checkpoint(remove=True)
+            print(f"Saved requests: {singleflight.saved} shared with an identical lookup, "
+                  f"{memo.hits} searches answered from memo, {catalog.hits} lines from the catalog", file=sys.stderr)
+            if args.resume:
+                print(f"Resumed: {checkpoint.resumed_rows} lines and {checkpoint.resumed_lookups} site lookups "
+                      f"from the checkpoint", file=sys.stderr)
+            _report_metrics(args)
+        except KeyboardInterrupt:
+            print("Interrupted; run again with --resume to continue", file=sys.stderr)
+            sys.exit(130)
+        except FileNotFoundError:
+            print(f"File not found: {file_path}", file=sys.stderr)
+            sys.exit(1)
+        except Exception as e:
+            print(f"Error reading file: {e}", file=sys.stderr)
+            if checkpoint.is_open():
+                print("Progress is saved; run again with --resume to continue", file=sys.stderr)
+            sys.exit(1)
+    finally:
+        # closes the --jsonl file (stdout is left open)
+        writer.close()
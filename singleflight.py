@@ -0,0 +1,70 @@
+import asyncio
+import collections
+import functools
+
+# Finished results are kept for the rest of the run so repeated lookups (duplicate input lines, the primary
+# page that is also one of the site pages) reuse them. Bounded so long runs keep a flat memory profile.
+MAX_RESULTS = 20000
+
+_inflight = {}
+_results = collections.OrderedDict()
+
+# How many calls were answered by another call's fetch instead of sending their own request
+saved = 0
+
+
+async def do(key, fn, *args):
+    """Run fn(*args) once per key: concurrent callers await the same task and later callers get its result.
+
+    Exceptions are passed to everyone waiting at the time but not remembered, so a later call tries again.
+    """
+    global saved
+    if key in _results:
+        saved += 1
+        _results.move_to_end(key)
+        return _results[key]
+    fut = _inflight.get(key)
+    if fut is not None:
+        saved += 1
+        return await asyncio.shield(fut)
+
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[key] = fut
+    try:
+        result = await fn(*args)
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except BaseException as e:
+        fut.set_exception(e)
+        # mark retrieved so nobody-else-was-waiting does not log "exception never retrieved"
+        fut.exception()
+        raise
+    finally:
+        _inflight.pop(key, None)
+    fut.set_result(result)
+    _results[key] = result
+    if len(_results) > MAX_RESULTS:
+        _results.popitem(last=False)
+    return result
+
+
+def coalesced(namespace, key_fn=None):
+    """Decorator for single-argument async lookups (a URL or a query): identical calls share one fetch.
+
+    key_fn normalizes the argument into the key (default: the argument itself).
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(arg):
+            key = (namespace, key_fn(arg) if key_fn else arg)
+            return await do(key, fn, arg)
+        return wrapper
+    return decorator
+
+
+def reset():
+    """Forget remembered results and the saved counter (e.g. between independent runs in one process)."""
+    global saved
+    _results.clear()
+    saved = 0
@@ -0,0 +1,197 @@
+import re
+from bs4 import NavigableString
+import htmlparse
+
+# Fields every extractor returns, in this order
+FIELDS = ['作品名', 'サークル名', '作家名', '発売日', 'イベント名']
+
+# A site spec is a list of rules applied in order. Each rule finds one element, turns it into a value
+# and assigns parts of that value to fields. Where the element is (exactly one of):
+#   'tag': name, 'attrs': {attr: str or regex}  first such tag (True: any tag; class matches any of its classes)
+#   'meta': property                             first <meta property=...>; the value is its content
+#   'label': (names, regex)                      first such tag whose .string matches, like find(name, string=...);
+#                                                'label_text': True matches its whole text instead
+#   'row': regex                                 first <tr> with 2+ th/td cells whose first cell text matches;
+#                                                the value comes from the second cell
+#   'string': regex                              first text node matching, like find(string=...)
+# Moving from there to the element holding the value:
+#   'next': name                                 find_next_sibling(name) ('string' rules: of the text's parent;
+#                                                True for any tag)
+#   'following': name                            find_next(name), anywhere after
+# Reading the value (default: the element's text, stripped):
+#   'attr': name                                 that attribute
+#   'find': name                                 the text of the first such descendant; the rule fails without one
+#   'prefer': name                               the text of the first such descendant if it has any, else the
+#                                                element's; with 'join': sep, all such descendants joined
+# Post-processing and assignment:
+#   'split': sep / 'pattern': regex              value split into parts / regex groups (no match: the rule fails)
+#   'fields': {field: index}                     part or group per field (0 = the whole value)
+#   'replace': [(old, new)]                      applied to every assigned value
+#   'override': True                             replace values earlier rules set (default: fill empty fields only)
+#   'unless': field                              skip the rule when that field already has a value
+# 'missing' is what fields nobody filled are returned as (default None).
+
+
+def _attr_matcher(expected):
+    if isinstance(expected, str):
+        def match(value):
+            if isinstance(value, list):
+                return expected in value or ' '.join(value) == expected
+            return value == expected
+    else:
+        rx = expected
+
+        def match(value):
+            if isinstance(value, list):
+                return any(rx.search(v) for v in value) or rx.search(' '.join(value)) is not None
+            return rx.search(value) is not None
+    return match
+
+
+def _where(rule):
+    """Return (key, is_string, predicate) for the element a rule starts from."""
+    if 'tag' in rule:
+        name = rule['tag']
+        attrs = [(k, _attr_matcher(v)) for k, v in (rule.get('attrs') or {}).items()]
+
+        def pred(el):
+            return (name is True or el.name == name) and all(el.get(k) is not None and m(el.get(k)) for k, m in attrs)
+        key = ('tag', name, tuple(sorted((k, str(v)) for k, v in (rule.get('attrs') or {}).items())))
+        return key, False, pred
+    if 'meta' in rule:
+        prop = rule['meta']
+        return ('meta', prop), False, lambda el: el.name == 'meta' and el.get('property') == prop
+    if 'label' in rule:
+        names, pattern = rule['label']
+        names = (names,) if isinstance(names, str) else tuple(names)
+        rx = re.compile(pattern)
+        if rule.get('label_text'):
+            def pred(el):
+                return el.name in names and rx.search(el.get_text(strip=True)) is not None
+        else:
+            def pred(el):
+                return el.name in names and el.string is not None and rx.search(el.string) is not None
+        return ('label', names, pattern, bool(rule.get('label_text'))), False, pred
+    if 'row' in rule:
+        rx = re.compile(rule['row'])
+
+        def pred(el):
+            if el.name != 'tr':
+                return False
+            cells = el.find_all(['th', 'td'])
+            return len(cells) >= 2 and rx.search(cells[0].get_text(strip=True)) is not None
+        return ('row', rule['row']), False, pred
+    if 'string' in rule:
+        rx = re.compile(rule['string'])
+        return ('string', rule['string']), True, lambda el: rx.search(el) is not None
+    raise ValueError(f"site spec rule has no element to start from: {rule}")
+
+
+def compile_spec(rules, missing=None):
+    """Compile a site's rules once at import: regexes and element predicates are built here, not per page."""
+    compiled = []
+    for rule in rules:
+        key, is_string, pred = _where(rule)
+        c = dict(rule)
+        c['_key'] = key
+        c['_is_string'] = is_string
+        c['_pred'] = pred
+        if 'pattern' in rule:
+            c['_pattern'] = re.compile(rule['pattern'])
+        compiled.append(c)
+    return {'rules': compiled, 'missing': missing}
+
+
+def _first_matches(soup, rules):
+    # One pass over the tree: the first element each distinct "where" matches, stopping once all are found
+    tag_preds = {}
+    string_preds = {}
+    for r in rules:
+        (string_preds if r['_is_string'] else tag_preds)[r['_key']] = r['_pred']
+    found = {}
+    for el in soup.descendants:
+        preds = string_preds if isinstance(el, NavigableString) else tag_preds
+        if not preds:
+            continue
+        for key, pred in list(preds.items()):
+            if pred(el):
+                found[key] = el
+                del preds[key]
+        if not tag_preds and not string_preds:
+            break
+    return found
+
+
+def _text(el):
+    return el.get_text(strip=True)
+
+
+def _value(rule, el):
+    if 'row' in rule:
+        el = el.find_all(['th', 'td'])[1]
+    elif rule['_is_string']:
+        el = el.parent
+    if 'next' in rule:
+        el = el.find_next_sibling() if rule['next'] is True else el.find_next_sibling(rule['next'])
+    elif 'following' in rule:
+        el = el.find_next(rule['following'])
+    if el is None:
+        return None
+    if 'meta' in rule:
+        return (el.get('content') or '').strip()
+    if 'attr' in rule:
+        return (el.get(rule['attr']) or '').strip()
+    if 'find' in rule:
+        sub = el.find(rule['find'])
+        return _text(sub) if sub is not None else None
+    if 'prefer' in rule:
+        if 'join' in rule:
+            subs = el.find_all(rule['prefer'])
+            if subs:
+                return rule['join'].join(_text(s) for s in subs)
+        else:
+            sub = el.find(rule['prefer'])
+            if sub is not None and _text(sub):
+                return _text(sub)
+    return _text(el)
+
+
+def _groups(rule, value):
+    if 'split' in rule:
+        return dict(enumerate(p.strip() for p in value.split(rule['split'])))
+    if '_pattern' in rule:
+        m = rule['_pattern'].search(value)
+        if not m:
+            return None
+        return {i: (m.group(i) or '').strip() for i in range(len(m.groups()) + 1)}
+    return {0: value}
+
+
+def extract(spec, content):
+    """Run a compiled spec over a product page (str or bytes) and return the common info dict."""
+    soup = htmlparse.make_soup(content)
+    rules = spec['rules']
+    found = _first_matches(soup, rules)
+    info = dict.fromkeys(FIELDS)
+    for rule in rules:
+        if rule.get('unless') and info.get(rule['unless']):
+            continue
+        el = found.get(rule['_key'])
+        if el is None:
+            continue
+        value = _value(rule, el)
+        if not value:
+            continue
+        groups = _groups(rule, value)
+        if groups is None:
+            continue
+        for field, index in rule['fields'].items():
+            v = groups.get(index)
+            if not v or (info[field] and not rule.get('override')):
+                continue
+            for old, new in rule.get('replace', ()):
+                v = v.replace(old, new)
+            info[field] = v
+    if spec['missing'] is not None:
+        info = {k: (v if v else spec['missing']) for k, v in info.items()}
+    return info
@@ -0,0 +1,133 @@
+import json
+import re
+from bs4 import NavigableString
+
+# schema.org types that describe a work (JSON-LD @type / microdata itemtype)
+WORK_TYPES = {
+    'Product', 'Book', 'CreativeWork', 'ComicStory', 'ComicIssue', 'ComicSeries', 'VideoGame', 'Game',
+    'SoftwareApplication', 'MusicAlbum', 'MusicRecording', 'Movie', 'DigitalDocument', 'IndividualProduct',
+}
+
+# schema.org properties per field, first present wins
+FIELD_PROPS = {
+    '作品名': ['name'],
+    'サークル名': ['brand', 'publisher', 'manufacturer'],
+    '作家名': ['author', 'creator'],
+    '発売日': ['datePublished', 'releaseDate'],
+}
+
+ISO_DATETIME = re.compile(r'^(\d{4}-\d{2}-\d{2})T(\d{2}:\d{2})')
+
+
+def _types(value):
+    # '@type' / itemtype can be a list and itemtype a full URL: https://schema.org/Book
+    if isinstance(value, str):
+        value = value.split()
+    return {t.rstrip('/').rsplit('/', 1)[-1] for t in value or [] if isinstance(t, str)}
+
+
+def _name(value):
+    """Text of a JSON-LD property value: a string, {"name": ...}, or a list of either (joined with ', ')."""
+    if isinstance(value, str):
+        return value.strip() or None
+    if isinstance(value, dict):
+        return _name(value.get('name'))
+    if isinstance(value, list):
+        names = [n for n in (_name(v) for v in value) if n]
+        return ', '.join(names) or None
+    return None
+
+
+def format_date(value):
+    """ISO 8601 as in schema.org and store APIs ("2025-12-28T10:00:00+09:00") -> "2025-12-28 10:00"; other text as is."""
+    if not isinstance(value, str):
+        return None
+    m = ISO_DATETIME.match(value)
+    return f"{m.group(1)} {m.group(2)}" if m else value
+
+
+def _ld_items(data):
+    # Walk a JSON-LD document (objects, lists, @graph) and yield every object
+    if isinstance(data, list):
+        for d in data:
+            yield from _ld_items(d)
+    elif isinstance(data, dict):
+        yield data
+        if '@graph' in data:
+            yield from _ld_items(data['@graph'])
+
+
+def _from_json_ld(scripts, info):
+    for script in scripts:
+        try:
+            data = json.loads(script.string or '', strict=False)
+        except ValueError:
+            continue
+        for item in _ld_items(data):
+            if not _types(item.get('@type')) & WORK_TYPES:
+                continue
+            for field, props in FIELD_PROPS.items():
+                if info[field]:
+                    continue
+                for prop in props:
+                    v = _name(item.get(prop))
+                    if v:
+                        info[field] = v
+                        break
+
+
+def _microdata_value(el):
+    # itemprop value: content/datetime attributes, a nested item's name, or the element's text
+    for attr in ('content', 'datetime'):
+        if el.get(attr):
+            return el[attr].strip()
+    if el.has_attr('itemscope'):
+        name = el.find(attrs={'itemprop': 'name'})
+        if name is not None:
+            return _microdata_value(name)
+    return el.get_text(strip=True) or None
+
+
+def _scope_type(el):
+    # the item a property belongs to is the nearest itemscope above it (a nested item's own scope doesn't count)
+    parent = el.parent
+    while parent is not None and not parent.has_attr('itemscope'):
+        parent = parent.parent
+    return _types(parent.get('itemtype')) if parent is not None else set()
+
+
+def extract(soup):
+    """Read JSON-LD, microdata and OpenGraph from a parsed page in one pass.
+
+    Returns (fields, og): fields has 作品名/サークル名/作家名/発売日 as far as schema.org data for the
+    work answers them (None otherwise), JSON-LD first, then microdata. og is {'title': ..., 'type': ..., ...}
+    from the og:* meta tags; it is not mapped onto fields because every store words og:title differently.
+    """
+    scripts = []
+    props = []
+    og = {}
+    for el in soup.descendants:
+        if isinstance(el, NavigableString):
+            continue
+        if el.name == 'script':
+            if (el.get('type') or '').strip().lower() == 'application/ld+json':
+                scripts.append(el)
+        elif el.name == 'meta' and (el.get('property') or '').startswith('og:'):
+            og.setdefault(el['property'][3:], (el.get('content') or '').strip())
+        if el.has_attr('itemprop'):
+            props.append(el)
+
+    info = dict.fromkeys(FIELD_PROPS)
+    _from_json_ld(scripts, info)
+    for el in props:
+        names = el['itemprop'].split() if isinstance(el['itemprop'], str) else el['itemprop']
+        for field, field_props in FIELD_PROPS.items():
+            if info[field] or not any(p in names for p in field_props):
+                continue
+            if not _scope_type(el) & WORK_TYPES:
+                continue
+            info[field] = _microdata_value(el)
+    if info['発売日']:
+        info['発売日'] = format_date(info['発売日'])
+    return info, og
+
@@ -1,55 +1,39 @@
-import requests
-from bs4 import BeautifulSoup
-import re
-import sys
-from urllib.parse import urlparse, parse_qs, urlunparse
+import aio
+import singleflight
+import htmlparse
+import metrics
+import sitespec
 
-def extract_product_info(product_url):
+# --stream のとき、項目ごとに「ここまで読めば取れる」印（parse_product_page が見る要素の閉じタグまで）
+STREAM_MARKERS = {
+    '作品名': r'</title>',
+    'サークル名': r'</title>',
+    '作家名': r'</title>',
+    '発売日': r'<td[^>]*>[^<]*発行日[^<]*</td>.*?</td>',
+    'イベント名': r'<td[^>]*>[^<]*初出イベント[^<]*</td>.*?</td>',
+}
+
+# 商品ページから項目を取る規則（sitespec.py）。作品名・サークル名・作家名は <title>「作品名 [サークル名(作家名)]」から
+SPEC = sitespec.compile_spec([
+    {'tag': 'title', 'pattern': r'^(.*?)\s\[(.*?)\((.*?)\)\].*', 'fields': {'作品名': 1, 'サークル名': 2, '作家名': 3}},
+    {'label': ('td', r'発行日'), 'next': 'td', 'fields': {'発売日': 0}},
+    {'label': ('td', r'初出イベント'), 'next': 'td', 'pattern': r'^\d{4}/\d{2}/\d{2}\s+(.*?)$', 'fields': {'イベント名': 1}},
+])
 
-    # ページを取得
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    response = requests.get(product_url, headers=headers)
+@singleflight.coalesced('extract:toranoana')
+async def extract_product_info_async(product_url):
+
+    # ページを取得（--stream なら必要な項目が揃ったところで読むのをやめる）
+    response = await aio.get(product_url, timeout=10, stop_when=htmlparse.stream_until(STREAM_MARKERS))
     response.raise_for_status()
-    
-    soup = BeautifulSoup(response.content, 'html.parser')
-    
-    # --- 1. 作品名(meta descriptionから) ---
-    title = None
-    circle = None
-    author = None
-
-    pagetitle = soup.find('title').get_text(strip=True)
-    if pagetitle:
-        match = re.search(r'^(.*?)\s\[(.*?)\((.*?)\)\].*', pagetitle)
-        if match:
-            title = match.group(1).strip()
-            circle = match.group(2).strip()
-            author = match.group(3).strip()
-
-    release_date = None
-    # --- 2. 発売日 ---
-    release_td = soup.find('td', string=re.compile(r'発行日'))
-    if release_td:
-        release_date_text = release_td.find_next_sibling('td').get_text(strip=True)
-        if release_date_text:
-            release_date = release_date_text
-
-    # --- 3. イベント名 ---
-    event_name = None
-    event_td = soup.find('td', string=re.compile(r'初出イベント'))  
-    if event_td:
-        event_text = event_td.find_next_sibling('td').get_text(strip=True)
-        if event_text:
-            match = re.search(r'^\d{4}/\d{2}/\d{2}\s+(.*?)$', event_text)
-            if match:
-                event_name = match.group(1).strip()
-
-    return {
-        '作品名': title,
-        'サークル名': circle,
-        '作家名': author,
-        '発売日': release_date,
-        'イベント名': event_name
-    }
+    return parse_product_page(response.content)
+
+
+@metrics.timed('parse', 'toranoana')
+def parse_product_page(content):
+    """Parse a fetched toranoana product page (bytes or str) into the common info dict."""
+    return sitespec.extract(SPEC, content)
+
+
+def extract_product_info(product_url):
+    return aio.run(extract_product_info_async(product_url))